@@ -29,6 +29,8 @@
 
 
 # app/config.py
+from typing import Dict
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from pydantic import Field
 
@@ -65,4 +67,76 @@ class Settings(BaseSettings):
     ETH_CHAIN_ID: int = Field(default=11155111)
     ETH_GAS_LIMIT: int = Field(default=100000)
 
+    # Event ingestion
+    EVENTS_BULK_MAX: int = Field(default=10000)  # events per POST /events/bulk; larger batches get 413
+
+    # Analysis
+    ANALYZE_BATCH_SIZE: int = Field(default=5000)  # events per streamed chunk
+    ANALYZE_FIT_SAMPLE_SIZE: int = Field(default=50000)  # reservoir size for model fit
+    SEGMENT_MIN_SAMPLES: int = Field(default=50)  # smaller segments use heuristic_scores
+    SEGMENT_MAX_WORKERS: int = Field(default=0)  # 0 = one process per core
+    SKETCH_ALPHA: float = Field(default=0.01)  # relative error of score quantile sketches
+    SKETCH_MIN_COUNT: int = Field(default=100)  # scores needed before sketch thresholds are trusted
+
+    # Online detector
+    ANOMALY_DETECTOR: str = Field(default="iforest")  # iforest | hst
+    HST_TREES: int = Field(default=25)
+    HST_DEPTH: int = Field(default=10)
+    HST_WINDOW_SIZE: int = Field(default=250)
+    HST_PERSIST_EVERY: int = Field(default=1000)  # learned events between state saves
+
+    # Beneficiary reuse
+    REUSE_WINDOW_HOURS: int = Field(default=72)
+    REUSE_MIN_NGOS: int = Field(default=2)  # distinct NGOs claiming one beneficiary in the window
+    REUSE_MIN_DONORS: int = Field(default=3)
+    REUSE_CLAIMS_TTL_DAYS: int = Field(default=90)  # beneficiary_claims retention
+
+    # Collusion graph
+    GRAPH_HUB_DEGREE: int = Field(default=200)  # resources shared by more actors are ignored for rings
+    GRAPH_MAX_EDGES: int = Field(default=5_000_000)
+    GRAPH_MIN_RING_NGOS: int = Field(default=2)
+    GRAPH_MIN_RING_ACTORS: int = Field(default=3)
+    GRAPH_MIN_DENSITY: float = Field(default=1.2)  # edges / nodes of the densest part
+
+    # Spatial index
+    GEO_GRID_PRECISION: int = Field(default=6)  # geohash cells of ~1.2 x 0.6 km
+    GEO_WINDOW_HOURS: int = Field(default=168)  # events kept in the in-memory grid
+    GEO_WARM_LIMIT: int = Field(default=50000)
+    GEO_COORD_DECIMALS: int = Field(default=5)  # coordinates equal to ~1 m count as identical
+    GEO_SPOOF_MIN_DEVICES: int = Field(default=3)
+    GEO_SPOOF_WINDOW_MINUTES: int = Field(default=60)
+
+    # Evidence storage
+    EVIDENCE_MAX_MB: int = Field(default=2048)  # uploads larger than this are rejected (413)
+    BLOB_GC_GRACE_HOURS: float = Field(default=24.0)  # unreferenced blobs are deleted after this
+    EVIDENCE_BULK_MAX_FILES: int = Field(default=1000)  # files + archive entries per bulk upload
+    EVIDENCE_BULK_MAX_MB: int = Field(default=8192)  # total (uncompressed) bytes per bulk upload
+    EVIDENCE_BULK_WORKERS: int = Field(default=0)  # spool / hash threads; 0 = cores + 4
+    SCRUB_INTERVAL_HOURS: float = Field(default=24.0)  # background integrity pass; 0 = only on request
+    SCRUB_MAX_MB_PER_S: float = Field(default=50.0)  # read budget of the scrubber; 0 = unlimited
+    SCRUB_WORKERS: int = Field(default=2)  # hashing threads
+    SCRUB_BATCH_SIZE: int = Field(default=256)  # evidence docs per checkpoint
+    # evidence type -> {"cold_after_days", "delete_after_days"} (0 = never); "default" for other types
+    RETENTION_POLICIES: Dict[str, Dict[str, float]] = Field(
+        default={"default": {"cold_after_days": 30, "delete_after_days": 0}}
+    )
+    RETENTION_INTERVAL_HOURS: float = Field(default=24.0)  # background retention pass; 0 = only on request
+    RETENTION_MAX_MB_PER_S: float = Field(default=20.0)  # read budget for compressing cold blobs; 0 = unlimited
+    RETENTION_BATCH_SIZE: int = Field(default=200)  # evidence docs per batch
+    RETENTION_LOG_TTL_DAYS: int = Field(default=90)  # retention_runs expiry (TTL index)
+
+    # Forensics
+    FORENSICS_MAX_WORKERS: int = Field(default=0)  # ELA process pool; 0 = one process per core
+    FORENSICS_BATCH_LIMIT: int = Field(default=1000)  # evidence items per batch request
+    FORENSICS_CACHE_MAX_MB: int = Field(default=1024)  # result cache, LRU-evicted beyond this
+    FORENSICS_CACHE_MAX_ENTRIES: int = Field(default=100000)
+    # ELA / analyze memory budget: decode capped at this size (~3 bytes/px, +3 with the map)
+    FORENSICS_ELA_MAX_MEGAPIXELS: float = Field(default=12.0)
+    FORENSICS_ELA_TILE: int = Field(default=256)  # heatmap tile / re-encode band in px; 0 = whole image
+    FORENSICS_ENGINE_REGION: int = Field(default=64)  # score map cell in px (multiple of 16)
+    FORENSICS_ENGINE_MS_PER_MP: float = Field(default=250.0)  # time budget; later analyses are skipped beyond it
+    PHASH_MAX_DISTANCE: int = Field(default=6)  # dHash bits; near-duplicate threshold
+    EXIF_MAX_DISTANCE_KM: float = Field(default=2.0)  # EXIF GPS vs event gps
+    EXIF_MAX_TIME_DELTA_MINUTES: int = Field(default=180)  # EXIF capture time vs event timestamp
+
 settings = Settings()
@@ -1,9 +1,27 @@
 # app/db/indexes.py
 from motor.motor_asyncio import AsyncIOMotorDatabase
+from app.config import settings
 
 async def ensure_indexes(db: AsyncIOMotorDatabase) -> None:
     await db.users.create_index("email", unique=True)
     await db.events.create_index([("timestamp", 1)])
     await db.events.create_index([("device_id", 1), ("timestamp", 1)])
+    await db.events.create_index([("loc", "2dsphere")])
+    await db.events.create_index([("geohash", 1), ("timestamp", 1)])
     await db.evidence.create_index([("event_id", 1)])
+    await db.evidence.create_index([("phash_chunks", 1)])
+    await db.evidence.create_index([("exif.taken_at", 1)], sparse=True)
+    await db.evidence.create_index([("exif.loc", "2dsphere")])
+    await db.evidence.create_index([("sha256", 1)])
+    await db.evidence.create_index([("ledger_index", 1)], sparse=True)
+    await db.evidence.create_index([("type", 1), ("created_at", 1)])
+    await db.blobs.create_index([("released_at", 1)], sparse=True)
     await db.alerts.create_index([("created_at", 1)])
+    await db.alerts.create_index("alert_key", unique=True, sparse=True)
+    await db.beneficiary_claims.create_index([("beneficiary_id", 1), ("timestamp", 1)])
+    await db.beneficiary_claims.create_index(
+        "timestamp", expireAfterSeconds=settings.REUSE_CLAIMS_TTL_DAYS * 86400
+    )
+    await db.retention_runs.create_index(
+        "started_at", expireAfterSeconds=settings.RETENTION_LOG_TTL_DAYS * 86400
+    )
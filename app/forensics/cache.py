@@ -0,0 +1,173 @@
+# app/forensics/cache.py
+"""
+Content-addressed, size-bounded cache of forensic results.
+
+Entries are keyed by the evidence file's sha256 plus the algorithm name,
+version and parameters, so byte-identical uploads share one result and a
+new algorithm version or parameter set never returns a stale one.
+
+On disk, under <root>/<key[:2]>/:
+    <key>.json   result dict + metadata
+    <key>.<ext>  optional artifact (e.g. the ELA map PNG)
+
+An in-memory OrderedDict of entry metadata (LRU order) is rebuilt from the
+files' mtimes on start, so recency survives restarts (hits refresh the
+mtime). Eviction drops least recently used entries once max_bytes or
+max_entries is exceeded. Other workers sharing the directory evict too, so
+a hit whose files are gone is dropped and counted as a miss.
+
+Not thread-safe: call it from one thread (the event loop); the expensive
+work can run elsewhere and hand over its artifact via put(). Construction
+reads every entry's metadata file, so build the cache in a worker thread
+(forensics_service.get_cache does, at startup).
+
+Intended usage:
+    from app.forensics.cache import ResultCache, cache_key
+
+    cache = ResultCache(root, max_bytes=1 << 30)
+    key = cache_key(sha256, "ela", "2", {"quality": 90})
+    entry = cache.get(key) or cache.put(key, result, artifact=tmp_png)
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+
+def cache_key(file_sha256: str, algo: str, version: str, params: Optional[Dict[str, Any]] = None) -> str:
+    spec = json.dumps([file_sha256, algo, version, params or {}], sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(spec.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    def __init__(self, root: str, max_bytes: int = 1 << 30, max_entries: int = 100_000) -> None:
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes = 0
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        os.makedirs(root, exist_ok=True)
+        self._scan()
+
+    # ---- paths ----
+
+    def _dir(self, key: str) -> str:
+        return os.path.join(self.root, key[:2])
+
+    def _meta_path(self, key: str) -> str:
+        return os.path.join(self._dir(key), f"{key}.json")
+
+    def tmp_path(self, key: str, ext: str) -> str:
+        """Scratch path in the cache's filesystem, so put() can rename it into place."""
+        os.makedirs(self._dir(key), exist_ok=True)
+        return os.path.join(self._dir(key), f".{key}.{os.getpid()}.{time.monotonic_ns()}{ext}")
+
+    # ---- index ----
+
+    def _scan(self) -> None:
+        found = []
+        for sub in os.scandir(self.root):
+            if not sub.is_dir():
+                continue
+            for f in os.scandir(sub.path):
+                if f.name.startswith("."):
+                    # scratch files left by an interrupted run (not ones another worker is writing)
+                    if time.time() - f.stat().st_mtime > 3600:
+                        os.remove(f.path)
+                    continue
+                if not f.name.endswith(".json"):
+                    continue
+                try:
+                    with open(f.path, "r", encoding="utf-8") as fh:
+                        entry = json.load(fh)
+                    found.append((f.stat().st_mtime, entry))
+                except (OSError, ValueError) as e:
+                    print(f"[forensic-cache] non-fatal: dropping {f.name}: {e}")
+                    os.remove(f.path)
+        for _, entry in sorted(found, key=lambda t: t[0]):
+            self._entries[entry["key"]] = entry
+            self.bytes += entry["bytes"]
+        self._evict()
+
+    def _evict(self) -> None:
+        while self._entries and (self.bytes > self.max_bytes or len(self._entries) > self.max_entries):
+            self._drop(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _drop(self, key: str) -> None:
+        entry = self._entries.pop(key)
+        self.bytes -= entry["bytes"]
+        for p in (self._meta_path(key), entry.get("artifact")):
+            if p and os.path.exists(p):
+                os.remove(p)
+
+    # ---- public ----
+
+    def get(self, key: str, need_artifact: bool = False) -> Optional[Dict[str, Any]]:
+        """Entry {key, result, artifact, bytes, created_at} or None; counts a hit or miss."""
+        entry = self._entries.get(key)
+        if entry is not None and need_artifact and not entry.get("artifact"):
+            entry = None
+        if entry is not None:
+            try:
+                os.utime(self._meta_path(key))
+                if entry.get("artifact"):
+                    os.stat(entry["artifact"])
+            except FileNotFoundError:
+                # removed by another worker's eviction (or by hand)
+                self._drop(key)
+                entry = None
+            except OSError:
+                pass
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key: str, result: Dict[str, Any], artifact: Optional[str] = None) -> Dict[str, Any]:
+        """Store a result; `artifact` (e.g. from tmp_path) is moved into the cache."""
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.bytes -= old["bytes"]
+        os.makedirs(self._dir(key), exist_ok=True)
+        entry: Dict[str, Any] = {"key": key, "result": result, "artifact": None, "bytes": 0, "created_at": time.time()}
+        if artifact:
+            dest = os.path.join(self._dir(key), key + os.path.splitext(artifact)[1])
+            os.replace(artifact, dest)
+            entry["artifact"] = dest
+            entry["bytes"] = os.path.getsize(dest)
+        elif old is not None and old.get("artifact"):
+            # re-run without the artifact keeps the one already stored
+            entry["artifact"] = old["artifact"]
+            entry["bytes"] = old["bytes"]
+        entry["bytes"] += len(json.dumps(entry))  # metadata file, near enough
+        tmp = self.tmp_path(key, ".json")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(entry, f)
+        os.replace(tmp, self._meta_path(key))
+        self._entries[key] = entry
+        self.bytes += entry["bytes"]
+        self._evict()
+        return entry
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+        }
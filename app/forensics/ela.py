@@ -1,27 +1,159 @@
 # app/forensics/ela.py
-from PIL import Image, ImageChops, ImageEnhance
-import numpy as np
+"""
+Error Level Analysis (ELA) - quick visual tamper suspicion.
+
+The image is re-encoded as JPEG into an in-memory buffer (no temp file, so
+concurrent runs on the same evidence don't collide), then compared with
+the original strip by strip in uint8: |a - b| is max(a, b) - min(a, b),
+which can't overflow. Only one strip of difference data exists at a time
+unless the ELA map is requested, in which case it is written into a single
+preallocated uint8 buffer and brightened in place through uint16.
+
+suspicion = mean(diff) / max(1, max(diff)), i.e. the mean of the ELA map
+brightened so its largest difference maps to 255 (same value as the old
+PIL Brightness-based implementation, without the float32 copy).
+
+Large images (bounded memory):
+  - max_pixels caps the decoded size. JPEGs are reduced while decoding
+    (Image.draft, DCT scaling by 1/2, 1/4 or 1/8), so a 48 MP photo never
+    exists at full size; other formats are decoded and then reduced.
+  - tile > 0 re-encodes bands of `tile` rows instead of the whole image,
+    so besides the decoded image only one band of each buffer is alive
+    (~3 bytes per pixel, +3 with the map). Tiles are multiples of 16 px,
+    aligned to JPEG MCUs, so a band encodes like the same rows of the whole
+    image. Each tile's mean difference, on the suspicion scale, goes into
+    a rows x cols heatmap that localises tampered regions.
+"""
+
+import io
+import math
 import os
+from typing import Any, Dict, Optional, Union
+
+import numpy as np
+from PIL import Image
+
+# bump when output changes, so cached results (app/forensics/cache.py) are not reused
+ELA_VERSION = "3"
+STRIP_ROWS = 256
+
+
+def open_rgb(src: Union[str, bytes, Image.Image], max_pixels: Optional[int] = None) -> tuple:
+    """(RGB image, scale); scale < 1 when reduced to fit max_pixels."""
+    if isinstance(src, Image.Image):
+        img = src
+    elif isinstance(src, (bytes, bytearray)):
+        img = Image.open(io.BytesIO(src))
+    else:
+        img = Image.open(src)
+    w0 = img.size[0]
+    over = bool(max_pixels) and img.size[0] * img.size[1] > max_pixels
+    if over and img.format == "JPEG":
+        # smallest DCT scale that fits; draft picks the largest scale >= the requested size
+        s = min(8, 1 << math.ceil(math.log2(math.sqrt(img.size[0] * img.size[1] / max_pixels))))
+        img.draft("RGB", (math.ceil(img.size[0] / s), math.ceil(img.size[1] / s)))
+    img = img if img.mode == "RGB" else img.convert("RGB")
+    if over and img.size[0] * img.size[1] > max_pixels:
+        img = img.reduce(math.ceil(math.sqrt(img.size[0] * img.size[1] / max_pixels)))
+    return img, img.size[0] / w0
+
+
+def _resave(img: Image.Image, quality: int) -> Image.Image:
+    buf = io.BytesIO()
+    img.save(buf, "JPEG", quality=quality)
+    buf.seek(0)
+    resaved = Image.open(buf)
+    resaved.load()
+    return resaved if resaved.mode == "RGB" else resaved.convert("RGB")
+
+
+def compute_ela(
+    src: Union[str, bytes, Image.Image],
+    quality: int = 90,
+    out_path: Optional[str] = None,
+    strip_rows: int = STRIP_ROWS,
+    max_pixels: Optional[int] = None,
+    tile: int = 0,
+) -> Dict[str, Any]:
+    """
+    ELA of an image path, raw bytes or PIL image.
+
+    Returns {"suspicion", "mean_diff", "max_diff", "width", "height", "scale",
+    "heatmap", "ela_path"}; width/height are the analysed (possibly reduced)
+    size, heatmap is None unless tile > 0, and ela_path is None unless
+    out_path is given (the brightened map is then saved there as PNG).
+    """
+    img, scale = open_rgb(src, max_pixels)
+    w, h = img.size
+    tile = max(16, tile // 16 * 16) if tile else 0
+    if tile:
+        # re-encode band by band; the whole image is never re-encoded at once
+        step, resaved = tile, None
+        cols = list(range(0, w, tile))
+        tile_sums = np.zeros((math.ceil(h / tile), len(cols)), dtype=np.uint64)
+        tile_px = np.zeros_like(tile_sums)
+    else:
+        step, resaved = strip_rows, _resave(img, quality)
+
+    ela_map = np.empty((h, w, 3), dtype=np.uint8) if out_path else None
+    total = 0
+    max_diff = 0
+    for top in range(0, h, step):
+        box = (0, top, w, min(h, top + step))
+        band = img.crop(box)
+        a = np.asarray(band)
+        b = np.asarray(_resave(band, quality) if tile else resaved.crop(box))
+        d = np.maximum(a, b)
+        d -= np.minimum(a, b)
+        total += int(d.sum(dtype=np.uint64))
+        max_diff = max(max_diff, int(d.max(initial=0)))
+        if tile:
+            r = top // tile
+            col_sums = d.sum(axis=(0, 2), dtype=np.uint64)
+            tile_sums[r] = np.add.reduceat(col_sums, cols)
+            tile_px[r] = np.diff(cols + [w]) * d.shape[0] * 3
+        if ela_map is not None:
+            ela_map[box[1] : box[3]] = d
+    del resaved
+
+    n = w * h * 3
+    mean_diff = total / n if n else 0.0
+    suspicion = mean_diff / max(1, max_diff)
+    heatmap = None
+    if tile:
+        heatmap = np.round(tile_sums / np.maximum(tile_px, 1) / max(1, max_diff), 4).tolist()
+
+    ela_path = None
+    if ela_map is not None:
+        m = max(1, max_diff)
+        for top in range(0, h, strip_rows):
+            rows = ela_map[top : top + strip_rows]
+            # round(d * 255 / m) in integers; 255 * 255 fits in uint16
+            wide = rows.astype(np.uint16)
+            wide *= 255
+            wide += m // 2
+            wide //= m
+            rows[...] = wide
+        os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+        Image.fromarray(ela_map, "RGB").save(out_path)
+        ela_path = out_path
+
+    return {
+        "suspicion": float(suspicion),
+        "mean_diff": float(mean_diff),
+        "max_diff": int(max_diff),
+        "width": w,
+        "height": h,
+        "scale": float(scale),
+        "heatmap": heatmap,
+        "ela_path": ela_path,
+    }
+
 
-def save_ela(input_path: str, out_path: str, quality: int = 90):
+def save_ela(input_path: str, out_path: Optional[str], quality: int = 90):
     """
     Error Level Analysis (ELA) - quick visual tamper suspicion.
+    Returns (out_path or None, suspicion).
     """
-    img = Image.open(input_path).convert("RGB")
-    tmp_path = input_path + ".tmp.jpg"
-    img.save(tmp_path, "JPEG", quality=quality)
-    resaved = Image.open(tmp_path)
-    ela = ImageChops.difference(img, resaved)
-    extrema = ela.getextrema()
-    max_diff = max([ex[1] for ex in extrema])
-    scale = 255.0 / max(1, max_diff)
-    ela = ImageEnhance.Brightness(ela).enhance(scale)
-    os.makedirs(os.path.dirname(out_path), exist_ok=True)
-    ela.save(out_path)
-    arr = np.array(ela).astype(np.float32) / 255.0
-    suspicion = float(arr.mean())
-    try:
-        os.remove(tmp_path)
-    except OSError:
-        pass
-    return out_path, suspicion
+    res = compute_ela(input_path, quality=quality, out_path=out_path)
+    return res["ela_path"], res["suspicion"]
@@ -0,0 +1,100 @@
+# app/forensics/exif.py
+"""
+Header-only EXIF extraction.
+
+Image.open() only parses the file header; getexif() / get_ifd() read the
+TIFF/EXIF directories from it, so no pixel data is decoded and the cost is
+independent of resolution (well under a millisecond for a phone photo).
+
+Extracted (when present):
+    taken_at   DateTimeOriginal (falls back to DateTime), converted to UTC
+               when OffsetTimeOriginal is set; tz_known tells which
+    gps        {"lat", "lon"} from the GPS IFD, in signed decimal degrees
+    make, model, software
+
+Intended usage:
+    from app.forensics.exif import read_exif
+
+    meta = read_exif(image_bytes)   # {} for non-images or no EXIF
+"""
+
+from __future__ import annotations
+
+import io
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Union
+
+from PIL import Image
+
+_GPS_IFD = 0x8825
+_EXIF_IFD = 0x8769
+_MAKE, _MODEL, _SOFTWARE, _DATETIME = 0x010F, 0x0110, 0x0131, 0x0132
+_DATETIME_ORIGINAL, _OFFSET_TIME_ORIGINAL = 0x9003, 0x9011
+
+
+def _text(v: Any) -> Optional[str]:
+    if isinstance(v, bytes):
+        v = v.decode("utf-8", "replace")
+    if not isinstance(v, str):
+        return None
+    v = v.strip("\x00 ").strip()
+    return v or None
+
+
+def _degrees(dms: Any, ref: Any) -> Optional[float]:
+    try:
+        d, m, s = (float(x) for x in dms)
+    except (TypeError, ValueError, ZeroDivisionError):
+        return None
+    val = d + m / 60.0 + s / 3600.0
+    return -val if _text(ref) in ("S", "W") else val
+
+
+def _parse_time(raw: Any, offset: Any) -> tuple:
+    """(datetime or None, tz_known); aware offsets are folded into naive UTC."""
+    s = _text(raw)
+    if not s:
+        return None, False
+    try:
+        dt = datetime.strptime(s[:19], "%Y:%m:%d %H:%M:%S")
+    except ValueError:
+        return None, False
+    off = _text(offset)
+    if off and len(off) >= 6 and off[0] in "+-":
+        try:
+            delta = timedelta(hours=int(off[1:3]), minutes=int(off[4:6]))
+        except ValueError:
+            return dt, False
+        return (dt - delta if off[0] == "+" else dt + delta), True
+    return dt, False
+
+
+def read_exif(src: Union[str, bytes]) -> Dict[str, Any]:
+    """EXIF fields of an image path or raw bytes, without decoding pixels."""
+    try:
+        with Image.open(io.BytesIO(src) if isinstance(src, (bytes, bytearray)) else src) as img:
+            exif = img.getexif()
+            if not exif:
+                return {}
+            gps_ifd = exif.get_ifd(_GPS_IFD)
+            exif_ifd = exif.get_ifd(_EXIF_IFD)
+    except Exception:
+        return {}
+
+    out: Dict[str, Any] = {}
+    taken_at, tz_known = _parse_time(
+        exif_ifd.get(_DATETIME_ORIGINAL) or exif.get(_DATETIME), exif_ifd.get(_OFFSET_TIME_ORIGINAL)
+    )
+    if taken_at is not None:
+        out["taken_at"] = taken_at
+        out["tz_known"] = tz_known
+    lat = _degrees(gps_ifd.get(2), gps_ifd.get(1))
+    lon = _degrees(gps_ifd.get(4), gps_ifd.get(3))
+    # (0, 0) is what many cameras write without a fix
+    if lat is not None and lon is not None and -90 <= lat <= 90 and -180 <= lon <= 180 and (lat, lon) != (0.0, 0.0):
+        out["gps"] = {"lat": lat, "lon": lon}
+    for key, tag in (("make", _MAKE), ("model", _MODEL), ("software", _SOFTWARE)):
+        v = _text(exif.get(tag))
+        if v:
+            out[key] = v
+    return out
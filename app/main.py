@@ -34,15 +34,18 @@
 #     await ensure_indexes(db)
 
 # app/main.py  (only the imports and include_router lines change)
+import asyncio
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.config import settings
 from app.db.mongo import get_client
 from app.db.indexes import ensure_indexes
 
-from app.routers import health, auth, events, evidence, analyze, forensics, nlp, events_ledger
+from app.routers import health, auth, events, evidence, analyze, forensics, nlp, events_ledger, geo
 
 from app.routers import blockchain  # <-- NEW
+from app.services import forensics_service, geo_service, online_service, retention_service, scrub_service
 
 app = FastAPI(title=settings.APP_NAME)
 
@@ -63,8 +66,32 @@ app.include_router(forensics.router)
 app.include_router(nlp.router)
 app.include_router(blockchain.router)  # <-- NEW
 app.include_router(events_ledger.router)
+app.include_router(geo.router)
 
 @app.on_event("startup")
 async def on_startup():
     db = get_client()[settings.MONGO_DB]
     await ensure_indexes(db)
+    # index the forensic result cache off the event loop before requests need it
+    await forensics_service.get_cache()
+    # the online detector lives in one process; fails startup of a second worker
+    if online_service.enabled():
+        await online_service.claim(db)
+    # every worker runs the loop; the "scrub" lease lets one of them scrub per round
+    if settings.SCRUB_INTERVAL_HOURS > 0:
+        app.state.scrubber = asyncio.create_task(scrub_service.run_scrubber(db))
+    # likewise the "retention" lease for the retention loop
+    if settings.RETENTION_INTERVAL_HOURS > 0:
+        app.state.retention = asyncio.create_task(retention_service.run_retention(db))
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    # persist online detector state learned since the last periodic save
+    online_service.save_detector()
+    await online_service.release()
+    geo_service.save_grid()
+    forensics_service.shutdown_pool()
+    for name in ("scrubber", "retention"):
+        task = getattr(app.state, name, None)
+        if task is not None:
+            task.cancel()
@@ -22,18 +22,20 @@ Notes
     score >= p97 -> 2
     else        -> 0 (not returned)
 - Reasons are basic, rule-based complements to the model score and are
-  derived from the current demo feature set.
+  derived from the current demo feature set, plus the cross-event
+  `beneficiary_reuse` signal from app.ml.reuse.
 
 Dependencies: scikit-learn, numpy
 """
 
 from __future__ import annotations
 
-from typing import Any, Dict, Iterable, List, Sequence, Tuple
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
 
 import numpy as np
 from sklearn.ensemble import IsolationForest
 
+from app.ml.reuse import reuse_reasons_for_events
 from app.utils.features import build_features
 
 
@@ -46,6 +48,7 @@ def train_iforest(
     X: Sequence[Sequence[float]],
     contamination: float = 0.03,
     random_state: int = 42,
+    n_jobs: int = -1,
 ) -> IsolationForest:
     """
     Fit an IsolationForest model on X.
@@ -57,6 +60,8 @@ def train_iforest(
         Proportion of outliers in the data set.
     random_state : int
         RNG seed for reproducibility.
+    n_jobs : int
+        sklearn worker count; use 1 when fitting inside a process pool.
 
     Returns
     -------
@@ -68,7 +73,7 @@ def train_iforest(
         random_state=random_state,
         n_estimators=200,
         max_samples="auto",
-        n_jobs=-1,
+        n_jobs=n_jobs,
     )
     model.fit(X)
     return model
@@ -100,22 +105,33 @@ def derive_reasons_from_features(
     feat: Sequence[float],
     qty_surge_threshold: float = 240.0,
     jump_impossible_km: float = 500.0,
+    max_speed_kmh: float = 900.0,
+    min_jump_km: float = 1.0,
 ) -> List[str]:
     """
-    Map the current 4D feature vector to human-readable reasons.
+    Map a feature vector to human-readable reasons.
 
     Expected feature order (per app.utils.features.build_features):
-        [quantity, hour, gps_jump_km, unique_beneficiaries]
+        [quantity, hour, gps_jump_km, unique_beneficiaries, speed_kmh]
+
+    impossible_route fires when the implied speed from the device's previous
+    fix exceeds `max_speed_kmh` (jumps under `min_jump_km` are treated as GPS
+    jitter). Legacy 4D vectors without speed fall back to the raw
+    `jump_impossible_km` distance rule.
     """
     reasons: List[str] = []
     try:
-        qty, hour, jump, uniq_b = feat
+        qty, hour, jump, uniq_b = feat[:4]
     except Exception:
         return reasons
+    speed = feat[4] if len(feat) > 4 else None
 
     if float(qty) > qty_surge_threshold:
         reasons.append("surge_volume")
-    if float(jump) > jump_impossible_km:
+    if speed is not None:
+        if float(jump) >= min_jump_km and float(speed) > max_speed_kmh:
+            reasons.append("impossible_route")
+    elif float(jump) > jump_impossible_km:
         reasons.append("impossible_route")
     # Optional: low unique beneficiaries with high quantity
     if float(qty) >= 150.0 and float(uniq_b) <= 1.0:
@@ -186,8 +202,8 @@ def analyze_events(
     if not events_list:
         return []
 
-    X, meta = build_features(events_list)  # X: List[List[float]], meta: List[event_id]
-    if not X or not meta:
+    X, meta = build_features(events_list)  # X: ndarray (n, 5), meta: List[event_id]
+    if len(X) == 0 or not meta:
         return []
 
     # Choose model or heuristic based on data volume
@@ -201,6 +217,28 @@ def analyze_events(
     thr97 = threshold_by_percentile(scores, p97)
     thr99 = threshold_by_percentile(scores, p99)
 
+    # Cross-event signal: same beneficiaries claimed by several NGOs/donors
+    extra = reuse_reasons_for_events(events_list)
+
+    return alerts_from_scores(meta, X, scores, thr97, thr99, extra_reasons=extra)
+
+
+def alerts_from_scores(
+    meta: Sequence[Any],
+    X: Sequence[Sequence[float]],
+    scores: np.ndarray,
+    thr97: float,
+    thr99: float,
+    extra_reasons: Optional[Dict[Any, List[str]]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Turn already-computed scores into alert candidates.
+
+    Split out of analyze_events() so callers that score in chunks against
+    fixed thresholds (e.g. streaming window analysis) share the same
+    severity and reason logic. `extra_reasons` maps event_id to reasons
+    found outside the feature vector (e.g. beneficiary_reuse).
+    """
     alerts: List[Dict[str, Any]] = []
     for eid, s, feat in zip(meta, scores, X):
         sev = 0
@@ -210,6 +248,8 @@ def analyze_events(
             sev = 2
 
         reasons = derive_reasons_from_features(feat)
+        if extra_reasons:
+            reasons += extra_reasons.get(eid, [])
         # escalate severity if strong reasons exist
         if "impossible_route" in reasons:
             sev = max(sev, 3)
@@ -227,3 +267,52 @@ def analyze_events(
             )
 
     return alerts
+
+
+# ------------------------------
+# Online detector variant
+# ------------------------------
+
+
+def analyze_events_online(
+    events: Iterable[Dict[str, Any]],
+    detector: Any,
+    dev_last: Optional[Dict[str, tuple]] = None,
+    thresholds: Optional[Tuple[float, float]] = None,
+    extra_reasons: Optional[Dict[Any, List[str]]] = None,
+    learn: bool = True,
+    p97: float = 97.0,
+    p99: float = 99.0,
+) -> Tuple[List[Dict[str, Any]], np.ndarray]:
+    """
+    Same output contract as analyze_events(), scored by a streaming detector
+    (e.g. app.ml.hstree.HalfSpaceTrees) instead of a refitted IsolationForest.
+
+    Parameters
+    ----------
+    detector : object with score(X) and learn_score(X)
+        Must already be primed.
+    dev_last : dict, optional
+        Per-device carry-over passed to build_features().
+    thresholds : (thr97, thr99), optional
+        Stable thresholds (e.g. from a score sketch); batch percentiles otherwise.
+    extra_reasons : dict, optional
+        event_id -> extra reason codes, passed to alerts_from_scores().
+    learn : bool
+        Update the detector with these events (only once per event).
+
+    Returns
+    -------
+    (alerts, scores)
+        scores are returned so callers can feed them to a threshold sketch.
+    """
+    events_list = list(events)
+    if not events_list:
+        return [], np.array([], dtype=float)
+    X, meta = build_features(events_list, dev_last)
+    if len(X) == 0:
+        return [], np.array([], dtype=float)
+    scores = detector.learn_score(X) if learn else detector.score(X)
+    if thresholds is None:
+        thresholds = (threshold_by_percentile(scores, p97), threshold_by_percentile(scores, p99))
+    return alerts_from_scores(meta, X, scores, *thresholds, extra_reasons=extra_reasons), scores
@@ -0,0 +1,224 @@
+# app/ml/columnar.py
+"""
+Append-only columnar snapshot of events for analytics.
+
+One raw little-endian file per column (<dir>/<name>.bin) plus meta.json
+holding the row count, the (timestamp, _id) watermark and the string
+dictionaries for device / NGO / donor codes. Dictionary entries are
+str(value), "None" for a missing value, the same keys group_rows() and the
+scoring paths use for segments. Columns are opened with
+np.memmap, so feature building and training read pages straight from the
+OS cache with no BSON decoding or per-event dicts.
+
+Raw files rather than .npy: appending is a plain write at the end, with no
+header to rewrite. Rows are only appended in (timestamp, _id) order, and
+meta.json is replaced atomically after the data is flushed, so a crash
+mid-append leaves a tail that open() truncates away.
+
+Intended usage:
+    from app.ml.columnar import ColumnStore
+
+    store = ColumnStore(path)
+    store.append(events_sorted_by_timestamp_then_id)
+    lo, hi = store.range(start, end)
+    X, ids = store.features(lo, hi)
+"""
+
+from __future__ import annotations
+
+import json
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.utils.trajectory import epoch_seconds, implied_speeds
+
+COLUMNS: Dict[str, str] = {
+    "ts": "<f8",        # epoch seconds (UTC)
+    "hour": "u1",
+    "lat": "<f8",
+    "lon": "<f8",
+    "quantity": "<f8",
+    "n_benef": "<u4",   # unique beneficiaries
+    "device": "<i4",    # codes into meta["dicts"][...]
+    "ngo": "<i4",
+    "donor": "<i4",
+    "event_id": "S24",  # ObjectId hex
+}
+DICT_FIELDS = {"device": "device_id", "ngo": "ngo_id", "donor": "donor_id"}
+
+
+class ColumnStore:
+    def __init__(self, path: str, recover: bool = True) -> None:
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.reload(recover)
+
+    def reload(self, recover: bool = True) -> None:
+        """
+        (Re-)read meta.json, which another process may have advanced. recover
+        also upgrades old dictionaries and truncates uncommitted tails, so only
+        the process allowed to append may pass it.
+        """
+        self.meta = self._read_meta()
+        if recover:
+            self._upgrade_dicts()
+        self._lookup = {k: {v: i for i, v in enumerate(vals)} for k, vals in self.meta["dicts"].items()}
+        if recover:
+            self._truncate_tails()
+
+    # ---- metadata ----
+
+    def _meta_path(self) -> str:
+        return os.path.join(self.path, "meta.json")
+
+    def _col_path(self, name: str) -> str:
+        return os.path.join(self.path, f"{name}.bin")
+
+    def _read_meta(self) -> Dict[str, Any]:
+        try:
+            with open(self._meta_path(), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"count": 0, "watermark": None, "dicts": {k: [] for k in DICT_FIELDS}, "null_key": "None"}
+
+    def _upgrade_dicts(self) -> None:
+        # snapshots written before null_key coded a missing value as ""
+        if self.meta.get("null_key") == "None":
+            return
+        for vals in self.meta["dicts"].values():
+            if "" in vals and "None" not in vals:
+                vals[vals.index("")] = "None"
+        self.meta["null_key"] = "None"
+        self._write_meta()
+
+    def _write_meta(self) -> None:
+        tmp = self._meta_path() + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.meta, f)
+        os.replace(tmp, self._meta_path())
+
+    def _truncate_tails(self) -> None:
+        # drop bytes written after the last committed meta.json
+        for name, dt in COLUMNS.items():
+            p = self._col_path(name)
+            size = self.count * np.dtype(dt).itemsize
+            if os.path.exists(p) and os.path.getsize(p) > size:
+                with open(p, "r+b") as f:
+                    f.truncate(size)
+
+    @property
+    def count(self) -> int:
+        return int(self.meta["count"])
+
+    @property
+    def watermark(self) -> Optional[Tuple[float, str]]:
+        wm = self.meta.get("watermark")
+        return (wm["ts"], wm["id"]) if wm else None
+
+    def names(self, field: str) -> List[str]:
+        """Dictionary of a coded column ("device", "ngo", "donor"): code -> id."""
+        return self.meta["dicts"][field]
+
+    def reset(self) -> None:
+        for name in COLUMNS:
+            p = self._col_path(name)
+            if os.path.exists(p):
+                os.remove(p)
+        self.meta = {"count": 0, "watermark": None, "dicts": {k: [] for k in DICT_FIELDS}, "null_key": "None"}
+        self._lookup = {k: {} for k in DICT_FIELDS}
+        self._write_meta()
+
+    # ---- writing ----
+
+    def _code(self, field: str, value: Any) -> int:
+        lookup = self._lookup[field]
+        key = str(value)  # None -> "None", as str(ev.get(by)) when scoring
+        i = lookup.get(key)
+        if i is None:
+            i = lookup[key] = len(lookup)
+            self.meta["dicts"][field].append(key)
+        return i
+
+    def append(self, events: List[Dict[str, Any]]) -> int:
+        """Append events already sorted by (timestamp, _id); returns rows written."""
+        n = len(events)
+        if not n:
+            return 0
+        ts = [ev["timestamp"] for ev in events]
+        ids = [str(ev["_id"]) for ev in events]
+        if any(len(i) > 24 for i in ids):
+            raise ValueError("ColumnStore stores ObjectId hex ids (<= 24 chars)")
+        cols = {
+            "ts": np.fromiter((epoch_seconds(t) for t in ts), dtype=COLUMNS["ts"], count=n),
+            "hour": np.fromiter((t.hour for t in ts), dtype=COLUMNS["hour"], count=n),
+            "lat": np.fromiter((ev["gps"]["lat"] for ev in events), dtype=COLUMNS["lat"], count=n),
+            "lon": np.fromiter((ev["gps"]["lon"] for ev in events), dtype=COLUMNS["lon"], count=n),
+            "quantity": np.fromiter((ev["quantity"] for ev in events), dtype=COLUMNS["quantity"], count=n),
+            "n_benef": np.fromiter(
+                (len(set(ev.get("beneficiary_ids") or [])) for ev in events), dtype=COLUMNS["n_benef"], count=n
+            ),
+            "event_id": np.array(ids, dtype=COLUMNS["event_id"]),
+        }
+        for col, field in DICT_FIELDS.items():
+            cols[col] = np.fromiter((self._code(col, ev.get(field)) for ev in events), dtype=COLUMNS[col], count=n)
+
+        for name, arr in cols.items():
+            with open(self._col_path(name), "ab") as f:
+                arr.tofile(f)
+                f.flush()
+                os.fsync(f.fileno())
+        self.meta["count"] = self.count + n
+        # exact timestamp kept as ISO too: float seconds don't round-trip to datetimes
+        self.meta["watermark"] = {"ts": float(cols["ts"][-1]), "iso": ts[-1].isoformat(), "id": ids[-1]}
+        self._write_meta()
+        return n
+
+    # ---- reading ----
+
+    def column(self, name: str) -> np.ndarray:
+        """Read-only memmap of a column (an empty array before the first append)."""
+        if self.count == 0:
+            return np.empty(0, dtype=COLUMNS[name])
+        return np.memmap(self._col_path(name), dtype=COLUMNS[name], mode="r", shape=(self.count,))
+
+    def range(self, start: Any = None, end: Any = None) -> Tuple[int, int]:
+        """Row bounds [lo, hi) of events with start <= timestamp < end."""
+        ts = self.column("ts")
+        lo = int(np.searchsorted(ts, epoch_seconds(start), side="left")) if start is not None else 0
+        hi = int(np.searchsorted(ts, epoch_seconds(end), side="left")) if end is not None else len(ts)
+        return lo, max(lo, hi)
+
+    def last_fixes(self, before: int) -> Dict[int, Tuple[float, float, float]]:
+        """device code -> (ts, lat, lon) of its last row before row `before`."""
+        if before <= 0:
+            return {}
+        dev = np.asarray(self.column("device")[:before])
+        rev = dev[::-1]
+        codes, first = np.unique(rev, return_index=True)
+        rows = before - 1 - first
+        ts, lat, lon = self.column("ts"), self.column("lat"), self.column("lon")
+        return {int(c): (float(ts[r]), float(lat[r]), float(lon[r])) for c, r in zip(codes, rows)}
+
+    def features(
+        self, lo: int = 0, hi: Optional[int] = None, dev_last: Optional[Dict[int, tuple]] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Same feature rows as build_features() for rows [lo, hi):
+          [quantity, hour, gps_jump_km, unique_beneficiaries, speed_kmh]
+        Pass dev_last (keyed by device code) to chain chunks; by default the
+        carry is seeded from the rows before `lo`.
+        """
+        hi = self.count if hi is None else min(hi, self.count)
+        if hi <= lo:
+            return np.empty((0, 5), dtype=float), np.empty(0, dtype=COLUMNS["event_id"])
+        if dev_last is None:
+            dev_last = self.last_fixes(lo)
+        sl = slice(lo, hi)
+        ts, lat, lon = self.column("ts")[sl], self.column("lat")[sl], self.column("lon")[sl]
+        jump, _, speed = implied_speeds(self.column("device")[sl], ts, lat, lon, dev_last)
+        X = np.column_stack(
+            [self.column("quantity")[sl], self.column("hour")[sl], jump, self.column("n_benef")[sl], speed]
+        ).astype(float, copy=False)
+        return X, self.column("event_id")[sl]
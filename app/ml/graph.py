@@ -0,0 +1,311 @@
+# app/ml/graph.py
+"""
+Collusion-ring detection over a sparse actor/resource graph.
+
+Events are folded into a bipartite graph:
+    actors    = donors and NGOs          ("donor:<id>", "ngo:<id>")
+    resources = devices, IPs and beneficiaries ("device:<id>", "ip:<ip>", "ben:<id>")
+with one edge per (actor, resource) pair weighted by how many events used it.
+A ring is a group of actors tied together through shared resources.
+
+Storage is three flat arrays (actor, resource, weight) coalesced with
+scipy.sparse, i.e. ~12 bytes per distinct edge. Adding events only appends
+their pairs; duplicates are summed when the pending buffer is merged (once
+it holds pending_limit pairs, and before any analysis or save), so a
+refresh costs O(new events + distinct edges) rather than a rebuild.
+
+Analyses:
+  - components():    connected components (scipy csgraph) with hub resources
+                     (more than `hub_degree` actors, e.g. a shared office IP)
+                     left out so they don't glue the whole graph together;
+  - densest():       greedy peeling (Charikar) -> 2-approximate densest
+                     subgraph of a component, density = edges / nodes;
+  - shared_devices(): devices used by several NGOs.
+
+Intended usage:
+    from app.ml.graph import EntityGraph
+
+    g = EntityGraph()
+    touched = g.add_events(events)
+    rings = g.rings(touched)
+"""
+
+from __future__ import annotations
+
+import heapq
+import os
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+from scipy.sparse import coo_matrix, csr_matrix
+from scipy.sparse.csgraph import connected_components
+
+RESOURCE_FIELDS = (("device_id", "device"), ("ip", "ip"))
+
+
+def _actor_keys(ev: Dict[str, Any]) -> List[str]:
+    out = []
+    if ev.get("donor_id") is not None:
+        out.append(f"donor:{ev['donor_id']}")
+    if ev.get("ngo_id") is not None:
+        out.append(f"ngo:{ev['ngo_id']}")
+    return out
+
+
+def _resource_keys(ev: Dict[str, Any]) -> List[str]:
+    out = [f"{prefix}:{ev[field]}" for field, prefix in RESOURCE_FIELDS if ev.get(field)]
+    out.extend(f"ben:{b}" for b in set(ev.get("beneficiary_ids") or []))
+    return out
+
+
+class _Names:
+    """Append-only string <-> int id mapping."""
+
+    def __init__(self, names: Optional[Iterable[str]] = None) -> None:
+        self.names: List[str] = list(names or [])
+        self.ids: Dict[str, int] = {n: i for i, n in enumerate(self.names)}
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def get(self, name: str) -> int:
+        i = self.ids.get(name)
+        if i is None:
+            i = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return i
+
+
+class EntityGraph:
+    def __init__(self, hub_degree: int = 200, max_edges: int = 5_000_000, pending_limit: int = 1_000_000) -> None:
+        self.hub_degree = int(hub_degree)
+        self.max_edges = int(max_edges)
+        self.pending_limit = int(pending_limit)
+        self.actors = _Names()
+        self.resources = _Names()
+        self.a = np.empty(0, dtype=np.int32)
+        self.r = np.empty(0, dtype=np.int32)
+        self.w = np.empty(0, dtype=np.float32)
+        self._pa: List[int] = []
+        self._pr: List[int] = []
+
+    @property
+    def n_edges(self) -> int:
+        self._coalesce()
+        return len(self.a)
+
+    # ---- building ----
+
+    def add_events(self, events: Iterable[Dict[str, Any]]) -> Set[int]:
+        """Fold events into the graph; returns the actor ids they touched."""
+        touched: Set[int] = set()
+        for ev in events:
+            actors = [self.actors.get(k) for k in _actor_keys(ev)]
+            if not actors:
+                continue
+            resources = [self.resources.get(k) for k in _resource_keys(ev)]
+            touched.update(actors)
+            for a in actors:
+                self._pa.extend([a] * len(resources))
+                self._pr.extend(resources)
+            if len(self._pa) >= self.pending_limit:
+                self._coalesce()
+        return touched
+
+    def flush(self) -> None:
+        """Merge pending pairs into the edge arrays (analyses and save() do this themselves)."""
+        self._coalesce()
+
+    def _coalesce(self) -> None:
+        if not self._pa:
+            return
+        a = np.concatenate([self.a, np.asarray(self._pa, dtype=np.int32)])
+        r = np.concatenate([self.r, np.asarray(self._pr, dtype=np.int32)])
+        w = np.concatenate([self.w, np.ones(len(self._pa), dtype=np.float32)])
+        self._pa, self._pr = [], []
+        m = coo_matrix((w, (a, r)), shape=(len(self.actors), len(self.resources)))
+        m.sum_duplicates()
+        self.a, self.r, self.w = m.row.astype(np.int32), m.col.astype(np.int32), m.data.astype(np.float32)
+        if len(self.a) > self.max_edges:
+            self._prune()
+
+    def _prune(self) -> None:
+        """
+        Stay under max_edges by dropping edges of resources seen by a single
+        actor (they can't link anyone yet), lightest first.
+        """
+        deg = np.bincount(self.r, minlength=len(self.resources))
+        lone = deg[self.r] <= 1
+        excess = len(self.a) - self.max_edges
+        cand = np.flatnonzero(lone)
+        drop = cand[np.argsort(self.w[cand], kind="stable")[:excess]]
+        keep = np.ones(len(self.a), dtype=bool)
+        keep[drop] = False
+        self.a, self.r, self.w = self.a[keep], self.r[keep], self.w[keep]
+
+    def biadjacency(self) -> csr_matrix:
+        self._coalesce()
+        return csr_matrix(
+            (np.ones(len(self.a), dtype=np.float32), (self.a, self.r)),
+            shape=(len(self.actors), len(self.resources)),
+        )
+
+    # ---- analyses ----
+
+    def components(self) -> Tuple[int, np.ndarray]:
+        """
+        (n_components, labels) over actors then resources (labels[len(actors) + j]
+        is resource j). Hub resources are isolated before labelling.
+        """
+        self._coalesce()
+        na, nr = len(self.actors), len(self.resources)
+        hubs = np.bincount(self.r, minlength=nr) > self.hub_degree
+        keep = ~hubs[self.r]
+        rows = self.a[keep].astype(np.int64)
+        cols = self.r[keep].astype(np.int64) + na
+        A = csr_matrix((np.ones(len(rows), dtype=np.int8), (rows, cols)), shape=(na + nr, na + nr))
+        return connected_components(A, directed=False)
+
+    def densest(self, B: csr_matrix, actor_idx: np.ndarray, res_idx: np.ndarray) -> Tuple[float, np.ndarray, np.ndarray]:
+        """
+        Greedy peeling on the sub-biadjacency B[actor_idx][:, res_idx]:
+        repeatedly drop the min-degree node and keep the densest prefix.
+        Returns (density, actor ids, resource ids) of the best subgraph.
+        """
+        sub = B[actor_idx][:, res_idx].tocsr()
+        na, nr = sub.shape
+        if sub.nnz == 0:
+            return 0.0, actor_idx[:0], res_idx[:0]
+        subT = sub.T.tocsr()
+        deg = np.concatenate([np.diff(sub.indptr), np.diff(subT.indptr)]).astype(np.int64)
+        alive = np.ones(na + nr, dtype=bool)
+        heap = [(int(d), i) for i, d in enumerate(deg)]
+        heapq.heapify(heap)
+        edges, nodes = int(sub.nnz), na + nr
+        best, best_removed = edges / nodes, 0
+        order: List[int] = []
+        while heap and nodes > 1:
+            d, i = heapq.heappop(heap)
+            if not alive[i] or d != deg[i]:
+                continue
+            alive[i] = False
+            order.append(i)
+            edges -= d
+            nodes -= 1
+            if i < na:
+                nbrs = sub.indices[sub.indptr[i] : sub.indptr[i + 1]] + na
+            else:
+                j = i - na
+                nbrs = subT.indices[subT.indptr[j] : subT.indptr[j + 1]]
+            for v in nbrs[alive[nbrs]]:
+                deg[v] -= 1
+                heapq.heappush(heap, (int(deg[v]), int(v)))
+            if edges / nodes > best:
+                best, best_removed = edges / nodes, len(order)
+        keep = np.ones(na + nr, dtype=bool)
+        keep[order[:best_removed]] = False
+        return float(best), actor_idx[keep[:na]], res_idx[keep[na:]]
+
+    def rings(
+        self,
+        touched: Optional[Iterable[int]] = None,
+        min_ngos: int = 2,
+        min_actors: int = 3,
+        min_density: float = 1.2,
+        max_peel_nodes: int = 50_000,
+    ) -> List[Dict[str, Any]]:
+        """
+        Components (optionally only those containing a `touched` actor) whose
+        densest part spans at least `min_ngos` NGOs and `min_actors` actors
+        with density >= `min_density`. A tree has density < 1, so anything
+        above it needs actors sharing more than one resource.
+        """
+        n_comp, labels = self.components()
+        na = len(self.actors)
+        a_lab, r_lab = labels[:na], labels[na:]
+        if touched is not None:
+            comps = np.unique(a_lab[np.fromiter(touched, dtype=np.int64)]) if touched else np.empty(0, dtype=np.int64)
+        else:
+            comps = np.arange(n_comp)
+        B = self.biadjacency()
+        a_order, r_order = np.argsort(a_lab, kind="stable"), np.argsort(r_lab, kind="stable")
+        a_bounds = np.searchsorted(a_lab[a_order], [comps, comps + 1])
+        r_bounds = np.searchsorted(r_lab[r_order], [comps, comps + 1])
+
+        out = []
+        for k, c in enumerate(comps):
+            actor_idx = a_order[a_bounds[0, k] : a_bounds[1, k]]
+            res_idx = r_order[r_bounds[0, k] : r_bounds[1, k]]
+            if len(actor_idx) < min_actors or len(actor_idx) + len(res_idx) > max_peel_nodes:
+                continue
+            density, a_best, r_best = self.densest(B, actor_idx, res_idx)
+            members = [self.actors.names[i] for i in a_best]
+            n_ngos = sum(1 for m in members if m.startswith("ngo:"))
+            if density < min_density or len(members) < min_actors or n_ngos < min_ngos:
+                continue
+            out.append(
+                {
+                    "component": int(c),
+                    "density": density,
+                    "actors": members,
+                    "resources": [self.resources.names[j] for j in r_best],
+                    "component_size": int(len(actor_idx) + len(res_idx)),
+                }
+            )
+        out.sort(key=lambda x: -x["density"])
+        return out
+
+    def shared_devices(self, min_ngos: int = 2, touched: Optional[Iterable[int]] = None) -> List[Dict[str, Any]]:
+        """Devices used by at least `min_ngos` NGOs (optionally only those a touched NGO uses)."""
+        self._coalesce()
+        is_ngo = np.array([n.startswith("ngo:") for n in self.actors.names], dtype=bool)
+        is_dev = np.array([n.startswith("device:") for n in self.resources.names], dtype=bool)
+        sel = is_ngo[self.a] & is_dev[self.r]
+        a, r = self.a[sel], self.r[sel]
+        counts = np.bincount(r, minlength=len(self.resources))
+        shared = counts >= min_ngos
+        if touched is not None:
+            hit = np.zeros(len(self.actors), dtype=bool)
+            hit[list(touched)] = True
+            near = np.zeros(len(self.resources), dtype=bool)
+            near[r[hit[a]]] = True
+            shared &= near
+        keep = shared[r]
+        a, r = a[keep], r[keep]
+        order = np.argsort(r, kind="stable")
+        a, r = a[order], r[order]
+        devs, starts = np.unique(r, return_index=True)
+        out = [
+            {"device": self.resources.names[d], "ngos": [self.actors.names[i] for i in grp]}
+            for d, grp in zip(devs, np.split(a, starts[1:]))
+        ]
+        out.sort(key=lambda x: -len(x["ngos"]))
+        return out
+
+    # ---- persistence ----
+
+    def save(self, path: str) -> None:
+        self._coalesce()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + ".tmp.npz"
+        np.savez(
+            tmp,
+            a=self.a,
+            r=self.r,
+            w=self.w,
+            actors=np.asarray(self.actors.names, dtype=str),
+            resources=np.asarray(self.resources.names, dtype=str),
+            params=np.array([self.hub_degree, self.max_edges, self.pending_limit], dtype=np.int64),
+        )
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "EntityGraph":
+        with np.load(path) as data:
+            hub_degree, max_edges, pending_limit = data["params"].tolist()
+            g = cls(hub_degree=hub_degree, max_edges=max_edges, pending_limit=pending_limit)
+            g.actors = _Names(data["actors"].tolist())
+            g.resources = _Names(data["resources"].tolist())
+            g.a, g.r, g.w = data["a"], data["r"], data["w"]
+        return g
+
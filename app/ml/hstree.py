@@ -0,0 +1,253 @@
+# app/ml/hstree.py
+"""
+Streaming Half-Space Trees (Tan, Ting & Liu, 2011) for online anomaly detection.
+
+Unlike IsolationForest this detector never refits: every event updates a
+fixed number of node counters (n_trees * depth), so learning is O(1) per
+event and the model follows drift window by window.
+
+How it works
+------------
+- Each tree is a complete binary tree of `depth` levels; every internal node
+  halves its workspace along a random feature.
+- Each node keeps two masses: `r` (reference, from the last full window)
+  and `l` (latest, being filled by the current window).
+- Scoring uses `r` only; after `window_size` events, r <- l and l <- 0.
+  Because r is frozen inside a window, scoring a whole window at once is
+  exactly equivalent to scoring event by event, which lets us vectorise.
+
+Scores follow the anomaly.py convention (higher = more anomalous):
+    score = log2(window_size * 2**depth + 1) - log2(mass + 1)
+where mass is the average over trees of r[node] * 2**level at the node where
+descent stops (max depth, or r < size_limit).
+
+Intended usage:
+    from app.ml.hstree import HalfSpaceTrees
+
+    hst = HalfSpaceTrees()
+    hst.prime(X_initial)            # fit bounds + first reference window
+    scores = hst.learn_score(X)     # score, then learn, in stream order
+
+State round-trips through to_state()/from_state() (plain numpy arrays) and
+save()/load() (a single .npz file).
+"""
+
+from __future__ import annotations
+
+import os
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+
+
+class HalfSpaceTrees:
+    def __init__(
+        self,
+        n_trees: int = 25,
+        depth: int = 10,
+        window_size: int = 250,
+        size_limit: Optional[float] = None,
+        log_features: Sequence[int] = (0, 2, 4),
+        random_state: int = 42,
+    ) -> None:
+        self.n_trees = int(n_trees)
+        self.depth = int(depth)
+        self.window_size = int(window_size)
+        self.size_limit = float(size_limit) if size_limit is not None else 0.1 * self.window_size
+        # heavy-tailed features (quantity, gps jump, speed) are split in log1p space
+        self.log_features = tuple(int(i) for i in log_features)
+        self.random_state = int(random_state)
+
+        self.mins: Optional[np.ndarray] = None
+        self.maxs: Optional[np.ndarray] = None
+        self.split_dim: Optional[np.ndarray] = None
+        self.split_val: Optional[np.ndarray] = None
+        n_nodes = 2 ** (self.depth + 1) - 1
+        self.r = np.zeros((self.n_trees, n_nodes), dtype=np.float64)
+        self.l = np.zeros((self.n_trees, n_nodes), dtype=np.float64)
+        self.seen_in_window = 0
+        self.windows = 0
+
+    # ---- setup ----
+
+    @property
+    def is_ready(self) -> bool:
+        """True once bounds are known and at least one reference window exists."""
+        return self.split_dim is not None and self.windows > 0
+
+    def _transform(self, X: np.ndarray) -> np.ndarray:
+        X = np.array(X, dtype=float, copy=True)
+        if X.ndim == 1:
+            X = X[None, :]
+        for i in self.log_features:
+            if i < X.shape[1]:
+                X[:, i] = np.log1p(np.maximum(X[:, i], 0.0))
+        if self.mins is not None:
+            span = np.where(self.maxs > self.mins, self.maxs - self.mins, 1.0)
+            X = (X - self.mins) / span
+        return X
+
+    def _build_trees(self, n_features: int) -> None:
+        rng = np.random.default_rng(self.random_state)
+        n_internal = 2 ** self.depth - 1
+        n_nodes = 2 ** (self.depth + 1) - 1
+        self.split_dim = np.zeros((self.n_trees, n_nodes), dtype=np.int64)
+        self.split_val = np.zeros((self.n_trees, n_nodes), dtype=np.float64)
+        for t in range(self.n_trees):
+            # random workspace around a random point in [0, 1]^d (as in the paper)
+            s = rng.random(n_features)
+            half = 2.0 * np.maximum(s, 1.0 - s)
+            lo = np.empty((n_nodes, n_features))
+            hi = np.empty((n_nodes, n_features))
+            lo[0], hi[0] = s - half, s + half
+            dims = rng.integers(0, n_features, size=n_internal)
+            for node in range(n_internal):
+                q = dims[node]
+                mid = 0.5 * (lo[node, q] + hi[node, q])
+                self.split_dim[t, node] = q
+                self.split_val[t, node] = mid
+                left, right = 2 * node + 1, 2 * node + 2
+                lo[left], hi[left] = lo[node], hi[node]
+                lo[right], hi[right] = lo[node], hi[node]
+                hi[left, q] = mid
+                lo[right, q] = mid
+
+    def prime(self, X: Sequence[Sequence[float]]) -> "HalfSpaceTrees":
+        """
+        Fix feature bounds from an initial sample and install it as the first
+        reference window. Call once before streaming.
+        """
+        X = np.asarray(X, dtype=float)
+        if X.size == 0:
+            return self
+        self.mins = None
+        Z = self._transform(X)
+        self.mins, self.maxs = Z.min(axis=0), Z.max(axis=0)
+        self._build_trees(Z.shape[1])
+        self.r[:] = 0.0
+        self.l[:] = 0.0
+        # re-transform now that bounds are set, so paths see [0, 1]-scaled features
+        self._add_mass(self.r, self._paths(self._transform(X)))
+        self.seen_in_window = 0
+        self.windows = 1
+        return self
+
+    # ---- core ----
+
+    def _paths(self, Z: np.ndarray) -> np.ndarray:
+        """Node index per (sample, tree, level), shape (n, n_trees, depth + 1)."""
+        n = len(Z)
+        tree_idx = np.arange(self.n_trees)[None, :]
+        node = np.zeros((n, self.n_trees), dtype=np.int64)
+        out = np.empty((n, self.n_trees, self.depth + 1), dtype=np.int64)
+        out[:, :, 0] = node
+        rows = np.arange(n)[:, None]
+        for k in range(self.depth):
+            q = self.split_dim[tree_idx, node]
+            go_right = Z[rows, q] >= self.split_val[tree_idx, node]
+            node = 2 * node + 1 + go_right
+            out[:, :, k + 1] = node
+        return out
+
+    def _add_mass(self, mass: np.ndarray, paths: np.ndarray) -> None:
+        n_nodes = mass.shape[1]
+        flat = (np.arange(self.n_trees)[None, :, None] * n_nodes + paths).ravel()
+        mass += np.bincount(flat, minlength=mass.size).reshape(mass.shape)
+
+    def _score_paths(self, paths: np.ndarray) -> np.ndarray:
+        tree_idx = np.arange(self.n_trees)[None, :, None]
+        r_path = self.r[tree_idx, paths]  # (n, T, D+1)
+        # stop at the first node whose reference mass is under size_limit
+        below = r_path < self.size_limit
+        below[:, :, -1] = True
+        stop = below.argmax(axis=2)
+        r_stop = np.take_along_axis(r_path, stop[:, :, None], axis=2)[:, :, 0]
+        mass = (r_stop * np.exp2(stop)).mean(axis=1)
+        return np.log2(self.window_size * 2.0 ** self.depth + 1.0) - np.log2(mass + 1.0)
+
+    def score(self, X: Sequence[Sequence[float]]) -> np.ndarray:
+        """Score without learning."""
+        X = np.asarray(X, dtype=float)
+        if X.size == 0:
+            return np.array([], dtype=float)
+        if self.split_dim is None:
+            raise RuntimeError("HalfSpaceTrees.prime() must be called before scoring")
+        Z = self._transform(X)
+        out = np.empty(len(Z), dtype=float)
+        # bound the (n, trees, depth) path buffer on large batches
+        step = max(self.window_size, 4096)
+        for i in range(0, len(Z), step):
+            out[i : i + step] = self._score_paths(self._paths(Z[i : i + step]))
+        return out
+
+    def learn_score(self, X: Sequence[Sequence[float]]) -> np.ndarray:
+        """Score each row against the current reference, then learn it, in order."""
+        X = np.asarray(X, dtype=float)
+        if X.size == 0:
+            return np.array([], dtype=float)
+        if self.split_dim is None:
+            raise RuntimeError("HalfSpaceTrees.prime() must be called before scoring")
+        Z = self._transform(X)
+        out = np.empty(len(Z), dtype=float)
+        i = 0
+        while i < len(Z):
+            # process up to the end of the current window in one vectorised step
+            j = min(len(Z), i + self.window_size - self.seen_in_window)
+            paths = self._paths(Z[i:j])
+            out[i:j] = self._score_paths(paths)
+            self._add_mass(self.l, paths)
+            self.seen_in_window += j - i
+            if self.seen_in_window >= self.window_size:
+                self.r, self.l = self.l, np.zeros_like(self.l)
+                self.seen_in_window = 0
+                self.windows += 1
+            i = j
+        return out
+
+    # ---- persistence ----
+
+    def to_state(self) -> Dict[str, np.ndarray]:
+        if self.split_dim is None:
+            raise RuntimeError("nothing to persist before prime()")
+        return {
+            "params": np.array(
+                [self.n_trees, self.depth, self.window_size, self.size_limit, self.random_state,
+                 self.seen_in_window, self.windows],
+                dtype=np.float64,
+            ),
+            "log_features": np.asarray(self.log_features, dtype=np.int64),
+            "mins": self.mins,
+            "maxs": self.maxs,
+            "split_dim": self.split_dim,
+            "split_val": self.split_val,
+            "r": self.r,
+            "l": self.l,
+        }
+
+    @classmethod
+    def from_state(cls, state: Dict[str, np.ndarray]) -> "HalfSpaceTrees":
+        n_trees, depth, window_size, size_limit, seed, seen, windows = state["params"].tolist()
+        hst = cls(
+            n_trees=int(n_trees),
+            depth=int(depth),
+            window_size=int(window_size),
+            size_limit=size_limit,
+            log_features=state["log_features"].tolist(),
+            random_state=int(seed),
+        )
+        hst.mins, hst.maxs = state["mins"], state["maxs"]
+        hst.split_dim, hst.split_val = state["split_dim"], state["split_val"]
+        hst.r, hst.l = state["r"].copy(), state["l"].copy()
+        hst.seen_in_window, hst.windows = int(seen), int(windows)
+        return hst
+
+    def save(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + ".tmp.npz"
+        np.savez(tmp, **self.to_state())
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "HalfSpaceTrees":
+        with np.load(path) as data:
+            return cls.from_state({k: data[k] for k in data.files})
@@ -0,0 +1,138 @@
+# app/ml/quantiles.py
+"""
+Mergeable streaming quantile sketch for anomaly-score thresholds.
+
+Replaces full-batch np.percentile: scores are folded into a sketch as they
+are produced, so p97/p99 thresholds are stable across runs and usable when
+scoring a single event.
+
+The sketch is a log-bucketed histogram (DDSketch-style): a value x > 0 lands
+in bucket ceil(log_gamma(x)) with gamma = (1 + alpha) / (1 - alpha), so any
+quantile is returned within relative error `alpha`. Properties:
+- update: O(1) per value (vectorised per batch)
+- merge: add bucket counts (sketches from different workers combine exactly)
+- query: O(#buckets), cached until the next update; #buckets is bounded by
+  `max_buckets` (lowest buckets are collapsed first)
+
+Scores are expected to be non-negative (higher = more anomalous); values at
+or below `min_value` are counted in a dedicated zero bucket.
+"""
+
+from __future__ import annotations
+
+import math
+from typing import Any, Dict, Iterable, Optional
+
+import numpy as np
+
+
+class QuantileSketch:
+    def __init__(
+        self,
+        alpha: float = 0.01,
+        max_buckets: int = 2048,
+        min_value: float = 1e-9,
+    ) -> None:
+        self.alpha = float(alpha)
+        self.max_buckets = int(max_buckets)
+        self.min_value = float(min_value)
+        self._gamma = (1.0 + self.alpha) / (1.0 - self.alpha)
+        self._log_gamma = math.log(self._gamma)
+        self.bins: Dict[int, int] = {}
+        self.zero_count = 0
+        self.count = 0
+        self._cache: Optional[tuple[np.ndarray, np.ndarray]] = None
+
+    # ---- updates ----
+
+    def update(self, values: Iterable[float]) -> "QuantileSketch":
+        """Fold a batch of scores into the sketch."""
+        arr = np.asarray(list(values) if not isinstance(values, np.ndarray) else values, dtype=float)
+        arr = arr[np.isfinite(arr)]
+        if arr.size == 0:
+            return self
+        small = arr <= self.min_value
+        self.zero_count += int(small.sum())
+        pos = arr[~small]
+        if pos.size:
+            keys, counts = np.unique(np.ceil(np.log(pos) / self._log_gamma).astype(np.int64), return_counts=True)
+            for k, c in zip(keys.tolist(), counts.tolist()):
+                self.bins[k] = self.bins.get(k, 0) + c
+        self.count += int(arr.size)
+        self._collapse()
+        self._cache = None
+        return self
+
+    def merge(self, other: "QuantileSketch") -> "QuantileSketch":
+        """Add another sketch's counts into this one (same alpha required)."""
+        if not math.isclose(self.alpha, other.alpha):
+            raise ValueError("cannot merge sketches with different alpha")
+        for k, c in other.bins.items():
+            self.bins[k] = self.bins.get(k, 0) + c
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self._collapse()
+        self._cache = None
+        return self
+
+    def _collapse(self) -> None:
+        # fold the lowest buckets together; thresholds live in the upper tail
+        if len(self.bins) <= self.max_buckets:
+            return
+        keys = sorted(self.bins)
+        n_fold = len(keys) - self.max_buckets + 1
+        target = keys[n_fold - 1]
+        folded = sum(self.bins.pop(k) for k in keys[:n_fold])
+        self.bins[target] = folded
+
+    # ---- queries ----
+
+    def _cdf(self) -> tuple[np.ndarray, np.ndarray]:
+        if self._cache is None:
+            keys = np.array(sorted(self.bins), dtype=np.int64)
+            counts = np.array([self.bins[k] for k in keys.tolist()], dtype=np.int64)
+            self._cache = (keys, self.zero_count + np.cumsum(counts))
+        return self._cache
+
+    def quantile(self, q: float) -> float:
+        """Value at quantile q in [0, 1]; +inf on an empty sketch."""
+        if self.count == 0:
+            return float("inf")
+        q = float(np.clip(q, 0.0, 1.0))
+        rank = q * (self.count - 1)
+        if rank < self.zero_count:
+            return 0.0
+        keys, cum = self._cdf()
+        i = int(np.searchsorted(cum, rank, side="right"))
+        i = min(i, len(keys) - 1)
+        return float(2.0 * self._gamma ** int(keys[i]) / (self._gamma + 1.0))
+
+    def percentile(self, pct: float) -> float:
+        """Percentile counterpart of threshold_by_percentile()."""
+        return self.quantile(float(pct) / 100.0)
+
+    # ---- persistence ----
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "alpha": self.alpha,
+            "max_buckets": self.max_buckets,
+            "min_value": self.min_value,
+            "count": self.count,
+            "zero_count": self.zero_count,
+            # Mongo field names must be strings
+            "bins": {str(k): int(v) for k, v in self.bins.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "QuantileSketch":
+        sk = cls(
+            alpha=d.get("alpha", 0.01),
+            max_buckets=d.get("max_buckets", 2048),
+            min_value=d.get("min_value", 1e-9),
+        )
+        sk.bins = {int(k): int(v) for k, v in (d.get("bins") or {}).items()}
+        sk.zero_count = int(d.get("zero_count", 0))
+        sk.count = int(d.get("count", 0))
+        sk._collapse()
+        return sk
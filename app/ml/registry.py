@@ -0,0 +1,176 @@
+# app/ml/registry.py
+"""
+Model registry for Hopemeals Guardian.
+
+Keeps fitted models in-process, keyed by (segment_key, segment_value), and
+persists each one under app/storage/models so other workers and restarts
+can pick them up lazily. Next to each <digest>.joblib a <digest>.json holds
+the entry's metadata, so listing models doesn't unpickle them.
+
+get() stats the model file on every call and reloads the entry when
+another worker has replaced it since. register() numbers versions from
+what is on disk, holding an flock on <MODEL_DIR>/<segment_key>/.lock, so
+two workers training the same segment get distinct versions.
+
+register() and get() do disk I/O (joblib); call them from async code via
+asyncio.to_thread.
+
+Keys:
+    ("global", "*")          -> the un-partitioned model
+    ("ngo_id", "<ngo id>")   -> per-NGO model
+    ("donor_id", "<donor>")  -> per-donor model
+
+Each entry is a dict:
+    {"segment_key", "segment_value", "version", "kind", "model",
+     "n_samples", "trained_at"}
+
+`kind` is "iforest" or "heuristic"; heuristic entries carry model=None and
+mean "score this segment with heuristic_scores".
+"""
+
+from __future__ import annotations
+
+import contextlib
+import fcntl
+import glob
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import joblib
+
+MODEL_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "storage", "models"))
+
+_entries: Dict[Tuple[str, str], Dict[str, Any]] = {}
+_stamps: Dict[Tuple[str, str], int] = {}  # st_mtime_ns of the file each cached entry came from
+_lock = threading.Lock()
+
+
+def _path(segment_key: str, segment_value: str) -> str:
+    # hash the value so arbitrary ids are safe as filenames
+    digest = hashlib.sha1(str(segment_value).encode("utf-8")).hexdigest()
+    return os.path.join(MODEL_DIR, segment_key, f"{digest}.joblib")
+
+
+def _meta(entry: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: v for k, v in entry.items() if k != "model"} | {"model_version": model_version(entry)}
+
+
+def _stamp(path: str) -> Optional[int]:
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def _disk_version(path: str) -> int:
+    meta = _load_meta(path) if os.path.exists(path) else None
+    return int(meta["version"]) if meta else 0
+
+
+@contextlib.contextmanager
+def _key_lock(segment_key: str) -> Iterator[None]:
+    # cross-process: every worker registering under this key takes the same flock
+    d = os.path.join(MODEL_DIR, segment_key)
+    os.makedirs(d, exist_ok=True)
+    with open(os.path.join(d, ".lock"), "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def model_version(entry: Dict[str, Any]) -> str:
+    """Stable identifier for a registered model, e.g. 'ngo_id:ngo-7:v3'."""
+    return f"{entry['segment_key']}:{entry['segment_value']}:v{entry['version']}"
+
+
+def register(
+    segment_key: str,
+    segment_value: str,
+    model: Any,
+    n_samples: int,
+    persist: bool = True,
+) -> Dict[str, Any]:
+    """Register (or replace) a model for a segment and bump its version."""
+    key = (segment_key, segment_value)
+    path = _path(segment_key, segment_value)
+    with _lock, (_key_lock(segment_key) if persist else contextlib.nullcontext()):
+        prev = _entries.get(key)
+        version = max(prev["version"] if prev else 0, _disk_version(path) if persist else 0) + 1
+        entry = {
+            "segment_key": segment_key,
+            "segment_value": segment_value,
+            "version": version,
+            "kind": "heuristic" if model is None else "iforest",
+            "model": model,
+            "n_samples": int(n_samples),
+            "trained_at": datetime.utcnow().isoformat() + "Z",
+        }
+        if persist:
+            tmp = path + ".tmp"
+            joblib.dump(entry, tmp)
+            os.replace(tmp, path)
+            meta = os.path.splitext(path)[0] + ".json"
+            with open(meta + ".tmp", "w") as f:
+                json.dump(_meta(entry), f)
+            os.replace(meta + ".tmp", meta)
+        _entries[key] = entry
+        _stamps[key] = _stamp(path) if persist else None
+    return entry
+
+
+def get(segment_key: str, segment_value: str) -> Optional[Dict[str, Any]]:
+    """Return the registered entry, (re)loading it from disk when its file is new or changed."""
+    key = (segment_key, segment_value)
+    entry = _entries.get(key)
+    path = _path(segment_key, segment_value)
+    stamp = _stamp(path)
+    if entry is not None and (stamp is None or stamp == _stamps.get(key)):
+        # unchanged on disk, or registered in memory only (persist=False)
+        return entry
+    if stamp is None:
+        return None
+    try:
+        loaded = joblib.load(path)
+    except Exception as e:
+        print(f"[registry] failed to load {path}: {e}")
+        return entry
+    if entry is not None and entry["version"] > loaded["version"]:
+        return entry
+    _entries[key] = loaded
+    _stamps[key] = stamp
+    return loaded
+
+
+def _load_meta(path: str) -> Optional[Dict[str, Any]]:
+    meta = os.path.splitext(path)[0] + ".json"
+    try:
+        if os.path.exists(meta):
+            with open(meta) as f:
+                return json.load(f)
+        # persisted before metadata sidecars existed
+        return _meta(joblib.load(path))
+    except Exception as e:
+        print(f"[registry] failed to read {path}: {e}")
+        return None
+
+
+def list_entries(segment_key: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Metadata (without model objects) of every persisted entry, whichever worker registered it."""
+    if segment_key and (os.path.basename(segment_key) != segment_key or glob.has_magic(segment_key)):
+        return []
+    pattern = os.path.join(MODEL_DIR, segment_key or "*", "*.joblib")
+    out = [m for m in map(_load_meta, glob.glob(pattern)) if m is not None]
+    # in-memory entries registered with persist=False
+    seen = {(m["segment_key"], m["segment_value"]) for m in out}
+    out.extend(
+        _meta(entry)
+        for (key, value), entry in _entries.items()
+        if (key, value) not in seen and (not segment_key or key == segment_key)
+    )
+    return sorted(out, key=lambda m: (m["segment_key"], str(m["segment_value"])))
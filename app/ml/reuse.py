@@ -0,0 +1,135 @@
+# app/ml/reuse.py
+"""
+Beneficiary reuse detection with an inverted index.
+
+Maps beneficiary_id -> time-ordered claims (ts, event_id, ngo_id, donor_id),
+so "who else claimed these beneficiaries recently?" costs O(k log m) for an
+event with k beneficiaries (m = claims per beneficiary) instead of a scan of
+the events collection.
+
+Intended usage:
+    from app.ml.reuse import BeneficiaryIndex
+
+    idx = BeneficiaryIndex(window_s=72 * 3600)
+    for ev in events_in_time_order:
+        idx.add_event(ev)
+        reasons = idx.reuse_reasons(ev)   # ["beneficiary_reuse"] or []
+
+A claim counts towards reuse when it falls in [ts - window, ts] of the event
+being checked, i.e. the index only looks back, like live ingestion does.
+"""
+
+from __future__ import annotations
+
+import bisect
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, List, Optional, Tuple
+
+from app.utils.trajectory import epoch_seconds
+
+Claim = Tuple[float, str, Any, Any]  # (ts_s, event_id, ngo_id, donor_id)
+
+
+def _ts(claim: Claim) -> float:
+    return claim[0]
+
+
+class BeneficiaryIndex:
+    def __init__(self, window_s: float = 72 * 3600, min_ngos: int = 2, min_donors: int = 3) -> None:
+        self.window_s = float(window_s)
+        self.min_ngos = int(min_ngos)
+        self.min_donors = int(min_donors)
+        self._claims: Dict[str, List[Claim]] = {}
+        # insertion log for pruning whole beneficiaries once their claims age out
+        self._log: Deque[Tuple[float, str]] = deque()
+
+    def __len__(self) -> int:
+        return sum(len(v) for v in self._claims.values())
+
+    def add(self, event_id: Any, ts: Any, beneficiary_ids: Iterable[str], ngo_id: Any, donor_id: Any) -> None:
+        ts_s = ts if isinstance(ts, (int, float)) else epoch_seconds(ts)
+        claim = (float(ts_s), str(event_id), ngo_id, donor_id)
+        for bid in set(beneficiary_ids or []):
+            lst = self._claims.setdefault(str(bid), [])
+            if not lst or lst[-1][0] <= claim[0]:
+                lst.append(claim)
+            else:
+                bisect.insort(lst, claim, key=_ts)
+            self._log.append((claim[0], str(bid)))
+
+    def add_event(self, ev: Dict[str, Any]) -> None:
+        self.add(ev["_id"], ev["timestamp"], ev.get("beneficiary_ids", []), ev.get("ngo_id"), ev.get("donor_id"))
+
+    def window_stats(
+        self, beneficiary_ids: Iterable[str], ts: Any, exclude: Optional[Any] = None
+    ) -> Dict[str, Dict[str, int]]:
+        """Per beneficiary: claims, distinct NGOs and donors in [ts - window, ts]."""
+        ts_s = ts if isinstance(ts, (int, float)) else epoch_seconds(ts)
+        out: Dict[str, Dict[str, int]] = {}
+        for bid in set(beneficiary_ids or []):
+            lst = self._claims.get(str(bid))
+            if not lst:
+                continue
+            hits = lst[bisect.bisect_left(lst, ts_s - self.window_s, key=_ts) : bisect.bisect_right(lst, ts_s, key=_ts)]
+            if exclude is not None:
+                hits = [c for c in hits if c[1] != str(exclude)]
+            if hits:
+                out[str(bid)] = {
+                    "claims": len(hits),
+                    "ngos": len({c[2] for c in hits}),
+                    "donors": len({c[3] for c in hits}),
+                }
+        return out
+
+    def reuse_reasons(self, ev: Dict[str, Any]) -> List[str]:
+        """["beneficiary_reuse"] if any beneficiary crosses the NGO/donor thresholds."""
+        stats = self.window_stats(ev.get("beneficiary_ids", []), ev["timestamp"])
+        for s in stats.values():
+            if s["ngos"] >= self.min_ngos or s["donors"] >= self.min_donors:
+                return ["beneficiary_reuse"]
+        return []
+
+    def prune(self, now: Any) -> int:
+        """Drop claims older than now - window; returns how many were removed."""
+        now_s = now if isinstance(now, (int, float)) else epoch_seconds(now)
+        cutoff = now_s - self.window_s
+        removed = 0
+        while self._log and self._log[0][0] < cutoff:
+            _, bid = self._log.popleft()
+            lst = self._claims.get(bid)
+            if not lst:
+                continue
+            cut = bisect.bisect_left(lst, cutoff, key=_ts)
+            if cut:
+                del lst[:cut]
+                removed += cut
+            if not lst:
+                del self._claims[bid]
+        return removed
+
+
+def reuse_reasons_for_events(
+    events: Iterable[Dict[str, Any]],
+    window_s: float = 72 * 3600,
+    min_ngos: int = 2,
+    min_donors: int = 3,
+    index: Optional[BeneficiaryIndex] = None,
+) -> Dict[Any, List[str]]:
+    """
+    event_id -> ["beneficiary_reuse"] for a batch, feeding events in time order.
+    Pass a long-lived `index` to carry claims across chunks.
+    """
+    idx = index if index is not None else BeneficiaryIndex(window_s=window_s, min_ngos=min_ngos, min_donors=min_donors)
+    out: Dict[Any, List[str]] = {}
+    events_sorted = sorted(events, key=lambda e: e["timestamp"])
+    for ev in events_sorted:
+        if not ev.get("beneficiary_ids"):
+            continue
+        idx.add_event(ev)
+        reasons = idx.reuse_reasons(ev)
+        if reasons:
+            out[ev["_id"]] = reasons
+    if events_sorted:
+        # keep a long-lived index bounded by the window
+        idx.prune(events_sorted[-1]["timestamp"])
+    return out
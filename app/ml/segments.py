@@ -0,0 +1,159 @@
+# app/ml/segments.py
+"""
+Segment-specific anomaly models (per NGO / per donor).
+
+A single global IsolationForest lets high-volume NGOs define "normal" for
+everyone. Here each segment gets its own model, fitted in parallel across a
+process pool; segments with too few samples fall back to heuristic_scores.
+
+Intended usage:
+    from app.ml.segments import train_segment_models, analyze_events_segmented
+
+    models = train_segment_models(X, segments, min_samples=50)
+    alerts = analyze_events_segmented(events, by="ngo_id", models=models)
+    # => list of {"event_id", "score", "severity", "reasons"}
+
+Thresholds (p97/p99) are computed per segment, since heuristic and model
+scores live on different scales.
+"""
+
+from __future__ import annotations
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sklearn.ensemble import IsolationForest
+
+from app.ml.anomaly import (
+    alerts_from_scores,
+    anomaly_scores,
+    heuristic_scores,
+    threshold_by_percentile,
+    train_iforest,
+)
+from app.utils.features import build_features
+
+
+def _fit_one(args: Tuple[str, np.ndarray, float]) -> Tuple[str, IsolationForest]:
+    # one core per segment; parallelism comes from the pool, not from sklearn
+    seg, X, contamination = args
+    return seg, train_iforest(X, contamination=contamination, n_jobs=1)
+
+
+def group_rows(segments: Sequence[Any]) -> Dict[str, np.ndarray]:
+    """Map segment value -> row indices (rows keep their original order)."""
+    seg_arr = np.asarray([str(s) for s in segments], dtype=object)
+    uniq, inverse = np.unique(seg_arr, return_inverse=True)
+    order = np.argsort(inverse, kind="stable")
+    bounds = np.cumsum(np.bincount(inverse, minlength=len(uniq)))[:-1]
+    return {str(u): idx for u, idx in zip(uniq, np.split(order, bounds))}
+
+
+def group_codes(codes: np.ndarray, names: Sequence[str]) -> Dict[str, np.ndarray]:
+    """group_rows() for integer-coded segments (columnar snapshot), without string conversion."""
+    codes = np.asarray(codes, dtype=np.int64)
+    order = np.argsort(codes, kind="stable")
+    counts = np.bincount(codes, minlength=len(names))
+    parts = np.split(order, np.cumsum(counts)[:-1])
+    return {str(names[c]): parts[c] for c in np.flatnonzero(counts)}
+
+
+def train_segment_models(
+    X: Sequence[Sequence[float]],
+    segments: Sequence[Any],
+    min_samples: int = 50,
+    contamination: float = 0.03,
+    max_workers: Optional[int] = None,
+    groups: Optional[Dict[str, np.ndarray]] = None,
+) -> Dict[str, Optional[IsolationForest]]:
+    """
+    Fit one IsolationForest per segment across a process pool.
+
+    Returns {segment_value: model}; segments below `min_samples` map to None
+    (score them with heuristic_scores). Pass precomputed `groups` (e.g. from
+    group_codes) to skip grouping `segments`.
+    """
+    X = np.asarray(X, dtype=float)
+    if groups is None:
+        groups = group_rows(segments)
+    models: Dict[str, Optional[IsolationForest]] = {
+        seg: None for seg, idx in groups.items() if len(idx) < min_samples
+    }
+    jobs = [(seg, X[idx], contamination) for seg, idx in groups.items() if len(idx) >= min_samples]
+    if not jobs:
+        return models
+
+    workers = max_workers or os.cpu_count() or 1
+    workers = min(workers, len(jobs))
+    if workers <= 1:
+        models.update(_fit_one(j) for j in jobs)
+        return models
+
+    # largest segments first so the pool isn't left waiting on a big tail job
+    jobs.sort(key=lambda j: len(j[1]), reverse=True)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for seg, model in pool.map(_fit_one, jobs):
+            models[seg] = model
+    return models
+
+
+def score_by_segment(
+    X: Sequence[Sequence[float]],
+    segments: Sequence[Any],
+    models: Dict[str, Optional[IsolationForest]],
+) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+    """
+    Route each row to its segment's model (heuristic when missing/None).
+
+    Returns (scores, groups) where groups maps segment -> row indices.
+    """
+    X = np.asarray(X, dtype=float)
+    scores = np.zeros(len(X), dtype=float)
+    groups = group_rows(segments)
+    for seg, idx in groups.items():
+        model = models.get(seg)
+        scores[idx] = anomaly_scores(model, X[idx]) if model is not None else heuristic_scores(X[idx])
+    return scores, groups
+
+
+def analyze_events_segmented(
+    events: Iterable[Dict[str, Any]],
+    by: str = "ngo_id",
+    models: Optional[Dict[str, Optional[IsolationForest]]] = None,
+    p97: float = 97.0,
+    p99: float = 99.0,
+    min_samples: int = 50,
+    contamination: float = 0.03,
+) -> List[Dict[str, Any]]:
+    """
+    Segment-aware counterpart of analyze_events().
+
+    If `models` is None, per-segment models are trained on `events` first.
+    """
+    events_list = list(events)
+    if not events_list:
+        return []
+    seg_of = {ev["_id"]: ev.get(by) for ev in events_list}
+    X, meta = build_features(events_list)
+    if len(X) == 0:
+        return []
+    segments = [seg_of[eid] for eid in meta]
+    if models is None:
+        models = train_segment_models(X, segments, min_samples=min_samples, contamination=contamination)
+
+    scores, groups = score_by_segment(X, segments, models)
+    alerts: List[Dict[str, Any]] = []
+    for idx in groups.values():
+        s = scores[idx]
+        alerts.extend(
+            alerts_from_scores(
+                [meta[i] for i in idx],
+                X[idx],
+                s,
+                threshold_by_percentile(s, p97),
+                threshold_by_percentile(s, p99),
+            )
+        )
+    return alerts
@@ -0,0 +1,190 @@
+# app/ml/spatial.py
+"""
+In-memory geohash grid of recent events.
+
+Points are bucketed by geohash cell at a fixed precision; each bucket is a
+time-ordered list, so a radius query touches only the cells covering the
+circle (app.utils.geohash.cover) and a bisect per cell for the time range,
+then an exact haversine filter on the few candidates. Large radii are
+covered at a coarser precision (precision_for_radius) whose cells are
+matched against the buckets by prefix, so the cover stays a few dozen
+cells whatever the radius.
+
+Also answers the GPS-spoofing question "how many distinct devices reported
+these exact coordinates recently?" from the same buckets.
+
+Intended usage:
+    from app.ml.spatial import GridIndex
+
+    grid = GridIndex(precision=6, window_s=7 * 86400)
+    grid.add(event_id, ts, lat, lon, device_id)
+    hits = grid.nearby(lat, lon, radius_km=2.0, start=t0, end=t1)
+    # or, to rank outside a lock that guards the grid:
+    hits = GridIndex.rank(grid.candidates(lat, lon, 2.0, t0, t1), lat, lon, 2.0)
+    devs = grid.colocated_devices(lat, lon, ts, window_s=3600)
+
+State round-trips through save()/load() (a single .npz file).
+"""
+
+from __future__ import annotations
+
+import bisect
+import os
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from app.utils.geo import haversine_km_np
+from app.utils.geohash import cover, encode, precision_for_radius
+from app.utils.trajectory import epoch_seconds
+
+Point = Tuple[float, float, float, str, str]  # (ts_s, lat, lon, device_id, event_id)
+
+
+def _ts(p: Point) -> float:
+    return p[0]
+
+
+def _secs(ts: Any) -> float:
+    return float(ts) if isinstance(ts, (int, float)) else epoch_seconds(ts)
+
+
+class GridIndex:
+    def __init__(self, precision: int = 6, window_s: float = 7 * 86400, decimals: int = 5) -> None:
+        self.precision = int(precision)
+        self.window_s = float(window_s)
+        # coordinates equal to `decimals` places (5 ~ 1 m) count as identical
+        self.decimals = int(decimals)
+        self._cells: Dict[str, List[Point]] = {}
+        self._log: Deque[Tuple[float, str]] = deque()
+
+    def __len__(self) -> int:
+        return sum(len(v) for v in self._cells.values())
+
+    def add(self, event_id: Any, ts: Any, lat: float, lon: float, device_id: Any) -> None:
+        p = (_secs(ts), float(lat), float(lon), str(device_id), str(event_id))
+        cell = encode(p[1], p[2], self.precision)
+        lst = self._cells.setdefault(cell, [])
+        if any(q[4] == p[4] for q in self._range(cell, p[0], p[0])):
+            return  # already indexed (e.g. warmed from Mongo after the insert)
+        if not lst or lst[-1][0] <= p[0]:
+            lst.append(p)
+        else:
+            bisect.insort(lst, p, key=_ts)
+        self._log.append((p[0], cell))
+
+    def add_event(self, ev: Dict[str, Any]) -> None:
+        gps = ev.get("gps") or {}
+        if "lat" in gps and "lon" in gps:
+            self.add(ev["_id"], ev["timestamp"], gps["lat"], gps["lon"], ev.get("device_id"))
+
+    def _range(self, cell: str, lo: float, hi: float) -> List[Point]:
+        lst = self._cells.get(cell)
+        if not lst:
+            return []
+        return lst[bisect.bisect_left(lst, lo, key=_ts) : bisect.bisect_right(lst, hi, key=_ts)]
+
+    def _cells_for(self, lat: float, lon: float, radius_km: float) -> List[str]:
+        p = min(precision_for_radius(radius_km), self.precision)
+        if p == self.precision:
+            return cover(lat, lon, radius_km, p)
+        coarse = set(cover(lat, lon, radius_km, p))
+        return [cell for cell in list(self._cells) if cell[:p] in coarse]
+
+    def candidates(
+        self,
+        lat: float,
+        lon: float,
+        radius_km: float,
+        start: Optional[Any] = None,
+        end: Optional[Any] = None,
+    ) -> List[Point]:
+        """Points in the cells covering the circle in [start, end]; a superset of the hits."""
+        lo = _secs(start) if start is not None else float("-inf")
+        hi = _secs(end) if end is not None else float("inf")
+        cand: List[Point] = []
+        for cell in self._cells_for(lat, lon, radius_km):
+            cand.extend(self._range(cell, lo, hi))
+        return cand
+
+    @staticmethod
+    def rank(
+        cand: List[Point], lat: float, lon: float, radius_km: float, limit: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """Candidates within radius_km of (lat, lon), nearest first."""
+        if not cand:
+            return []
+        arr = np.array([(p[1], p[2]) for p in cand], dtype=float)
+        d = haversine_km_np(lat, lon, arr[:, 0], arr[:, 1])
+        order = [i for i in np.argsort(d, kind="stable") if d[i] <= radius_km]
+        if limit is not None:
+            order = order[:limit]
+        return [
+            {"event_id": cand[i][4], "device_id": cand[i][3], "lat": cand[i][1], "lon": cand[i][2],
+             "ts": cand[i][0], "distance_km": float(d[i])}
+            for i in order
+        ]
+
+    def nearby(
+        self,
+        lat: float,
+        lon: float,
+        radius_km: float,
+        start: Optional[Any] = None,
+        end: Optional[Any] = None,
+        limit: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """Points within radius_km of (lat, lon) in [start, end], nearest first."""
+        return self.rank(self.candidates(lat, lon, radius_km, start, end), lat, lon, radius_km, limit)
+
+    def colocated_devices(self, lat: float, lon: float, ts: Any, window_s: float) -> Set[str]:
+        """Distinct devices that reported these exact coordinates in [ts - window_s, ts]."""
+        t = _secs(ts)
+        key = (round(lat, self.decimals), round(lon, self.decimals))
+        pts = self._range(encode(lat, lon, self.precision), t - window_s, t)
+        return {p[3] for p in pts if (round(p[1], self.decimals), round(p[2], self.decimals)) == key}
+
+    def prune(self, now: Any) -> int:
+        """Drop points older than now - window; returns how many were removed."""
+        cutoff = _secs(now) - self.window_s
+        removed = 0
+        while self._log and self._log[0][0] < cutoff:
+            _, cell = self._log.popleft()
+            lst = self._cells.get(cell)
+            if not lst:
+                continue
+            cut = bisect.bisect_left(lst, cutoff, key=_ts)
+            if cut:
+                del lst[:cut]
+                removed += cut
+            if not lst:
+                del self._cells[cell]
+        return removed
+
+    # ---- persistence ----
+
+    def save(self, path: str) -> None:
+        pts = [p for lst in self._cells.values() for p in lst]
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + ".tmp.npz"
+        np.savez(
+            tmp,
+            params=np.array([self.precision, self.window_s, self.decimals], dtype=np.float64),
+            ts=np.array([p[0] for p in pts], dtype=np.float64),
+            lat=np.array([p[1] for p in pts], dtype=np.float64),
+            lon=np.array([p[2] for p in pts], dtype=np.float64),
+            device=np.array([p[3] for p in pts], dtype=str),
+            event=np.array([p[4] for p in pts], dtype=str),
+        )
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "GridIndex":
+        with np.load(path) as data:
+            precision, window_s, decimals = data["params"].tolist()
+            grid = cls(precision=int(precision), window_s=window_s, decimals=int(decimals))
+            order = np.argsort(data["ts"], kind="stable")
+            for i in order:
+                grid.add(data["event"][i], float(data["ts"][i]), data["lat"][i], data["lon"][i], data["device"][i])
+        return grid
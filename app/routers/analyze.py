@@ -1,10 +1,26 @@
 # app/routers/analyze.py
+import asyncio
 from fastapi import APIRouter, Depends
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from app.deps import get_db
-from app.schemas.alert import AnalyzeRequest
+from app.schemas.alert import (
+    AnalyzeRequest,
+    AnalyzeWindowRequest,
+    SegmentTrainRequest,
+    SegmentRunRequest,
+    GraphRefreshRequest,
+    SnapshotRefreshRequest,
+)
 
-from app.services.analyze_service import run_anomaly
+from app.services.analyze_service import (
+    run_anomaly,
+    run_anomaly_window,
+    train_segments,
+    run_anomaly_segmented,
+    score_event,
+)
+from app.services import graph_service, snapshot_service
+from app.ml import registry
 
 router = APIRouter(prefix="/analyze", tags=["analyze"])
 
@@ -13,6 +29,36 @@ async def analyze(req: AnalyzeRequest, db: AsyncIOMotorDatabase = Depends(get_db
     created = await run_anomaly(db, limit=req.limit)
     return {"alerts_created": created}
 
+@router.post("/window", response_model=dict)
+async def analyze_window(req: AnalyzeWindowRequest, db: AsyncIOMotorDatabase = Depends(get_db)):
+    created = await run_anomaly_window(db, start=req.start, end=req.end, batch_size=req.batch_size)
+    return {"alerts_created": created}
+
+@router.post("/segments/train", response_model=dict)
+async def segments_train(req: SegmentTrainRequest, db: AsyncIOMotorDatabase = Depends(get_db)):
+    return await train_segments(db, by=req.by, limit=req.limit, source=req.source)
+
+@router.post("/segments/run", response_model=dict)
+async def segments_run(req: SegmentRunRequest, db: AsyncIOMotorDatabase = Depends(get_db)):
+    created = await run_anomaly_segmented(db, by=req.by, limit=req.limit)
+    return {"alerts_created": created}
+
+@router.post("/score/{event_id}", response_model=dict)
+async def score_one(event_id: str, by: str = "ngo_id", db: AsyncIOMotorDatabase = Depends(get_db)):
+    return await score_event(db, event_id, by=by)
+
+@router.post("/graph/refresh", response_model=dict)
+async def graph_refresh(req: GraphRefreshRequest, db: AsyncIOMotorDatabase = Depends(get_db)):
+    return await graph_service.refresh(db, rebuild=req.rebuild, batch_size=req.batch_size)
+
+@router.post("/snapshot/refresh", response_model=dict)
+async def snapshot_refresh(req: SnapshotRefreshRequest, db: AsyncIOMotorDatabase = Depends(get_db)):
+    return await snapshot_service.refresh(db, rebuild=req.rebuild, batch_size=req.batch_size)
+
+@router.get("/models", response_model=list[dict])
+async def list_models(by: str | None = None):
+    return await asyncio.to_thread(registry.list_entries, by)
+
 @router.get("/alerts", response_model=list[dict])
 async def list_alerts(db: AsyncIOMotorDatabase = Depends(get_db)):
     items = [a async for a in db.alerts.find().sort([("created_at", -1)]).limit(200)]
@@ -29,11 +29,13 @@
 #     return {"event": ev, "evidence": evidences, "alerts": alerts}
 
 # app/routers/events.py
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
+from fastapi import APIRouter, Body, Depends, HTTPException, status, BackgroundTasks
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from app.deps import get_db
 from app.schemas.event import EventCreate
-from typing import List
+from app.services import geo_service, online_service, reuse_service
+from app.services.events_service import ingest_events
+from typing import Any, List
 
 # Try to import the safe anchoring helper; fall back to a no-op if missing
 try:
@@ -53,8 +55,13 @@ async def create_event(
 ):
     # Persist the raw doc (allows Mongo to keep datetime types)
     doc = payload.model_dump()
+    doc.update(geo_service.geo_fields(doc["gps"]))
     res = await db.events.insert_one(doc)
     await db.events.update_one({"_id": res.inserted_id}, {"$set": {"status": "pending"}})
+    try:
+        await reuse_service.record_claims(db, [doc])
+    except Exception as e:
+        print(f"[reuse] non-fatal: {e}")
 
     # JSON-safe copy for background anchoring (datetimes -> ISO strings)
     event_doc_json = payload.model_dump(mode="json")
@@ -69,9 +76,26 @@ async def create_event(
         except Exception as e:
             print(f"[events-anchor][fallback] non-fatal: {e}")
 
+    if background_tasks is not None:
+        background_tasks.add_task(geo_service.observe_event, db, doc)
+
+    # Online detector learns each event once, at ingestion
+    if online_service.enabled() and background_tasks is not None:
+        background_tasks.add_task(online_service.observe_events, db, [doc])
+
     return {"event_id": str(res.inserted_id), "status": "stored"}
 
 
+@router.post("/bulk", response_model=dict)
+async def create_events_bulk(
+    background_tasks: BackgroundTasks,
+    items: List[Any] = Body(...),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+):
+    """A JSON array of events; invalid items are reported, the rest stored. One result per item."""
+    return await ingest_events(db, items, background_tasks)
+
+
 @router.get("/{event_id}", response_model=dict)
 async def get_event(event_id: str, db: AsyncIOMotorDatabase = Depends(get_db)):
     from bson import ObjectId
@@ -1,10 +1,14 @@
 # app/routers/evidence.py
-from fastapi import APIRouter, Depends, UploadFile, Form
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, File, UploadFile, Form, Query, Request
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from app.deps import get_db
 from app.schemas.evidence import EvidenceUploadOut
-from app.services.evidence_service import save_evidence
+from app.services import blob_service, retention_service, scrub_service
+from app.services.evidence_service import find_evidence_file, get_evidence_file, save_evidence, save_evidence_bulk
 from app.services.ledger_service import verify_ledger
+from app.utils.ranged_file import file_response, not_modified
 
 router = APIRouter(prefix="/evidence", tags=["evidence"])
 
@@ -17,7 +21,72 @@ async def upload_evidence(
 ):
     return await save_evidence(db, event_id, type, blob)
 
+@router.post("/bulk", response_model=dict)
+async def upload_evidence_bulk(
+    event_id: str = Form(...),
+    type: str = Form(...),
+    files: List[UploadFile] = File(...),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+):
+    """Many files and/or .zip / .tar(.gz|.bz2|.xz) archives; one result per file or entry."""
+    return await save_evidence_bulk(db, event_id, type, files)
+
 @router.get("/ledger/verify", response_model=dict)
 async def ledger_verify():
     ok, n = verify_ledger()
     return {"ok": ok, "length": n}
+
+@router.get("/storage", response_model=dict)
+async def storage_usage(db: AsyncIOMotorDatabase = Depends(get_db)):
+    """Blob store size vs bytes referenced by evidence (the dedup saving)."""
+    return await blob_service.usage(db)
+
+@router.post("/storage/gc", response_model=dict)
+async def storage_gc(db: AsyncIOMotorDatabase = Depends(get_db)):
+    return {"removed": await blob_service.gc(db)}
+
+@router.post("/scrub", response_model=dict)
+async def scrub(
+    max_docs: Optional[int] = Query(None, ge=1),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+):
+    """
+    Run (or resume) an integrity pass. With max_docs it runs here and stops
+    at a checkpoint; without, a full pass starts in the background and the
+    status is returned (poll GET /evidence/scrub/status).
+    """
+    if max_docs is None:
+        return await scrub_service.start_pass(db)
+    return await scrub_service.scrub_pass(db, max_docs=max_docs)
+
+@router.get("/scrub/status", response_model=dict)
+async def scrub_status(db: AsyncIOMotorDatabase = Depends(get_db)):
+    return await scrub_service.status(db)
+
+@router.post("/retention", response_model=dict)
+async def retention(db: AsyncIOMotorDatabase = Depends(get_db)):
+    """Apply RETENTION_POLICIES now (tombstone expired evidence, compress cold blobs, gc)."""
+    return await retention_service.retention_pass(db)
+
+@router.api_route("/{evidence_id}/download", methods=["GET", "HEAD"])
+async def download_evidence(
+    evidence_id: str,
+    request: Request,
+    attachment: bool = False,
+    db: AsyncIOMotorDatabase = Depends(get_db),
+):
+    """The stored file. Supports Range and If-None-Match; the ETag is its sha256."""
+    evid = await find_evidence_file(db, evidence_id)
+    if evid.get("sha256") and evid.get("path") and not evid.get("tombstone"):
+        # revalidation: answer before a cold blob is thawed for nothing
+        resp = not_modified(request, evid["sha256"])
+        if resp is not None:
+            return resp
+    evid = await get_evidence_file(db, evidence_id, evid)
+    return await file_response(
+        request,
+        evid["path"],
+        etag=evid["sha256"],
+        filename=evid["filename"],
+        disposition="attachment" if attachment else "inline",
+    )
@@ -1,13 +1,91 @@
 # app/routers/forensics.py
-from fastapi import APIRouter, Depends
+import json
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Query, Request
+from fastapi.responses import StreamingResponse
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from app.deps import get_db
-from app.schemas.evidence import ELARequest, ELAResponse
-from app.services.forensics_service import run_ela
+from app.schemas.evidence import (
+    ELABatchRequest,
+    ELARequest,
+    ELAResponse,
+    ExifCheckRequest,
+    ForensicAnalyzeRequest,
+)
+from app.services import exif_service
+from app.utils.ranged_file import file_response, not_modified
+from app.services.forensics_service import (
+    backfill_phash,
+    cache_stats,
+    ela_map,
+    ela_map_key,
+    find_duplicates,
+    run_analysis,
+    run_ela,
+    run_ela_batch,
+)
 
 router = APIRouter(prefix="/forensics", tags=["forensics"])
 
 @router.post("/ela", response_model=ELAResponse)
 async def ela(req: ELARequest, db: AsyncIOMotorDatabase = Depends(get_db)):
-    res = await run_ela(db, req.evidence_id)
+    res = await run_ela(db, req.evidence_id, write_map=req.write_map, quality=req.quality)
     return ELAResponse(**res)
+
+@router.post("/ela/batch")
+async def ela_batch(req: ELABatchRequest, db: AsyncIOMotorDatabase = Depends(get_db)):
+    """NDJSON stream, one line per evidence item as its ELA completes."""
+    results = await run_ela_batch(
+        db, req.evidence_ids, event_id=req.event_id, write_map=req.write_map, quality=req.quality
+    )
+
+    async def lines():
+        async for res in results:
+            yield json.dumps(res) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+@router.api_route("/ela/{evidence_id}/map", methods=["GET", "HEAD"])
+async def ela_map_download(
+    evidence_id: str,
+    request: Request,
+    quality: int = Query(90, ge=1, le=100),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+):
+    """ELA map PNG (computed on first request). Supports Range and If-None-Match."""
+    evid, key = await ela_map_key(db, evidence_id, quality)
+    # revalidation: answer before the source is thawed or the map recomputed
+    resp = not_modified(request, key)
+    if resp is not None:
+        return resp
+    path = await ela_map(db, evid, key, quality)
+    return await file_response(request, path, etag=key, filename=f"{evidence_id}_ela_q{quality}.png")
+
+@router.post("/analyze", response_model=dict)
+async def analyze(req: ForensicAnalyzeRequest, db: AsyncIOMotorDatabase = Depends(get_db)):
+    """Per-region score maps: multi-quality ELA, 8x8 block grid, noise residual, combined."""
+    return await run_analysis(db, req.evidence_id, qualities=req.qualities)
+
+@router.get("/cache/stats", response_model=dict)
+async def forensic_cache_stats():
+    return await cache_stats()
+
+@router.get("/duplicates/{evidence_id}", response_model=list[dict])
+async def duplicates(
+    evidence_id: str,
+    max_distance: Optional[int] = Query(None, ge=0, le=16),
+    limit: int = Query(50, ge=1, le=1000),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+):
+    """Near-duplicate images (perceptual hash within max_distance bits)."""
+    return await find_duplicates(db, evidence_id, max_distance=max_distance, limit=limit)
+
+@router.post("/phash/backfill", response_model=dict)
+async def phash_backfill(db: AsyncIOMotorDatabase = Depends(get_db)):
+    return {"updated": await backfill_phash(db)}
+
+@router.post("/exif/check", response_model=dict)
+async def exif_check(req: ExifCheckRequest, db: AsyncIOMotorDatabase = Depends(get_db)):
+    """Compare stored EXIF GPS/capture time with the linked events; mismatches become alerts."""
+    return await exif_service.check_all(db, event_id=req.event_id, recheck=req.recheck)
@@ -0,0 +1,40 @@
+# app/routers/geo.py
+from datetime import datetime
+from typing import Literal, Optional
+
+from fastapi import APIRouter, Depends, Query
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from app.deps import get_db
+from app.services import geo_service
+
+router = APIRouter(prefix="/geo", tags=["geo"])
+
+@router.get("/nearby", response_model=list[dict])
+async def nearby(
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    radius_km: float = Query(1.0, gt=0, le=500),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    limit: int = Query(200, ge=1, le=5000),
+    source: Literal["db", "grid"] = "db",
+    db: AsyncIOMotorDatabase = Depends(get_db),
+):
+    # "grid" answers from the in-memory index of recent events without touching Mongo
+    fn = geo_service.nearby_recent if source == "grid" else geo_service.nearby
+    return await fn(db, lat, lon, radius_km, start=start, end=end, limit=limit)
+
+@router.get("/colocated", response_model=list[dict])
+async def colocated(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    min_devices: Optional[int] = Query(None, ge=2),
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+):
+    return await geo_service.colocated(db, start=start, end=end, min_devices=min_devices, limit=limit)
+
+@router.post("/backfill", response_model=dict)
+async def backfill(db: AsyncIOMotorDatabase = Depends(get_db)):
+    return {"updated": await geo_service.backfill(db)}
@@ -1,10 +1,33 @@
 # app/schemas/alert.py
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional, Literal
+from datetime import datetime
 
 class AnalyzeRequest(BaseModel):
     limit: int = 200
 
+class AnalyzeWindowRequest(BaseModel):
+    start: Optional[datetime] = None
+    end: Optional[datetime] = None
+    batch_size: Optional[int] = None
+
+class SegmentTrainRequest(BaseModel):
+    by: Literal["ngo_id", "donor_id"] = "ngo_id"
+    limit: int = 50000
+    source: Literal["mongo", "snapshot"] = "mongo"
+
+class SnapshotRefreshRequest(BaseModel):
+    rebuild: bool = False
+    batch_size: Optional[int] = None
+
+class SegmentRunRequest(BaseModel):
+    by: Literal["ngo_id", "donor_id"] = "ngo_id"
+    limit: int = 200
+
+class GraphRefreshRequest(BaseModel):
+    rebuild: bool = False
+    batch_size: Optional[int] = None
+
 class AlertOut(BaseModel):
     alert_id: str
     event_id: str
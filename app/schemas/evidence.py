@@ -1,16 +1,39 @@
 # app/schemas/evidence.py
-from pydantic import BaseModel
-from typing import Literal
+from pydantic import BaseModel, Field
+from typing import Annotated, List, Literal, Optional
 
 class EvidenceUploadOut(BaseModel):
     evidence_id: str
     sha256: str
     ledger_index: int
     status: str
+    deduplicated: bool = False  # identical content was already stored
 
 class ELARequest(BaseModel):
     evidence_id: str
+    write_map: bool = True  # save the ELA PNG; False only returns the score
+    quality: int = Field(default=90, ge=1, le=100)  # JPEG re-save quality
 
 class ELAResponse(BaseModel):
-    ela_path: str
+    ela_path: Optional[str] = None
     suspicion: float
+    width: Optional[int] = None  # analysed size; smaller than the file when scale < 1
+    height: Optional[int] = None
+    scale: float = 1.0
+    heatmap: Optional[List[List[float]]] = None  # per-tile suspicion, rows x cols
+    cached: bool = False  # served from the forensic result cache
+
+class ELABatchRequest(BaseModel):
+    evidence_ids: List[str] = []
+    event_id: Optional[str] = None  # also analyze every image evidence of this event
+    write_map: bool = True
+    quality: int = Field(default=90, ge=1, le=100)
+
+class ExifCheckRequest(BaseModel):
+    event_id: Optional[str] = None  # limit to one event's evidence
+    recheck: bool = False  # also re-check evidence checked before
+
+class ForensicAnalyzeRequest(BaseModel):
+    evidence_id: str
+    # ELA re-save qualities; each one costs a JPEG round trip
+    qualities: List[Annotated[int, Field(ge=1, le=100)]] = Field(default=[75, 85, 95], min_length=1, max_length=6)
@@ -0,0 +1,48 @@
+# app/services/alert_service.py
+"""
+Keyed alerts: one document per finding instead of one per detection.
+
+Detectors that re-check the same thing on every run (a ring, a shared
+device, a spoofed coordinate) give each alert an `alert_key` (unique,
+sparse index in app/db/indexes.py). upsert_alerts() inserts keys it hasn't
+seen; an existing alert is only updated, and reopened, when one of the
+given fields changed, so a routine event doesn't raise the same alert
+again.
+"""
+
+from datetime import datetime
+from typing import Any, Dict, Iterable, List
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+
+async def upsert_alerts(db: AsyncIOMotorDatabase, docs: List[Dict[str, Any]], compare: Iterable[str]) -> int:
+    """Insert new alert_keys, refresh those whose `compare` fields changed; returns alerts created or reopened."""
+    if not docs:
+        return 0
+    compare = tuple(compare)
+    by_key = {d["alert_key"]: d for d in docs}
+    fields = {"_id": 0, "alert_key": 1, **dict.fromkeys(compare, 1)}
+    known = {a["alert_key"]: a async for a in db.alerts.find({"alert_key": {"$in": list(by_key)}}, fields)}
+    new = [d for k, d in by_key.items() if k not in known]
+    now = datetime.utcnow()
+    ops = [
+        UpdateOne(
+            {"alert_key": k},
+            {"$set": {**{f: v for f, v in d.items() if f != "created_at"}, "status": "open", "updated_at": now}},
+        )
+        for k, d in by_key.items()
+        if k in known and any(known[k].get(f) != d.get(f) for f in compare)
+    ]
+    created = len(new)
+    if new:
+        try:
+            await db.alerts.insert_many(new, ordered=False)
+        except BulkWriteError as e:
+            # raised concurrently by another worker: the unique index keeps one
+            created -= len(e.details.get("writeErrors", []))
+    if ops:
+        await db.alerts.bulk_write(ops, ordered=False)
+    return created + len(ops)
@@ -1,21 +1,43 @@
 # app/services/analyze_service.py
+import asyncio
+import functools
 from datetime import datetime
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, AsyncIterator
 from motor.motor_asyncio import AsyncIOMotorDatabase
+from fastapi import HTTPException, status
 import numpy as np
 from sklearn.ensemble import IsolationForest
-from app.utils.features import build_features
+from app.config import settings
+from app.utils.features import build_features, ANALYSIS_FIELDS
+from app.ml.anomaly import (
+    train_iforest,
+    anomaly_scores,
+    heuristic_scores,
+    threshold_by_percentile,
+    alerts_from_scores,
+    derive_reasons_from_features,
+)
+from app.ml import registry
+from app.ml.reuse import reuse_reasons_for_events
+from app.ml.segments import group_codes, group_rows, train_segment_models, score_by_segment
+from app.services.threshold_service import load_sketch, record_scores, thresholds
+from app.services import online_service, reuse_service, snapshot_service
+from app.services.trajectory_service import previous_fixes
 
 async def run_anomaly(db: AsyncIOMotorDatabase, limit: int = 200) -> int:
+    if online_service.enabled():
+        return await online_service.run_latest(db, limit=limit)
     cur = db.events.find().sort([("timestamp", -1)]).limit(limit)
     events = [e async for e in cur]
     if not events:
         return 0
 
     X, meta = build_features(events)
-    if not X:
+    if len(X) == 0:
         return 0
 
+    extra = await reuse_service.reuse_reasons(db, events)
+
     clf = IsolationForest(random_state=42, contamination=0.03)
     clf.fit(X)
     scores = -clf.score_samples(X)
@@ -23,12 +45,10 @@ async def run_anomaly(db: AsyncIOMotorDatabase, limit: int = 200) -> int:
 
     created = 0
     for eid, s, feat in zip(meta, scores, X):
-        qty, hour, jump, uniq_b = feat
-        reasons = []
-        if qty > 240:
-            reasons.append("surge_volume")
-        if jump > 500:
-            reasons.append("impossible_route")
+        # same surge / speed-based route rules as the library, without the weak signals
+        reasons = [
+            r for r in derive_reasons_from_features(feat) if r in ("surge_volume", "impossible_route")
+        ] + extra.get(eid, [])
         if s >= thr or reasons:
             alert = {
                 "event_id": eid,
@@ -41,3 +61,268 @@ async def run_anomaly(db: AsyncIOMotorDatabase, limit: int = 200) -> int:
             await db.alerts.insert_one(alert)
             created += 1
     return created
+
+
+# ------------------------------
+# Streaming window analysis
+# ------------------------------
+
+def _window_query(start: Optional[datetime], end: Optional[datetime]) -> Dict[str, Any]:
+    rng: Dict[str, Any] = {}
+    if start is not None:
+        rng["$gte"] = start
+    if end is not None:
+        rng["$lt"] = end
+    return {"timestamp": rng} if rng else {}
+
+async def _iter_event_chunks(
+    db: AsyncIOMotorDatabase, query: Dict[str, Any], batch_size: int
+) -> AsyncIterator[List[Dict[str, Any]]]:
+    """Yield time-ordered lists of at most `batch_size` events (served by the timestamp index)."""
+    cur = (
+        db.events.find(query, ANALYSIS_FIELDS)
+        .sort([("timestamp", 1)])
+        .batch_size(batch_size)
+    )
+    chunk: List[Dict[str, Any]] = []
+    async for ev in cur:
+        chunk.append(ev)
+        if len(chunk) >= batch_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+async def run_anomaly_window(
+    db: AsyncIOMotorDatabase,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    batch_size: Optional[int] = None,
+    fit_sample_size: Optional[int] = None,
+    min_samples_for_model: int = 20,
+) -> int:
+    """
+    Analyse every event in [start, end) in bounded memory.
+
+    Two passes over a batched, projected cursor:
+      1. build features chunk by chunk and keep a fixed-size reservoir sample
+         to fit the model and derive p97/p99 thresholds;
+      2. re-stream, score each chunk and insert its alerts.
+    Memory is O(batch_size + fit_sample_size + #devices) regardless of range.
+    """
+    batch_size = batch_size or settings.ANALYZE_BATCH_SIZE
+    fit_sample_size = fit_sample_size or settings.ANALYZE_FIT_SAMPLE_SIZE
+    query = _window_query(start, end)
+
+    # Pass 1: reservoir sample of feature rows (Algorithm R, vectorised per chunk)
+    rng = np.random.default_rng(42)
+    sample: Optional[np.ndarray] = None
+    seen = 0
+    dev_last: Dict[str, tuple] = {}
+    seeds: Dict[str, tuple] = {}
+    async for chunk in _iter_event_chunks(db, query, batch_size):
+        if start is not None:
+            # devices entering the window continue from their last fix before it
+            fresh = [ev for ev in chunk if ev["device_id"] not in dev_last]
+            new_seeds = await previous_fixes(db, fresh, carry={})
+            seeds.update(new_seeds)
+            dev_last.update(new_seeds)
+        X, _ = build_features(chunk, dev_last)
+        X_arr = np.asarray(X, dtype=float)
+        if sample is None:
+            sample = np.empty((fit_sample_size, X_arr.shape[1]), dtype=float)
+        n = len(X_arr)
+        pos = seen + np.arange(n)
+        fill = pos < fit_sample_size
+        sample[pos[fill]] = X_arr[fill]
+        rest = ~fill
+        if rest.any():
+            j = rng.integers(0, pos[rest] + 1)
+            keep = j < fit_sample_size
+            sample[j[keep]] = X_arr[rest][keep]
+        seen += n
+
+    if sample is None or seen == 0:
+        return 0
+    sample = sample[: min(seen, fit_sample_size)]
+
+    if len(sample) >= min_samples_for_model:
+        model = train_iforest(sample)
+        score = lambda X: anomaly_scores(model, X)  # noqa: E731
+    else:
+        score = heuristic_scores
+    sample_scores = score(sample)
+    thr97 = threshold_by_percentile(sample_scores, 97.0)
+    thr99 = threshold_by_percentile(sample_scores, 99.0)
+    del sample, sample_scores
+
+    # Pass 2: score chunk by chunk against the fixed thresholds; the in-memory
+    # beneficiary index carries claims across chunks and is pruned to its window
+    created = 0
+    dev_last = dict(seeds)
+    reuse_idx = reuse_service.new_index()
+    async for chunk in _iter_event_chunks(db, query, batch_size):
+        X, meta = build_features(chunk, dev_last)
+        extra = reuse_reasons_for_events(chunk, index=reuse_idx)
+        alerts = alerts_from_scores(meta, X, score(X), thr97, thr99, extra_reasons=extra)
+        if not alerts:
+            continue
+        now = datetime.utcnow()
+        for a in alerts:
+            a.update({"created_at": now, "status": "open"})
+        await db.alerts.insert_many(alerts, ordered=False)
+        created += len(alerts)
+    return created
+
+
+# ------------------------------
+# Per-segment (NGO / donor) models
+# ------------------------------
+
+async def _latest_events(db: AsyncIOMotorDatabase, by: str, limit: int) -> List[Dict[str, Any]]:
+    projection = {**ANALYSIS_FIELDS, by: 1}
+    cur = db.events.find({}, projection).sort([("timestamp", -1)]).limit(limit)
+    return [e async for e in cur]
+
+async def _segment_version(by: str, seg: str) -> tuple:
+    """(model, model_version) for a segment; unregistered segments score heuristically."""
+    # a first access unpickles the model from disk
+    entry = await asyncio.to_thread(registry.get, by, seg)
+    if entry is None:
+        return None, "heuristic"
+    return entry["model"], registry.model_version(entry)
+
+async def _segment_thresholds(
+    db: AsyncIOMotorDatabase, by: str, seg: str, scores: np.ndarray
+) -> tuple:
+    """The segment's (thr97, thr99) from its sketch (seeded once, at training)."""
+    _, version = await _segment_version(by, seg)
+    thr = thresholds(await load_sketch(db, version, f"{by}:{seg}"))
+    if thr is None:
+        # sketch still warming up: fall back to this batch's percentiles
+        thr = (threshold_by_percentile(scores, 97.0), threshold_by_percentile(scores, 99.0))
+    return thr
+
+async def _snapshot_training_set(db: AsyncIOMotorDatabase, by: str, limit: int) -> tuple:
+    """(X, groups) for the latest `limit` events, read from the columnar snapshot."""
+    try:
+        await snapshot_service.refresh(db)
+    except HTTPException as e:
+        if e.status_code != status.HTTP_409_CONFLICT:
+            raise
+        # another worker is refreshing: train on what it has committed so far
+    store = await snapshot_service.current()
+    lo = max(0, store.count - limit)
+    X, _ = await asyncio.to_thread(store.features, lo)
+    col = "ngo" if by == "ngo_id" else "donor"
+    return X, group_codes(store.column(col)[lo:], store.names(col))
+
+async def train_segments(
+    db: AsyncIOMotorDatabase, by: str = "ngo_id", limit: int = 50000, source: str = "mongo"
+) -> dict:
+    """
+    Fit one model per `by` segment in a process pool and store them in the registry.
+    Training runs off the event loop so the API stays responsive; each new model
+    version's score sketch is seeded with its training scores.
+
+    source="snapshot" reads features from the memory-mapped columnar snapshot
+    (refreshed first) instead of decoding events from Mongo.
+    """
+    if source == "snapshot":
+        X, groups = await _snapshot_training_set(db, by, limit)
+        segments = None
+    else:
+        events = await _latest_events(db, by, limit)
+        seg_of = {ev["_id"]: ev.get(by) for ev in events}
+        X, meta = build_features(events)
+        segments = [seg_of[eid] for eid in meta]
+        groups = group_rows(segments)
+    if len(X) == 0:
+        return {"segments": 0, "models": 0, "heuristic": 0}
+
+    loop = asyncio.get_running_loop()
+    models = await loop.run_in_executor(
+        None,
+        functools.partial(
+            train_segment_models,
+            X,
+            segments,
+            min_samples=settings.SEGMENT_MIN_SAMPLES,
+            max_workers=settings.SEGMENT_MAX_WORKERS or None,
+            groups=groups,
+        ),
+    )
+    for seg, model in models.items():
+        entry = await asyncio.to_thread(registry.register, by, seg, model, n_samples=len(groups[seg]))
+        Xs = X[groups[seg]]
+        seed = anomaly_scores(model, Xs) if model is not None else heuristic_scores(Xs)
+        await record_scores(db, registry.model_version(entry), f"{by}:{seg}", seed)
+    n_models = sum(1 for m in models.values() if m is not None)
+    return {"segments": len(models), "models": n_models, "heuristic": len(models) - n_models}
+
+async def run_anomaly_segmented(db: AsyncIOMotorDatabase, by: str = "ngo_id", limit: int = 200) -> int:
+    """
+    Score the latest events, routing each to its segment's registered model.
+    Severity thresholds come from the per-segment score sketches, which are
+    seeded with each model version's training scores; scoring only reads
+    them, so repeated runs over the same events don't skew the percentiles.
+    """
+    events = await _latest_events(db, by, limit)
+    if not events:
+        return 0
+    seg_of = {ev["_id"]: ev.get(by) for ev in events}
+    X, meta = build_features(events)
+    segments = [seg_of[eid] for eid in meta]
+    models = {str(seg): (await _segment_version(by, str(seg)))[0] for seg in set(segments)}
+    scores, groups = score_by_segment(X, segments, models)
+    extra = await reuse_service.reuse_reasons(db, events)
+
+    alerts: List[Dict[str, Any]] = []
+    for seg, idx in groups.items():
+        thr97, thr99 = await _segment_thresholds(db, by, seg, scores[idx])
+        alerts.extend(
+            alerts_from_scores(
+                [meta[i] for i in idx], X[idx], scores[idx], thr97, thr99, extra_reasons=extra
+            )
+        )
+    if not alerts:
+        return 0
+    now = datetime.utcnow()
+    for a in alerts:
+        a.update({"created_at": now, "status": "open", "segment": by})
+    await db.alerts.insert_many(alerts, ordered=False)
+    return len(alerts)
+
+async def score_event(db: AsyncIOMotorDatabase, event_id: str, by: str = "ngo_id") -> dict:
+    """
+    Online scoring of one stored event against its segment model and sketch thresholds.
+    The device's previous fix is read via the (device_id, timestamp) index so the
+    GPS jump and speed match what a batch run would compute.
+    """
+    from bson import ObjectId
+    try:
+        ev = await db.events.find_one({"_id": ObjectId(event_id)})
+    except Exception:
+        ev = await db.events.find_one({"_id": event_id})
+    if not ev:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not found")
+
+    dev_last = await previous_fixes(db, [ev])
+    X, meta = build_features([ev], dev_last)
+
+    seg = str(ev.get(by))
+    model, version = await _segment_version(by, seg)
+    scores = anomaly_scores(model, X) if model is not None else heuristic_scores(X)
+    # read only: re-scoring an event must not count it in the sketch again
+    thr = thresholds(await load_sketch(db, version, f"{by}:{seg}"))
+    thr97, thr99 = thr if thr is not None else (float("inf"), float("inf"))
+    extra = await reuse_service.reuse_reasons(db, [ev])
+    alerts = alerts_from_scores(meta, X, scores, thr97, thr99, extra_reasons=extra)
+    return {
+        "event_id": str(ev["_id"]),
+        "model_version": version,
+        "score": float(scores[0]),
+        "severity": alerts[0]["severity"] if alerts else 0,
+        "reasons": alerts[0]["reasons"] if alerts else [],
+        "thresholds": {"p97": thr97, "p99": thr99} if thr is not None else None,
+    }
@@ -0,0 +1,400 @@
+# app/services/blob_service.py
+"""
+Content-addressable store for evidence files.
+
+A file lives once at storage/blobs/<sha[0:2]>/<sha[2:4]>/<sha>, however
+many evidence documents refer to it; two shard levels keep every directory
+small (65,536 leaves) as the store grows. No client-supplied name is part
+of the path, so uploads can't collide with or overwrite each other.
+
+The `blobs` collection ({_id: sha256, path, size, refcount, created_at,
+released_at}) counts references from evidence documents. store() takes a
+reference and moves the temp file into place when its record is new;
+release() drops one. Blobs at refcount 0 stay on disk for
+BLOB_GC_GRACE_HOURS (a re-upload in that window revives them) before gc()
+deletes them.
+
+gc() first claims a record ({gc_pending: <time>}, only at refcount 0),
+then deletes the file, then the record. store() never references a claimed
+record: it waits until gc() has deleted it and then stores the content as
+a new blob, so an upload racing a collection can't end up pointing at a
+file gc() is about to remove. A claim older than GC_CLAIM_TTL_S (gc()
+died mid-delete) is dropped by the next store().
+
+Cold tier: compress() gzips a blob to <path>.gz (kept as is when a sample
+shows gzip wouldn't save COMPRESS_MIN_SAVING, e.g. JPEG / MP4), repoints
+the blob and its evidence documents and sets tier "cold". Readers call
+ensure_hot() first, which decompresses the blob back in place; an upload
+of the same content warms it too.
+
+Tier changes of one blob are serialised across workers by the
+"thaw:<sha>" lease (app/services/lease_service.py). Only gzipping runs
+outside it: compress() first marks the blob tier "compressing", and
+commits the cold tier under the lease only if the blob is still in that
+state. An upload meanwhile sets it hot, which aborts the compression. The
+plain file of a cold blob stays for COLD_PLAIN_GRACE_S, so a reader that
+looked up the old path before the repoint can still open it;
+drop_stale_plain() removes it afterwards.
+"""
+
+import asyncio
+import contextlib
+import gzip
+import os
+import re
+import tempfile
+import zlib
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from app.config import settings
+from app.services.lease_service import Lease
+from app.utils.throttle import Throttle
+
+BLOB_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "storage", "blobs"))
+COLD_EXT = ".gz"
+COMPRESS_MIN_SAVING = 0.1  # fraction of the sample gzip must save
+COMPRESS_SAMPLE = 1 << 20
+CHUNK_SIZE = 1 << 20
+GC_CLAIM_TTL_S = 60.0
+COMPRESS_CLAIM_TTL_S = 3600.0  # a "compressing" mark older than this is from a pass that died
+COLD_PLAIN_GRACE_S = 3600.0
+WARMABLE = ["cold", "compressing"]  # tiers an upload warms
+
+
+def blob_path(sha256: str) -> str:
+    return os.path.join(BLOB_DIR, sha256[:2], sha256[2:4], sha256)
+
+
+def is_cold(path: str) -> bool:
+    return path.endswith(COLD_EXT)
+
+
+def _place(tmp: str, dest: str, new: bool) -> bool:
+    """Move tmp into place for a new record (or a missing file), else drop it; True if placed."""
+    if not new and os.path.exists(dest):
+        os.remove(tmp)
+        return False
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    os.replace(tmp, dest)
+    return True
+
+
+def _ref_update(n: int, size: int, now: datetime) -> Dict[str, Any]:
+    return {
+        "$inc": {"refcount": n},
+        "$setOnInsert": {"size": size, "created_at": now},
+        "$unset": {"released_at": ""},
+    }
+
+
+async def _ref(db: AsyncIOMotorDatabase, sha256: str, n: int, size: int) -> Optional[Dict[str, Any]]:
+    """Take n references; the record as it was before (None if it is new). Waits out a gc() of it."""
+    while True:
+        now = datetime.utcnow()
+        update = _ref_update(n, size, now)
+        update["$setOnInsert"]["path"] = blob_path(sha256)
+        try:
+            return await db.blobs.find_one_and_update(
+                {"_id": sha256, "gc_pending": {"$exists": False}},
+                update,
+                upsert=True,
+                return_document=ReturnDocument.BEFORE,
+            )
+        except DuplicateKeyError:
+            # claimed by gc(): it is deleting the file, then the record
+            pass
+        b = await db.blobs.find_one({"_id": sha256}, {"gc_pending": 1})
+        if b and b.get("gc_pending") and (now - b["gc_pending"]).total_seconds() > GC_CLAIM_TTL_S:
+            await db.blobs.delete_one({"_id": sha256, "gc_pending": b["gc_pending"]})
+        else:
+            await asyncio.sleep(0.05)
+
+
+@contextlib.asynccontextmanager
+async def _tier_lease(db: AsyncIOMotorDatabase, sha256: str):
+    """Hold the "thaw:<sha>" lease, waiting for another worker's tier change to finish."""
+    lease = Lease(db, f"thaw:{sha256}")
+    while not await lease.acquire():
+        await asyncio.sleep(0.05)
+    try:
+        yield lease
+    finally:
+        await lease.release()
+        # one lease document per blob would pile up; a new holder upserts it again
+        await db.leases.delete_one({"_id": lease.name, "holder": None})
+
+
+async def _warm(db: AsyncIOMotorDatabase, sha256: str, tmps: List[str]) -> None:
+    # the upload is the blob's content: warm it without decompressing
+    async with _tier_lease(db, sha256):
+        await asyncio.to_thread(lambda: [_place(t, blob_path(sha256), i == 0) for i, t in enumerate(tmps)])
+        await _set_hot(db, sha256)
+
+
+async def store(db: AsyncIOMotorDatabase, tmp: str, sha256: str, size: int) -> Dict[str, Any]:
+    """Add a reference to the blob with this content, storing tmp if it is new."""
+    dest = blob_path(sha256)
+    # reference first: gc() only claims blobs at refcount 0
+    before = await _ref(db, sha256, 1, size)
+    if before is not None and before.get("tier") in WARMABLE:
+        await _warm(db, sha256, [tmp])
+    else:
+        await asyncio.to_thread(_place, tmp, dest, before is None)
+    return {"path": dest, "deduplicated": before is not None}
+
+
+async def store_many(db: AsyncIOMotorDatabase, items: List[Tuple[str, str, int]]) -> List[Dict[str, Any]]:
+    """store() for many (tmp, sha256, size): one bulk upsert, then every move in one worker thread."""
+    if not items:
+        return []
+    now = datetime.utcnow()
+    refs = Counter(sha for _, sha, _ in items)
+    sizes = {sha: size for _, sha, size in items}
+    shas = list(refs)
+    ops = []
+    for sha in shas:
+        update = _ref_update(refs[sha], sizes[sha], now)
+        update["$setOnInsert"]["path"] = blob_path(sha)
+        ops.append(UpdateOne({"_id": sha, "gc_pending": {"$exists": False}}, update, upsert=True))
+    try:
+        res = await db.blobs.bulk_write(ops, ordered=False)
+        new, claimed = set(res.upserted_ids.values()), []
+    except BulkWriteError as e:
+        new = {u["_id"] for u in e.details.get("upserted", [])}
+        claimed = [shas[err["index"]] for err in e.details.get("writeErrors", [])]
+    for sha in claimed:
+        # being collected right now: wait for gc() like store() does
+        if await _ref(db, sha, refs[sha], sizes[sha]) is None:
+            new.add(sha)
+    warm = {b["_id"] async for b in db.blobs.find({"_id": {"$in": shas}, "tier": {"$in": WARMABLE}}, {"_id": 1})}
+
+    def place_all() -> List[bool]:
+        # the first copy of a new blob is placed, later ones are dropped; cold ones are _warm()'s
+        placed, fresh = [], set(new)
+        for tmp, sha, _ in items:
+            placed.append(sha not in warm and _place(tmp, blob_path(sha), sha in fresh))
+            fresh.discard(sha)
+        return placed
+
+    placed = await asyncio.to_thread(place_all)
+    for sha in warm:
+        await _warm(db, sha, [tmp for tmp, s, _ in items if s == sha])
+    # only the first copy of a blob that didn't exist before is not a duplicate
+    return [
+        {"path": blob_path(sha), "deduplicated": not (p and sha in new)} for (_, sha, _), p in zip(items, placed)
+    ]
+
+
+async def release(db: AsyncIOMotorDatabase, sha256: str) -> None:
+    """Drop one reference; the file is left for gc() once unreferenced."""
+    await db.blobs.update_one({"_id": sha256, "refcount": {"$gt": 0}}, {"$inc": {"refcount": -1}})
+    await db.blobs.update_one(
+        {"_id": sha256, "refcount": {"$lte": 0}, "released_at": {"$exists": False}},
+        {"$set": {"released_at": datetime.utcnow()}},
+    )
+
+
+def _worth_compressing(path: str) -> bool:
+    with open(path, "rb") as f:
+        sample = f.read(COMPRESS_SAMPLE)
+    return bool(sample) and len(zlib.compress(sample, 6)) <= len(sample) * (1 - COMPRESS_MIN_SAVING)
+
+
+def _tmp_for(dest: str) -> tuple:
+    # unique per writer: two workers never write the same temp file
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(dest), prefix=os.path.basename(dest) + ".", suffix=".part")
+    return os.fdopen(fd, "wb"), tmp
+
+
+def _gzip(src: str, dest: str, throttle: Throttle) -> int:
+    raw, tmp = _tmp_for(dest)
+    try:
+        with open(src, "rb") as fin, raw:
+            with gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=6, mtime=0) as fout:
+                for chunk in iter(lambda: fin.read(CHUNK_SIZE), b""):
+                    throttle.take(len(chunk))
+                    fout.write(chunk)
+            raw.flush()
+            os.fsync(raw.fileno())
+        os.replace(tmp, dest)
+    except BaseException:
+        _remove(tmp)
+        raise
+    return os.path.getsize(dest)
+
+
+def _gunzip(src: str, dest: str) -> None:
+    fout, tmp = _tmp_for(dest)
+    try:
+        with gzip.open(src, "rb") as fin, fout:
+            for chunk in iter(lambda: fin.read(CHUNK_SIZE), b""):
+                fout.write(chunk)
+            fout.flush()
+            os.fsync(fout.fileno())
+        os.replace(tmp, dest)
+    except BaseException:
+        _remove(tmp)
+        raise
+
+
+async def _repoint(db: AsyncIOMotorDatabase, sha256: str, path: str, tier: Optional[str]) -> None:
+    # live evidence in the blob store only; tombstones have no path, and
+    # legacy files outside it may have been hashed to the same sha256 later
+    if tier:
+        update: Dict[str, Any] = {"$set": {"path": path, "storage_tier": tier}}
+    else:
+        update = {"$set": {"path": path}, "$unset": {"storage_tier": ""}}
+    q = {"sha256": sha256, "tombstone": {"$exists": False}, "path": {"$regex": "^" + re.escape(BLOB_DIR + os.sep)}}
+    await db.evidence.update_many(q, update)
+
+
+async def compress(db: AsyncIOMotorDatabase, sha256: str, throttle: Throttle) -> Optional[int]:
+    """Move a blob to the cold tier; bytes saved (0 if gzip wouldn't help), None if not applicable."""
+    now = datetime.utcnow()
+    # claim: uploads seeing "compressing" set the blob hot again, which aborts this
+    b = await db.blobs.find_one_and_update(
+        {
+            "_id": sha256,
+            "refcount": {"$gt": 0},
+            "gc_pending": {"$exists": False},
+            "$or": [
+                {"tier": {"$nin": WARMABLE}},
+                {"tier": "compressing", "compressing_at": {"$lt": now - timedelta(seconds=COMPRESS_CLAIM_TTL_S)}},
+            ],
+        },
+        {"$set": {"tier": "compressing", "compressing_at": now}},
+    )
+    if b is None:
+        return None
+    src = b["path"]
+    try:
+        worth = await asyncio.to_thread(_worth_compressing, src)
+        dest = src + COLD_EXT
+        stored = await asyncio.to_thread(_gzip, src, dest, throttle) if worth else None
+    except BaseException:
+        await db.blobs.update_one({"_id": sha256, "tier": "compressing", "compressing_at": now}, {"$set": {"tier": "hot"}})
+        raise
+
+    async with _tier_lease(db, sha256):
+        if worth:
+            # the plain file goes in drop_stale_plain() once the grace period is over
+            grace = now + timedelta(seconds=COLD_PLAIN_GRACE_S)
+            update = {"path": dest, "compressed": True, "stored_size": stored, "drop_plain_after": grace}
+        else:
+            # already-compressed formats stay as they are, but count as cold (not retried)
+            update = {"compressed": False}
+        res = await db.blobs.update_one(
+            {"_id": sha256, "tier": "compressing", "compressing_at": now},
+            {
+                "$set": {"tier": "cold", "cold_at": now, **update},
+                "$unset": {"compressing_at": ""},
+            },
+        )
+        if res.matched_count == 0:
+            # warmed by an upload (or collected) meanwhile
+            if worth:
+                await asyncio.to_thread(_remove, dest)
+            return None
+        await _repoint(db, sha256, update.get("path", src), "cold")
+    return b["size"] - stored if worth else 0
+
+
+async def drop_stale_plain(db: AsyncIOMotorDatabase) -> int:
+    """Remove plain files of cold blobs whose grace period is over; returns files removed."""
+    removed = 0
+    q = {"tier": "cold", "drop_plain_after": {"$lt": datetime.utcnow()}}
+    async for b in db.blobs.find(q, {"_id": 1}):
+        async with _tier_lease(db, b["_id"]):
+            # re-check under the lease: a reader or upload may have warmed it
+            res = await db.blobs.update_one({**q, "_id": b["_id"]}, {"$unset": {"drop_plain_after": ""}})
+            if res.modified_count:
+                await asyncio.to_thread(_remove, blob_path(b["_id"]))
+                removed += 1
+    return removed
+
+
+async def _set_hot(db: AsyncIOMotorDatabase, sha256: str) -> None:
+    """Mark a blob whose plain file is in place as hot again and drop its .gz."""
+    hot = blob_path(sha256)
+    await db.blobs.update_one(
+        {"_id": sha256},
+        {
+            "$set": {"path": hot, "tier": "hot", "last_access": datetime.utcnow()},
+            "$unset": {"compressed": "", "stored_size": "", "cold_at": "", "compressing_at": "", "drop_plain_after": ""},
+        },
+    )
+    await _repoint(db, sha256, hot, None)
+    await asyncio.to_thread(_remove, hot + COLD_EXT)
+
+
+async def ensure_hot(db: AsyncIOMotorDatabase, sha256: str, path: str) -> str:
+    """Readable plain path of an evidence file, decompressing a cold blob first."""
+    if not is_cold(path):
+        return path
+    async with _tier_lease(db, sha256):
+        b = await db.blobs.find_one({"_id": sha256}, {"path": 1, "drop_plain_after": 1})
+        if b is None:
+            raise FileNotFoundError(path)
+        hot = blob_path(sha256)
+        if is_cold(b["path"]):
+            # within the grace period the plain file is still there
+            if not (b.get("drop_plain_after") and os.path.exists(hot)):
+                await asyncio.to_thread(_gunzip, b["path"], hot)
+            await _set_hot(db, sha256)
+    return blob_path(sha256)
+
+
+def _remove(path: str) -> None:
+    if os.path.exists(path):
+        os.remove(path)
+
+
+async def gc(db: AsyncIOMotorDatabase, grace_hours: Optional[float] = None) -> int:
+    """Delete blobs unreferenced for longer than the grace period; returns blobs removed."""
+    grace = settings.BLOB_GC_GRACE_HOURS if grace_hours is None else grace_hours
+    cutoff = datetime.utcnow() - timedelta(hours=grace)
+    removed = 0
+    q = {"refcount": {"$lte": 0}, "released_at": {"$lt": cutoff}, "gc_pending": {"$exists": False}}
+    async for b in db.blobs.find(q, {"_id": 1}):
+        # claim first: from here on store() waits instead of referencing the record
+        claim = datetime.utcnow()
+        b = await db.blobs.find_one_and_update(
+            {"_id": b["_id"], "refcount": {"$lte": 0}, "gc_pending": {"$exists": False}},
+            {"$set": {"gc_pending": claim}},
+            projection={"path": 1},
+        )
+        if b is None:
+            continue  # revived in the meantime
+        hot = blob_path(b["_id"])
+        await asyncio.to_thread(lambda: [_remove(p) for p in {b["path"], hot, hot + COLD_EXT}])
+        await db.blobs.delete_one({"_id": b["_id"], "gc_pending": claim})
+        removed += 1
+    return removed
+
+
+async def usage(db: AsyncIOMotorDatabase) -> Dict[str, Any]:
+    """Stored vs referenced bytes (the difference is what deduplication and compression save)."""
+    cur = db.blobs.aggregate(
+        [
+            {
+                "$group": {
+                    "_id": None,
+                    "blobs": {"$sum": 1},
+                    "stored_bytes": {"$sum": {"$ifNull": ["$stored_size", "$size"]}},
+                    "cold_blobs": {"$sum": {"$cond": [{"$eq": ["$tier", "cold"]}, 1, 0]}},
+                    "referenced_bytes": {"$sum": {"$multiply": ["$size", "$refcount"]}},
+                    "references": {"$sum": "$refcount"},
+                }
+            }
+        ]
+    )
+    rows = [r async for r in cur]
+    out = rows[0] if rows else {"blobs": 0, "stored_bytes": 0, "cold_blobs": 0, "referenced_bytes": 0, "references": 0}
+    out.pop("_id", None)
+    return out
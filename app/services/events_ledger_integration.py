@@ -8,11 +8,18 @@ It will:
 Any failure is swallowed and logged, so it can't break your /events endpoint.
 """
 
-from typing import Dict, Any
-from app.services.events_ledger_service import append_event_ledger
+from typing import Dict, Any, List
+from app.services.events_ledger_service import append_event_ledger, append_event_ledger_many
 
 def safe_anchor_event(event_doc: Dict[str, Any]) -> None:
     try:
         append_event_ledger(event_doc)
     except Exception as e:
         print(f"[safe_anchor_event] non-fatal: {e}")
+
+def safe_anchor_events(event_docs: List[Dict[str, Any]]) -> None:
+    """safe_anchor_event for a batch, appended to the ledger as one group."""
+    try:
+        append_event_ledger_many(event_docs)
+    except Exception as e:
+        print(f"[safe_anchor_events] non-fatal: {e}")
@@ -306,6 +306,60 @@ def append_event_ledger(event_doc: Dict[str, Any]) -> dict:
 
     return rec
 
+def append_event_ledger_many(event_docs: List[Dict[str, Any]]) -> List[dict]:
+    """
+    append_event_ledger for a batch: one read of the last record, one write
+    and a single anchor of the group's last record_hash (it commits to every
+    record before it).
+    """
+    if not event_docs:
+        return []
+    _ensure_dirs()
+
+    last = _read_last_record()
+    prev = last["record_hash"] if last else "GENESIS"
+    index = int(last["index"]) + 1 if last else 0
+    ts = datetime.utcnow().isoformat() + "Z"
+
+    recs = []
+    for ev in event_docs:
+        base = {
+            "index": index,
+            "timestamp": ts,
+            "event_id": str(ev.get("_id") or ev.get("event_id") or ""),
+            "fingerprint": fingerprint_event(ev),
+            "prev_hash": prev,
+        }
+        prev = _compute_record_hash(base)
+        recs.append({**base, "record_hash": prev})
+        index += 1
+
+    with open(LEDGER_PATH, "a") as f:
+        f.write("".join(json.dumps(r, separators=(",", ":")) + "\n" for r in recs))
+
+    try:
+        tip = recs[-1]
+        anchor_info = blockchain_service.maybe_anchor(tip["record_hash"])
+        if anchor_info:
+            with open(ANCHORS_PATH, "a") as sf:
+                sf.write(
+                    json.dumps(
+                        {
+                            "source": "event",
+                            "ledger_index": tip["index"],
+                            "record_hash": tip["record_hash"],
+                            "anchor": anchor_info,
+                            "group_start": recs[0]["index"],
+                        },
+                        separators=(",", ":"),
+                    )
+                    + "\n"
+                )
+    except Exception as e:
+        print(f"[events-ledger->anchor] non-fatal error: {e}")
+
+    return recs
+
 def verify_events_ledger() -> Tuple[bool, int]:
     if not os.path.exists(LEDGER_PATH) or os.path.getsize(LEDGER_PATH) == 0:
         return True, 0
@@ -0,0 +1,107 @@
+# app/services/events_service.py
+"""
+Bulk event ingestion (POST /events/bulk).
+
+A batch is validated item by item against EventCreate; invalid items are
+reported with their errors and the rest are still stored. The valid ones
+are written with a single unordered insert_many, status "pending" set on
+the documents themselves (no follow-up update per event), so one bad or
+duplicate document fails alone and the server can apply the others in
+parallel.
+
+What the single endpoint does per event runs once per batch: claims are
+recorded with one insert, the events ledger gets one grouped append (one
+read of its tip, one write, one anchor), and the geo / online detector
+hooks see the batch as a whole. Those are scheduled as background tasks, as for
+POST /events.
+
+The response has one result per input item, in input order:
+{"index", "status": "stored", "event_id"} | {"index", "status": "invalid",
+"errors"} | {"index", "status": "failed", "error"}.
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import BackgroundTasks, HTTPException
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pydantic import ValidationError
+from pymongo.errors import BulkWriteError
+
+from app.config import settings
+from app.schemas.event import EventCreate
+from app.services import geo_service, online_service, reuse_service
+from app.services.events_ledger_integration import safe_anchor_events
+
+
+def _validate(items: List[Any]) -> Tuple[List[Tuple[int, EventCreate]], List[Dict[str, Any]]]:
+    valid, invalid = [], []
+    for i, item in enumerate(items):
+        try:
+            valid.append((i, EventCreate.model_validate(item)))
+        except ValidationError as e:
+            errors = [{"loc": list(err["loc"]), "msg": err["msg"], "type": err["type"]} for err in e.errors()]
+            invalid.append({"index": i, "status": "invalid", "errors": errors})
+    return valid, invalid
+
+
+async def _insert(db: AsyncIOMotorDatabase, docs: List[Dict[str, Any]]) -> Dict[int, str]:
+    """Unordered insert_many; position in docs -> error message of those that failed."""
+    try:
+        await db.events.insert_many(docs, ordered=False)
+    except BulkWriteError as e:
+        return {err["index"]: err.get("errmsg", "write error") for err in e.details.get("writeErrors", [])}
+    return {}
+
+
+async def ingest_events(
+    db: AsyncIOMotorDatabase,
+    items: List[Any],
+    background_tasks: Optional[BackgroundTasks] = None,
+) -> Dict[str, Any]:
+    """Validate and store a batch of events; one result per item."""
+    if len(items) > settings.EVENTS_BULK_MAX:
+        raise HTTPException(status_code=413, detail=f"At most {settings.EVENTS_BULK_MAX} events per request")
+    valid, results = _validate(items)
+
+    docs = []
+    for _, m in valid:
+        doc = m.model_dump()
+        doc.update(geo_service.geo_fields(doc["gps"]))
+        doc["status"] = "pending"
+        docs.append(doc)
+    failed = await _insert(db, docs) if docs else {}
+
+    stored, stored_json = [], []
+    for pos, ((i, m), doc) in enumerate(zip(valid, docs)):
+        if pos in failed:
+            results.append({"index": i, "status": "failed", "error": failed[pos]})
+            continue
+        event_id = str(doc["_id"])
+        results.append({"index": i, "status": "stored", "event_id": event_id})
+        stored.append(doc)
+        # JSON-safe copy for anchoring, as POST /events builds it
+        doc_json = m.model_dump(mode="json")
+        doc_json.update({"_id": event_id, "status": "pending"})
+        stored_json.append(doc_json)
+
+    if stored:
+        try:
+            await reuse_service.record_claims(db, stored)
+        except Exception as e:
+            print(f"[reuse] non-fatal: {e}")
+        if background_tasks is not None:
+            background_tasks.add_task(safe_anchor_events, stored_json)
+            background_tasks.add_task(geo_service.observe_events, db, stored)
+            if online_service.enabled():
+                background_tasks.add_task(online_service.observe_events, db, stored)
+        else:
+            safe_anchor_events(stored_json)
+
+    results.sort(key=lambda r: r["index"])
+    return {
+        "received": len(items),
+        "stored": len(stored),
+        "invalid": len(items) - len(valid),
+        "failed": len(failed),
+        "items": results,
+    }
@@ -1,30 +1,445 @@
 # app/services/evidence_service.py
-import os, hashlib
+"""
+Evidence upload.
+
+Files go to the content-addressable blob store (app/services/blob_service.py):
+identical uploads share one blob, and their phash / EXIF fields are copied
+from an existing evidence document instead of being recomputed.
+
+The upload is streamed in CHUNK_SIZE pieces to a temp file under
+storage/tmp (same filesystem as the final location), hashing each chunk as
+it is written; every write, fsync and the final os.replace run in worker
+threads, so memory stays O(chunk) and concurrent uploads don't block the
+event loop or each other. The hash ledger is appended under a lock (its
+next index depends on the last record).
+
+Bulk ingest (POST /evidence/bulk) takes many files and/or zip / tar
+archives. Entries are spooled and hashed in parallel on a thread pool
+(hashlib and zlib release the GIL), phash / EXIF run once per new blob,
+and the batch is recorded with one blob upsert, one grouped ledger append
+(one read of the chain tip, one fsync) and one insert_many.
+
+Downloads (GET /evidence/{id}/download) are served by
+app/utils/ranged_file.py with the sha256 as ETag.
+"""
+
+import asyncio, contextlib, functools, os, hashlib, tarfile, tempfile, threading, zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import IO, Callable, List, Optional
+from bson import ObjectId
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from fastapi import HTTPException, UploadFile
-from app.services.ledger_service import append_ledger
+from pymongo.errors import BulkWriteError
+from app.config import settings
+from app.forensics.exif import read_exif
+from app.forensics.phash import phash_fields
+from app.services import blob_service, exif_service
+from app.services.ledger_service import append_ledger, append_ledger_many
 
 STORAGE_DIR = os.path.join(os.path.dirname(__file__), "..", "storage")
+DERIVED_FIELDS = {"_id": 0, "phash": 1, "phash_chunks": 1, "exif": 1}
+CHUNK_SIZE = 1 << 20
+
+ARCHIVE_EXTS = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")
+
+_ledger_lock = asyncio.Lock()
+_bulk_pool: Optional[ThreadPoolExecutor] = None
+
+
+def get_bulk_pool() -> ThreadPoolExecutor:
+    global _bulk_pool
+    if _bulk_pool is None:
+        _bulk_pool = ThreadPoolExecutor(max_workers=settings.EVIDENCE_BULK_WORKERS or (os.cpu_count() or 1) + 4)
+    return _bulk_pool
+
+
+def _open_tmp(dir_path: str) -> tuple:
+    os.makedirs(dir_path, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=dir_path, suffix=".part")
+    return os.fdopen(fd, "wb"), tmp
+
+
+def _write_chunk(f, h, chunk: bytes) -> None:
+    f.write(chunk)
+    h.update(chunk)
+
+
+def _close(f) -> None:
+    f.flush()
+    os.fsync(f.fileno())
+    f.close()
+
+
+def _discard(f, tmp: str) -> None:
+    f.close()
+    if os.path.exists(tmp):
+        os.remove(tmp)
+
+
+async def stream_to_tmp(blob: UploadFile) -> tuple:
+    """(temp path, sha256, size) of an upload, read CHUNK_SIZE at a time."""
+    f, tmp = await asyncio.to_thread(_open_tmp, os.path.join(STORAGE_DIR, "tmp"))
+    h = hashlib.sha256()
+    size = 0
+    limit = settings.EVIDENCE_MAX_MB * 2**20
+    try:
+        while True:
+            chunk = await blob.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > limit:
+                raise HTTPException(
+                    status_code=413, detail=f"Evidence exceeds EVIDENCE_MAX_MB ({settings.EVIDENCE_MAX_MB})"
+                )
+            await asyncio.to_thread(_write_chunk, f, h, chunk)
+        await asyncio.to_thread(_close, f)
+    except BaseException:
+        await asyncio.to_thread(_discard, f, tmp)
+        raise
+    return tmp, h.hexdigest(), size
+
+
+def _inspect(path: str) -> dict:
+    # perceptual hash for near-duplicate search and header-only EXIF; {} for non-images
+    fields = phash_fields(path)
+    fields.update(exif_service.exif_fields(read_exif(path)))
+    return fields
+
 
 async def save_evidence(db: AsyncIOMotorDatabase, event_id: str, ev_type: str, blob: UploadFile) -> dict:
-    os.makedirs(STORAGE_DIR, exist_ok=True)
-    filename = f"{event_id}_{blob.filename}"
-    path = os.path.join(STORAGE_DIR, filename)
-    data = await blob.read()
-    with open(path, "wb") as f:
-        f.write(data)
-    sha256 = hashlib.sha256(data).hexdigest()
-    ledger_rec = append_ledger(evidence_id=filename, file_sha256=sha256)
-    doc = {
-        "event_id": event_id,
-        "type": ev_type,
-        "path": path,
-        "sha256": sha256
-    }
-    res = await db.evidence.insert_one(doc)
+    # ledger name; the stored path is content-addressed
+    name = f"{event_id}_{os.path.basename(blob.filename or 'blob')}"
+    tmp, sha256, size = await stream_to_tmp(blob)
+    stored = await blob_service.store(db, tmp, sha256, size)
+    try:
+        async with _ledger_lock:
+            ledger_rec = await asyncio.to_thread(append_ledger, evidence_id=name, file_sha256=sha256)
+        doc = {
+            "event_id": event_id,
+            "type": ev_type,
+            "path": stored["path"],
+            "sha256": sha256,
+            "size": size,
+            "filename": blob.filename,
+            "ledger_index": ledger_rec["index"],
+            "created_at": datetime.utcnow(),
+        }
+        known = await db.evidence.find_one({"sha256": sha256}, DERIVED_FIELDS) if stored["deduplicated"] else None
+        doc.update(known if known is not None else await asyncio.to_thread(_inspect, stored["path"]))
+        res = await db.evidence.insert_one(doc)
+    except BaseException:
+        await blob_service.release(db, sha256)
+        raise
+    await exif_service.on_upload(db, doc)
     return {
         "evidence_id": str(res.inserted_id),
         "sha256": sha256,
         "ledger_index": ledger_rec["index"],
         "status": "recorded",
+        "deduplicated": stored["deduplicated"],
+    }
+
+
+def _spool(src: IO[bytes], tmp_dir: str) -> tuple:
+    """Blocking stream_to_tmp for a file object: (temp path, sha256, size)."""
+    f, tmp = _open_tmp(tmp_dir)
+    h = hashlib.sha256()
+    size = 0
+    limit = settings.EVIDENCE_MAX_MB * 2**20
+    try:
+        for chunk in iter(lambda: src.read(CHUNK_SIZE), b""):
+            size += len(chunk)
+            if size > limit:
+                raise ValueError(f"exceeds EVIDENCE_MAX_MB ({settings.EVIDENCE_MAX_MB})")
+            _write_chunk(f, h, chunk)
+        _close(f)
+    except BaseException:
+        _discard(f, tmp)
+        raise
+    return tmp, h.hexdigest(), size
+
+
+def _skip_entry(name: str) -> bool:
+    # directories, macOS resource forks and dotfiles that archivers add
+    base = os.path.basename(name.rstrip("/"))
+    return name.endswith("/") or name.startswith("__MACOSX/") or not base or base.startswith(".")
+
+
+def _spool_one(name: str, open_src: Callable[[], IO[bytes]], tmp_dir: str) -> dict:
+    try:
+        with open_src() as src:
+            tmp, sha256, size = _spool(src, tmp_dir)
+    except Exception as e:
+        return {"filename": name, "error": str(e)}
+    return {"filename": name, "tmp": tmp, "sha256": sha256, "size": size}
+
+
+class _Budget:
+    """Remaining file / byte allowance of one bulk request.
+
+    Charged from the event loop (zip entries, plain files) and from pool
+    threads (tar entries, whose sizes are only known while streaming), so
+    each check-and-decrement happens under a lock.
+    """
+
+    def __init__(self, files: int, nbytes: int) -> None:
+        self._lock = threading.Lock()
+        self.files = files
+        self.bytes = nbytes
+
+    def take(self, files: int, nbytes: int) -> bool:
+        """Charge files / nbytes; False (and nothing charged) if that would exceed the allowance."""
+        with self._lock:
+            if files > self.files or nbytes > self.bytes:
+                return False
+            self.files -= files
+            self.bytes -= nbytes
+            return True
+
+
+def _spool_tar(name: str, fileobj: IO[bytes], tmp_dir: str, budget: _Budget) -> List[dict]:
+    """Entries of a tar stream in order (tar can't be read out of order)."""
+    out: List[dict] = []
+    try:
+        with tarfile.open(fileobj=fileobj, mode="r|*") as tf:
+            for m in tf:
+                if not m.isfile() or _skip_entry(m.name):
+                    continue
+                if not budget.take(1, m.size):
+                    # entries so far are kept; the stream size isn't known up front
+                    out.append({"filename": m.name, "error": "bulk limit reached"})
+                    break
+                out.append(_spool_one(m.name, lambda: tf.extractfile(m), tmp_dir))
+    except tarfile.TarError as e:
+        out.append({"filename": name, "error": str(e)})
+    return out
+
+
+def _bulk_limit_error() -> HTTPException:
+    return HTTPException(
+        status_code=413,
+        detail=f"Bulk upload exceeds EVIDENCE_BULK_MAX_FILES ({settings.EVIDENCE_BULK_MAX_FILES})"
+        f" or EVIDENCE_BULK_MAX_MB ({settings.EVIDENCE_BULK_MAX_MB})",
+    )
+
+
+async def _spool_all(blobs: List[UploadFile], tmp_dir: str) -> List[dict]:
+    """Spool every upload / archive entry in parallel, in request order."""
+    loop = asyncio.get_running_loop()
+    pool = get_bulk_pool()
+    budget = _Budget(settings.EVIDENCE_BULK_MAX_FILES, settings.EVIDENCE_BULK_MAX_MB * 2**20)
+    groups: List[list] = []  # one list of futures per upload, flattened at the end
+    archives: List[zipfile.ZipFile] = []
+    try:
+        for blob in blobs:
+            name = os.path.basename(blob.filename or "blob")
+            lower = name.lower()
+            if lower.endswith(".zip"):
+                try:
+                    zf = zipfile.ZipFile(blob.file)
+                except zipfile.BadZipFile as e:
+                    groups.append([_ready({"filename": name, "error": str(e)})])
+                    continue
+                archives.append(zf)
+                infos = [i for i in zf.infolist() if not _skip_entry(i.filename)]
+                # declared sizes bound what ZipExtFile will ever return, so this stops zip bombs
+                if not budget.take(len(infos), sum(i.file_size for i in infos)):
+                    raise _bulk_limit_error()
+                # ZipFile serialises reads of its shared file; inflate + hash run concurrently
+                groups.append(
+                    [
+                        loop.run_in_executor(pool, _spool_one, i.filename, lambda i=i, zf=zf: zf.open(i), tmp_dir)
+                        for i in infos
+                    ]
+                )
+            elif lower.endswith(ARCHIVE_EXTS):
+                groups.append([loop.run_in_executor(pool, _spool_tar, name, blob.file, tmp_dir, budget)])
+            else:
+                if not budget.take(1, blob.size or 0):
+                    raise _bulk_limit_error()
+                blob.file.seek(0)
+                # nullcontext: the UploadFile's spool is FastAPI's to close
+                src = functools.partial(contextlib.nullcontext, blob.file)
+                groups.append([loop.run_in_executor(pool, _spool_one, name, src, tmp_dir)])
+        done = [await asyncio.gather(*g, return_exceptions=True) for g in groups]
+    except BaseException:
+        # wait for started jobs so their temp files can be removed
+        for g in groups:
+            for r in await asyncio.gather(*g, return_exceptions=True):
+                for item in r if isinstance(r, list) else [r]:
+                    if isinstance(item, dict) and "tmp" in item:
+                        _discard_tmp(item["tmp"])
+        raise
+    finally:
+        for zf in archives:
+            zf.close()
+
+    items: List[dict] = []
+    for blob, results in zip(blobs, done):
+        for r in results:
+            if isinstance(r, BaseException):
+                items.append({"filename": blob.filename, "error": str(r)})
+            else:
+                items.extend(r if isinstance(r, list) else [r])
+    return items
+
+
+def _ready(item: dict) -> asyncio.Future:
+    fut = asyncio.get_running_loop().create_future()
+    fut.set_result(item)
+    return fut
+
+
+def _discard_tmp(tmp: str) -> None:
+    if os.path.exists(tmp):
+        os.remove(tmp)
+
+
+async def _insert_many(db: AsyncIOMotorDatabase, docs: List[dict]) -> dict:
+    """Unordered insert_many; position in docs -> error message of those that failed."""
+    try:
+        await db.evidence.insert_many(docs, ordered=False)
+    except BulkWriteError as e:
+        return {err["index"]: err.get("errmsg", "write error") for err in e.details.get("writeErrors", [])}
+    return {}
+
+
+async def save_evidence_bulk(
+    db: AsyncIOMotorDatabase, event_id: str, ev_type: str, blobs: List[UploadFile]
+) -> dict:
+    """Record every file (and archive entry) in blobs; per-item results in request order."""
+    if not blobs:
+        raise HTTPException(status_code=400, detail="No files")
+    items = await _spool_all(blobs, os.path.join(STORAGE_DIR, "tmp"))
+    ok = [it for it in items if "tmp" in it]
+    for it in items:
+        if "tmp" not in it:
+            # unreadable upload or archive entry
+            it["status"] = "failed"
+    try:
+        # derived fields: copied from evidence with the same content, else computed once per new sha
+        shas = sorted({it["sha256"] for it in ok})
+        known = {
+            d.pop("sha256"): d
+            async for d in db.evidence.find({"sha256": {"$in": shas}}, {**DERIVED_FIELDS, "sha256": 1})
+        }
+        loop = asyncio.get_running_loop()
+        new = {it["sha256"]: it["tmp"] for it in ok if it["sha256"] not in known}
+        inspected = await asyncio.gather(
+            *(loop.run_in_executor(get_bulk_pool(), _inspect, tmp) for tmp in new.values())
+        )
+        known.update(zip(new.keys(), inspected))
+    except BaseException:
+        for it in ok:
+            _discard_tmp(it["tmp"])
+        raise
+
+    stored = await blob_service.store_many(db, [(it["tmp"], it["sha256"], it["size"]) for it in ok])
+    try:
+        async with _ledger_lock:
+            recs = await asyncio.to_thread(
+                append_ledger_many,
+                [(f"{event_id}_{os.path.basename(it['filename'])}", it["sha256"]) for it in ok],
+            )
+        docs = []
+        now = datetime.utcnow()
+        for it, st, rec in zip(ok, stored, recs):
+            doc = {
+                "event_id": event_id,
+                "type": ev_type,
+                "path": st["path"],
+                "sha256": it["sha256"],
+                "size": it["size"],
+                "filename": it["filename"],
+                "ledger_index": rec["index"],
+                "created_at": now,
+                **known[it["sha256"]],
+            }
+            docs.append(doc)
+            it.update({"ledger_index": rec["index"], "deduplicated": st["deduplicated"]})
+        failed = await _insert_many(db, docs) if docs else {}
+    except BaseException:
+        for it in ok:
+            await blob_service.release(db, it["sha256"])
+        raise
+
+    # a rejected document fails alone: only its blob reference is dropped
+    recorded, inserted = [], []
+    for pos, (it, doc) in enumerate(zip(ok, docs)):
+        it.pop("tmp")
+        it.pop("size")
+        if pos in failed:
+            await blob_service.release(db, it["sha256"])
+            it.pop("deduplicated")
+            it.update({"status": "failed", "error": failed[pos]})
+            continue
+        it.update({"evidence_id": str(doc["_id"]), "status": "recorded"})
+        recorded.append(it)
+        inserted.append(doc)
+    await exif_service.on_upload_many(db, inserted)
+    ok = recorded
+
+    return {
+        "event_id": event_id,
+        "received": len(items),
+        "recorded": len(ok),
+        "deduplicated": sum(1 for it in ok if it["deduplicated"]),
+        "failed": len(items) - len(ok),
+        "items": items,
     }
+
+
+def _file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+async def readable_path(db: AsyncIOMotorDatabase, evid: dict) -> str:
+    """Plain file of an evidence document: 410 once retention deleted it; cold blobs are thawed first."""
+    if evid.get("tombstone"):
+        raise HTTPException(status_code=410, detail="Evidence file deleted by retention policy")
+    if not evid.get("path"):
+        raise HTTPException(status_code=404, detail="Evidence file not found")
+    return await blob_service.ensure_hot(db, evid.get("sha256") or "", evid["path"])
+
+
+async def evidence_sha256(db: AsyncIOMotorDatabase, evid: dict, path: str) -> str:
+    """sha256 of an evidence document; documents from before it was recorded are hashed once and updated."""
+    if not evid.get("sha256"):
+        evid["sha256"] = await asyncio.to_thread(_file_sha256, path)
+        await db.evidence.update_one(
+            {"_id": evid["_id"], "sha256": {"$in": [None, ""]}}, {"$set": {"sha256": evid["sha256"]}}
+        )
+    return evid["sha256"]
+
+
+async def find_evidence_file(db: AsyncIOMotorDatabase, evidence_id: str) -> dict:
+    """{path, sha256, filename, tombstone} of an evidence document without touching the file; 404 if unknown."""
+    ids: list = [evidence_id]
+    if ObjectId.is_valid(evidence_id):
+        ids.append(ObjectId(evidence_id))
+    evid = await db.evidence.find_one(
+        {"_id": {"$in": ids}}, {"path": 1, "sha256": 1, "filename": 1, "tombstone": 1}
+    )
+    if not evid:
+        raise HTTPException(status_code=404, detail="Evidence not found")
+    return evid
+
+
+async def get_evidence_file(db: AsyncIOMotorDatabase, evidence_id: str, evid: Optional[dict] = None) -> dict:
+    """
+    {path, sha256, filename} with a readable path; 404 if unknown. Pass the
+    document from find_evidence_file() to skip the lookup. Cold blobs are
+    thawed here, so check the ETag (sha256) before calling this.
+    """
+    if evid is None:
+        evid = await find_evidence_file(db, evidence_id)
+    evid["path"] = await readable_path(db, evid)
+    await evidence_sha256(db, evid, evid["path"])
+    evid["filename"] = evid.get("filename") or os.path.basename(evid["path"])
+    return evid
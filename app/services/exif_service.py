@@ -0,0 +1,153 @@
+# app/services/exif_service.py
+"""
+EXIF metadata of image evidence vs. the event it was attached to.
+
+On upload the header-only extractor (app/forensics/exif.py) runs on the
+bytes already in memory and the result is stored as `exif` on the evidence
+document; exif.taken_at and exif.loc (GeoJSON, 2dsphere) are indexed.
+
+Checks run in batches: one `$in` lookup fetches the linked events, each
+pair is compared and the outcome stored as `exif_check`, and mismatches
+are written with one insert_many as alerts with reasons
+"exif_gps_mismatch" (further than EXIF_MAX_DISTANCE_KM from the event's
+gps) and/or "exif_time_mismatch" (taken more than
+EXIF_MAX_TIME_DELTA_MINUTES from the event's timestamp). Without an EXIF
+UTC offset the local time is shifted by the event longitude's solar
+offset and the tolerance widened by an hour.
+"""
+
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+
+from app.config import settings
+from app.utils.geo import haversine_km
+
+CHECK_FIELDS = {"_id": 1, "event_id": 1, "exif": 1, "exif_check": 1}
+
+
+def exif_fields(meta: Dict[str, Any]) -> Dict[str, Any]:
+    """Evidence document fields for extracted EXIF ({} when there is none)."""
+    if not meta:
+        return {}
+    doc = dict(meta)
+    if "gps" in doc:
+        doc["loc"] = {"type": "Point", "coordinates": [doc["gps"]["lon"], doc["gps"]["lat"]]}
+    return {"exif": doc}
+
+
+def compare(exif: Dict[str, Any], event: Dict[str, Any]) -> Dict[str, Any]:
+    """{reasons, distance_km, time_delta_min} of one evidence/event pair."""
+    reasons: List[str] = []
+    out: Dict[str, Any] = {"distance_km": None, "time_delta_min": None}
+    gps = event.get("gps") or {}
+    if exif.get("gps") and "lat" in gps and "lon" in gps:
+        d = haversine_km(exif["gps"]["lat"], exif["gps"]["lon"], gps["lat"], gps["lon"])
+        out["distance_km"] = round(d, 3)
+        if d > settings.EXIF_MAX_DISTANCE_KM:
+            reasons.append("exif_gps_mismatch")
+    if exif.get("taken_at") and event.get("timestamp"):
+        taken = exif["taken_at"]
+        slack = 0.0
+        if not exif.get("tz_known"):
+            lon = gps.get("lon", (exif.get("gps") or {}).get("lon", 0.0))
+            taken = taken - timedelta(hours=round(lon / 15.0))
+            slack = 60.0
+        delta = abs((taken - event["timestamp"]).total_seconds()) / 60.0
+        out["time_delta_min"] = round(delta, 1)
+        if delta > settings.EXIF_MAX_TIME_DELTA_MINUTES + slack:
+            reasons.append("exif_time_mismatch")
+    out["reasons"] = reasons
+    return out
+
+
+async def check_evidence(db: AsyncIOMotorDatabase, docs: List[Dict[str, Any]]) -> int:
+    """Compare evidence docs (with `exif`) against their events; returns alerts written."""
+    docs = [d for d in docs if d.get("exif") and d.get("event_id")]
+    if not docs:
+        return 0
+    wanted: List[Any] = []
+    for eid in {str(d["event_id"]) for d in docs}:
+        wanted.append(eid)
+        if ObjectId.is_valid(eid):
+            wanted.append(ObjectId(eid))
+    events = {
+        str(e["_id"]): e
+        async for e in db.events.find({"_id": {"$in": wanted}}, {"gps": 1, "timestamp": 1})
+    }
+
+    now = datetime.utcnow()
+    ops: List[UpdateOne] = []
+    alerts: List[Dict[str, Any]] = []
+    for d in docs:
+        ev = events.get(str(d["event_id"]))
+        if ev is None:
+            continue
+        res = compare(d["exif"], ev)
+        reasons = res.pop("reasons")
+        check = {**res, "ok": not reasons, "checked_at": now}
+        ops.append(UpdateOne({"_id": d["_id"]}, {"$set": {"exif_check": check}}))
+        if not reasons or (d.get("exif_check") or {}).get("ok") is False:
+            # rechecks don't re-alert evidence that was already flagged
+            continue
+        ratios = [
+            (res["distance_km"] or 0.0) / max(settings.EXIF_MAX_DISTANCE_KM, 1e-9),
+            (res["time_delta_min"] or 0.0) / max(settings.EXIF_MAX_TIME_DELTA_MINUTES, 1e-9),
+        ]
+        alerts.append(
+            {
+                "event_id": str(d["event_id"]),
+                "evidence_id": str(d["_id"]),
+                "severity": 2 if len(reasons) > 1 else 1,
+                "reasons": reasons,
+                "score": float(max(ratios)),
+                **res,
+                "created_at": now,
+                "status": "open",
+                "model_version": "exif",
+            }
+        )
+    if ops:
+        await db.evidence.bulk_write(ops, ordered=False)
+    if alerts:
+        await db.alerts.insert_many(alerts, ordered=False)
+    return len(alerts)
+
+
+async def check_all(
+    db: AsyncIOMotorDatabase, event_id: Optional[str] = None, recheck: bool = False, batch_size: int = 1000
+) -> Dict[str, int]:
+    """Bulk check of stored evidence; unchecked only unless recheck."""
+    q: Dict[str, Any] = {"exif": {"$exists": True}}
+    if event_id:
+        q["event_id"] = event_id
+    if not recheck:
+        q["exif_check"] = {"$exists": False}
+    checked = alerts = 0
+    batch: List[Dict[str, Any]] = []
+    async for d in db.evidence.find(q, CHECK_FIELDS).batch_size(batch_size):
+        batch.append(d)
+        if len(batch) >= batch_size:
+            alerts += await check_evidence(db, batch)
+            checked += len(batch)
+            batch = []
+    if batch:
+        alerts += await check_evidence(db, batch)
+        checked += len(batch)
+    return {"checked": checked, "alerts": alerts}
+
+
+async def on_upload(db: AsyncIOMotorDatabase, doc: Dict[str, Any]) -> None:
+    """Upload hook for a stored evidence doc. Never raises."""
+    await on_upload_many(db, [doc])
+
+
+async def on_upload_many(db: AsyncIOMotorDatabase, docs: List[Dict[str, Any]]) -> None:
+    """on_upload for a bulk ingest: one batched check. Never raises."""
+    try:
+        await check_evidence(db, docs)
+    except Exception as e:
+        print(f"[exif] non-fatal: {e}")
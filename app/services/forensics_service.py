@@ -1,25 +1,411 @@
 # app/services/forensics_service.py
+"""
+Forensic analysis of evidence files.
+
+ELA decode/re-encode is CPU-bound, so it runs in a process pool shared by
+the single and batch endpoints (FORENSICS_MAX_WORKERS, 0 = one process per
+core); the event loop only awaits futures. Batch runs keep at most two jobs
+per worker in flight and yield results as they complete. Each job decodes
+at most FORENSICS_ELA_MAX_MEGAPIXELS and re-encodes FORENSICS_ELA_TILE-row
+bands, which bounds its memory and yields a per-tile heatmap.
+
+POST /forensics/analyze runs the multi-analysis engine (app/forensics/
+engine.py) in the same pool, within FORENSICS_ENGINE_MS_PER_MP.
+
+Near-duplicate images are found through perceptual hashes stored on the
+evidence (phash / phash_chunks, see app/forensics/phash.py).
+
+Results are cached by the file's sha256 + algorithm version + parameters
+(app/forensics/cache.py), so duplicate evidence and repeated runs return
+without recomputing; concurrent requests for the same key share one job.
+Cold (gzipped) evidence is decompressed back to the hot tier before it is
+read; evidence deleted by retention answers 410.
+"""
+
+import asyncio
 import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from bson import ObjectId
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from fastapi import HTTPException
-from app.forensics.ela import save_ela
+from PIL import UnidentifiedImageError
+from pymongo import UpdateOne
+
+from app.config import settings
+from app.forensics.cache import ResultCache, cache_key
+from app.forensics.ela import ELA_VERSION, compute_ela
+from app.forensics.engine import ENGINE_VERSION, QUALITIES, analyze
+from app.forensics.phash import chunk_queries, hamming, phash_fields
+from app.services.evidence_service import evidence_sha256, readable_path
+
+CACHE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "storage", "forensics"))
+IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".webp", ".bmp", ".tif", ".tiff"}
+
+_pool: Optional[ProcessPoolExecutor] = None
+_cache: Optional[ResultCache] = None
+_cache_lock = asyncio.Lock()
+_inflight: Dict[tuple, asyncio.Task] = {}
+
+
+def _workers() -> int:
+    return settings.FORENSICS_MAX_WORKERS or os.cpu_count() or 1
+
+
+def get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=_workers())
+    return _pool
+
+
+def shutdown_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+async def get_cache() -> ResultCache:
+    """The result cache; the first call indexes the cache directory in a worker thread."""
+    global _cache
+    if _cache is None:
+        async with _cache_lock:
+            if _cache is None:
+                _cache = await asyncio.to_thread(
+                    ResultCache,
+                    CACHE_DIR,
+                    max_bytes=settings.FORENSICS_CACHE_MAX_MB * 2**20,
+                    max_entries=settings.FORENSICS_CACHE_MAX_ENTRIES,
+                )
+    return _cache
+
+
+async def cache_stats() -> Dict[str, Any]:
+    return (await get_cache()).stats()
+
+
+def _id_variants(evidence_id: str) -> list:
+    # evidence ids arrive as strings; stored _ids may be either form
+    out: list = [evidence_id]
+    if ObjectId.is_valid(evidence_id):
+        out.append(ObjectId(evidence_id))
+    return out
+
+
+def _is_image(evid: dict) -> bool:
+    # blob paths carry no extension; the upload's filename does
+    name = evid.get("filename") or evid.get("path") or ""
+    return os.path.splitext(name)[1].lower() in IMAGE_EXTS
+
+
+def _ela_params(quality: int) -> Dict[str, Any]:
+    return {
+        "quality": quality,
+        "max_pixels": int(settings.FORENSICS_ELA_MAX_MEGAPIXELS * 1_000_000),
+        "tile": settings.FORENSICS_ELA_TILE,
+    }
+
+
+def _ela_job(path: str, out_path: Optional[str], params: Dict[str, Any]) -> dict:
+    res = compute_ela(path, out_path=out_path, **params)
+    res.pop("ela_path")
+    return res
+
+
+async def _compute_ela(key: str, path: str, write_map: bool, params: Dict[str, Any]) -> dict:
+    cache = await get_cache()
+    tmp = cache.tmp_path(key, ".png") if write_map else None
+    loop = asyncio.get_running_loop()
+    try:
+        res = await loop.run_in_executor(get_pool(), _ela_job, path, tmp, params)
+    except BaseException:
+        if tmp and os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return cache.put(key, res, artifact=tmp)
+
+
+def _done(flight: tuple, task: asyncio.Task) -> None:
+    _inflight.pop(flight, None)
+    if not task.cancelled():
+        task.exception()  # retrieved by the waiters, if any are left
+
+
+async def _shared(flight: tuple, start) -> dict:
+    """Run start() once per flight key; concurrent callers await the same task."""
+    task = _inflight.get(flight)
+    if task is None:
+        task = _inflight[flight] = asyncio.ensure_future(start())
+        task.add_done_callback(lambda t: _done(flight, t))
+    # shielded: other requests may be waiting on the same job
+    return await asyncio.shield(task)
+
 
-ELA_DIR = os.path.join(os.path.dirname(__file__), "..", "storage", "ela")
+async def _ela(path: str, sha256: str, write_map: bool, quality: int = 90) -> dict:
+    params = _ela_params(quality)
+    key = cache_key(sha256, "ela", ELA_VERSION, params)
+    entry = (await get_cache()).get(key, need_artifact=write_map)
+    cached = entry is not None
+    if entry is None:
+        entry = await _shared((key, write_map), lambda: _compute_ela(key, path, write_map, params))
+    res = entry["result"]
+    return {
+        "ela_path": entry["artifact"] if write_map else None,
+        "suspicion": res["suspicion"],
+        "width": res["width"],
+        "height": res["height"],
+        "scale": res["scale"],
+        "heatmap": res["heatmap"],
+        "cached": cached,
+    }
 
-async def run_ela(db: AsyncIOMotorDatabase, evidence_id: str) -> dict:
-    evid = await db.evidence.find_one({"_id": {"$eq": evidence_id} })
-    if evid is None:
-        # try string to ObjectId fallback
-        from bson import ObjectId
+
+async def run_ela(
+    db: AsyncIOMotorDatabase, evidence_id: str, write_map: bool = True, quality: int = 90
+) -> dict:
+    evid = await db.evidence.find_one({"_id": {"$in": _id_variants(evidence_id)}})
+    if not evid:
+        raise HTTPException(status_code=404, detail="Evidence not found")
+    path = await readable_path(db, evid)
+    return await _ela(path, await evidence_sha256(db, evid, path), write_map, quality)
+
+
+async def ela_map_key(db: AsyncIOMotorDatabase, evidence_id: str, quality: int = 90) -> tuple:
+    """(evidence doc, cache key) of the evidence's ELA map.
+
+    The key covers file sha256, ELA version and parameters, so it changes
+    whenever the map's bytes can; downloads use it as the ETag.
+    """
+    evid = await db.evidence.find_one(
+        {"_id": {"$in": _id_variants(evidence_id)}}, {"path": 1, "sha256": 1, "tombstone": 1}
+    )
+    if not evid:
+        raise HTTPException(status_code=404, detail="Evidence not found")
+    if evid.get("tombstone"):
+        raise HTTPException(status_code=410, detail="Evidence file deleted by retention policy")
+    if not evid.get("sha256"):
+        await evidence_sha256(db, evid, await readable_path(db, evid))
+    return evid, cache_key(evid["sha256"], "ela", ELA_VERSION, _ela_params(quality))
+
+
+async def ela_map(db: AsyncIOMotorDatabase, evid: dict, key: str, quality: int = 90) -> str:
+    """Path of the ELA map PNG for (evid, key) from ela_map_key, computed if not cached.
+
+    The source file (thawed if cold) is only read on a cache miss.
+    """
+    entry = (await get_cache()).get(key, need_artifact=True)
+    if entry is not None:
+        return entry["artifact"]
+    res = await _ela(await readable_path(db, evid), evid["sha256"], True, quality)
+    return res["ela_path"]
+
+
+def _engine_params(qualities: Optional[List[int]]) -> Dict[str, Any]:
+    return {
+        "qualities": sorted(set(qualities or QUALITIES)),
+        "region": settings.FORENSICS_ENGINE_REGION,
+        "max_pixels": int(settings.FORENSICS_ELA_MAX_MEGAPIXELS * 1_000_000),
+        "ms_per_mp": settings.FORENSICS_ENGINE_MS_PER_MP,
+    }
+
+
+def _engine_job(path: str, params: Dict[str, Any]) -> dict:
+    return analyze(path, **params)
+
+
+async def _compute_engine(key: str, path: str, params: Dict[str, Any]) -> dict:
+    loop = asyncio.get_running_loop()
+    res = await loop.run_in_executor(get_pool(), _engine_job, path, params)
+    if res["skipped"]:
+        # partial result (ran out of time budget): return it, but don't cache it
+        return {"result": res}
+    return (await get_cache()).put(key, res)
+
+
+async def run_analysis(
+    db: AsyncIOMotorDatabase, evidence_id: str, qualities: Optional[List[int]] = None
+) -> dict:
+    """Multi-quality ELA, block-grid and noise maps (app/forensics/engine.py), cached like ELA."""
+    evid = await db.evidence.find_one({"_id": {"$in": _id_variants(evidence_id)}})
+    if not evid:
+        raise HTTPException(status_code=404, detail="Evidence not found")
+    if not _is_image(evid):
+        raise HTTPException(status_code=400, detail="Evidence is not a readable image")
+    path = await readable_path(db, evid)
+    sha256 = await evidence_sha256(db, evid, path)
+    params = _engine_params(qualities)
+    key = cache_key(sha256, "engine", ENGINE_VERSION, params)
+    entry = (await get_cache()).get(key)
+    cached = entry is not None
+    if entry is None:
         try:
-            evid = await db.evidence.find_one({"_id": ObjectId(evidence_id)})
-        except Exception:
-            evid = None
+            entry = await _shared((key, False), lambda: _compute_engine(key, path, params))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail="Evidence file not found")
+        except (UnidentifiedImageError, SyntaxError):
+            # the message would leak the blob path
+            raise HTTPException(status_code=400, detail="Evidence is not a readable image")
+        except OSError as e:
+            if e.errno is not None:
+                # filesystem errors (permissions, I/O) are not the client's fault
+                raise
+            # PIL decoder errors ("image file is truncated", "broken data stream") carry no errno
+            raise HTTPException(status_code=400, detail="Evidence is not a readable image")
+    return {"evidence_id": evidence_id, **entry["result"], "cached": cached}
+
+
+async def _batch_targets(
+    db: AsyncIOMotorDatabase, evidence_ids: List[str], event_id: Optional[str]
+) -> List[Dict[str, Any]]:
+    """[{evidence_id, doc}] in request order (doc None if unknown), then the event's image evidence."""
+    targets: List[Dict[str, Any]] = []
+    seen = set()
+    if evidence_ids:
+        wanted = [v for eid in evidence_ids for v in _id_variants(eid)]
+        found = {
+            str(d["_id"]): d
+            async for d in db.evidence.find({"_id": {"$in": wanted}}, {"path": 1, "sha256": 1, "tombstone": 1})
+        }
+        for eid in evidence_ids:
+            if eid in seen:
+                continue
+            seen.add(eid)
+            doc = found.get(eid)
+            targets.append({"evidence_id": eid, "doc": doc})
+    if event_id:
+        q = {"event_id": event_id, "tombstone": {"$exists": False}}
+        async for d in db.evidence.find(q, {"path": 1, "sha256": 1, "filename": 1}):
+            eid = str(d["_id"])
+            if eid not in seen and _is_image(d):
+                seen.add(eid)
+                targets.append({"evidence_id": eid, "doc": d})
+    return targets
+
+
+async def run_ela_batch(
+    db: AsyncIOMotorDatabase,
+    evidence_ids: List[str],
+    event_id: Optional[str] = None,
+    write_map: bool = True,
+    quality: int = 90,
+) -> AsyncIterator[dict]:
+    """
+    ELA over many evidence items; yields one result per item in completion
+    order: {evidence_id, ela_path, suspicion, ..., cached} or {evidence_id, error}.
+    Raises 400 before yielding anything if the batch is empty or too large.
+    """
+    targets = await _batch_targets(db, evidence_ids, event_id)
+    if not targets:
+        raise HTTPException(status_code=400, detail="No evidence to analyze")
+    if len(targets) > settings.FORENSICS_BATCH_LIMIT:
+        raise HTTPException(
+            status_code=400, detail=f"Batch exceeds FORENSICS_BATCH_LIMIT ({settings.FORENSICS_BATCH_LIMIT})"
+        )
+    return _stream_ela(db, targets, write_map, quality)
+
+
+async def _ela_doc(db: AsyncIOMotorDatabase, doc: Dict[str, Any], write_map: bool, quality: int) -> dict:
+    path = await readable_path(db, doc)
+    return await _ela(path, await evidence_sha256(db, doc, path), write_map, quality)
+
+
+async def _stream_ela(
+    db: AsyncIOMotorDatabase, targets: List[Dict[str, Any]], write_map: bool, quality: int
+) -> AsyncIterator[dict]:
+    limit = 2 * _workers()
+    pending: Dict[asyncio.Task, str] = {}
+    queue = iter(targets)
+    try:
+        while True:
+            while len(pending) < limit:
+                t = next(queue, None)
+                if t is None:
+                    break
+                if t["doc"] is None:
+                    yield {"evidence_id": t["evidence_id"], "error": "Evidence not found"}
+                    continue
+                task = asyncio.ensure_future(_ela_doc(db, t["doc"], write_map, quality))
+                pending[task] = t["evidence_id"]
+            if not pending:
+                return
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                eid = pending.pop(task)
+                try:
+                    res = {"evidence_id": eid, **task.result()}
+                except Exception as e:
+                    res = {"evidence_id": eid, "error": f"{type(e).__name__}: {e}"}
+                yield res
+    finally:
+        # client went away mid-stream: stop submitting; jobs already running
+        # finish in the pool and land in the cache
+        for task in pending:
+            task.cancel()
+
+
+async def find_duplicates(
+    db: AsyncIOMotorDatabase, evidence_id: str, max_distance: Optional[int] = None, limit: int = 50
+) -> List[Dict[str, Any]]:
+    """
+    Image evidence whose dHash is within max_distance bits of this one,
+    nearest first: [{evidence_id, event_id, distance, identical}] where
+    identical means the same sha256.
+    """
+    r = settings.PHASH_MAX_DISTANCE if max_distance is None else max_distance
+    evid = await db.evidence.find_one({"_id": {"$in": _id_variants(evidence_id)}})
     if not evid:
         raise HTTPException(status_code=404, detail="Evidence not found")
+    if not evid.get("phash"):
+        # stored before hashes were computed on upload
+        fields = await asyncio.to_thread(phash_fields, await readable_path(db, evid))
+        if not fields:
+            raise HTTPException(status_code=400, detail="Evidence is not a readable image")
+        await db.evidence.update_one({"_id": evid["_id"]}, {"$set": fields})
+        evid.update(fields)
+
+    h = int(evid["phash"], 16)
+    cur = db.evidence.find(
+        {"phash_chunks": {"$in": chunk_queries(h, r)}, "_id": {"$ne": evid["_id"]}},
+        {"event_id": 1, "phash": 1, "sha256": 1},
+    )
+    out = []
+    async for d in cur:
+        dist = hamming(h, int(d["phash"], 16))
+        if dist <= r:
+            out.append(
+                {
+                    "evidence_id": str(d["_id"]),
+                    "event_id": d.get("event_id"),
+                    "distance": dist,
+                    "identical": bool(evid.get("sha256")) and d.get("sha256") == evid.get("sha256"),
+                }
+            )
+    out.sort(key=lambda x: x["distance"])
+    return out[:limit]
+
 
-    os.makedirs(ELA_DIR, exist_ok=True)
-    fname = os.path.basename(evid["path"])
-    out_path = os.path.join(ELA_DIR, f"{evidence_id}.png")
-    ela_path, suspicion = save_ela(evid["path"], out_path)
-    return {"ela_path": ela_path, "suspicion": suspicion}
+async def backfill_phash(db: AsyncIOMotorDatabase, batch_size: int = 500) -> int:
+    """Hash image evidence stored before phash was computed on upload."""
+    updated = 0
+    ops: List[UpdateOne] = []
+    # cold and deleted files are left alone: backfilling must not thaw the archive
+    q = {"phash": {"$exists": False}, "tombstone": {"$exists": False}, "storage_tier": {"$ne": "cold"}}
+    async for d in db.evidence.find(q, {"path": 1, "filename": 1}):
+        if not _is_image(d):
+            continue
+        fields = await asyncio.to_thread(phash_fields, d["path"])
+        if not fields:
+            continue
+        ops.append(UpdateOne({"_id": d["_id"]}, {"$set": fields}))
+        if len(ops) >= batch_size:
+            await db.evidence.bulk_write(ops, ordered=False)
+            updated += len(ops)
+            ops = []
+    if ops:
+        await db.evidence.bulk_write(ops, ordered=False)
+        updated += len(ops)
+    return updated
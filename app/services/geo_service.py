@@ -0,0 +1,284 @@
+# app/services/geo_service.py
+"""
+Spatial queries over events.
+
+Every event is stored with a GeoJSON `loc` (2dsphere-indexed) and a
+`geohash` (indexed with timestamp), so radius queries are served by the
+index instead of a scan with haversine_km.
+
+The ingestion check for GPS spoofing asks Mongo, not process memory, so
+devices whose events land on different workers are still seen together.
+For each GEO_GRID_PRECISION cell of a batch, it runs one query on the
+geohash prefix and timestamp index. When GEO_SPOOF_MIN_DEVICES distinct
+devices report identical coordinates within GEO_SPOOF_WINDOW_MINUTES, a
+"gps_spoofing" alert is raised once per (rounded coordinate, window).
+Later events there only update it, and reopen it when more devices join
+(app/services/alert_service.py).
+
+A process-local GridIndex of the last GEO_WINDOW_HOURS answers
+nearby_recent(). It only sees the events this worker ingested, so it is a
+per-worker cache: persisted to app/storage/geo/grid.npz on shutdown (the
+last worker to stop wins) and warmed from the latest events otherwise.
+"""
+
+import asyncio
+import os
+import re
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Set
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+
+from app.config import settings
+from app.ml.spatial import GridIndex
+from app.services.alert_service import upsert_alerts
+from app.utils import geohash
+from app.utils.geo import haversine_km
+from app.utils.trajectory import epoch_seconds
+
+GRID_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "storage", "geo", "grid.npz"))
+
+_grid: Optional[GridIndex] = None
+_lock = asyncio.Lock()
+
+
+def geo_fields(gps: Dict[str, float]) -> Dict[str, Any]:
+    """Fields stored alongside `gps` so the spatial indexes can serve the event."""
+    lat, lon = float(gps["lat"]), float(gps["lon"])
+    return {
+        "loc": {"type": "Point", "coordinates": [lon, lat]},
+        "geohash": geohash.encode(lat, lon, 9),
+    }
+
+
+def _new_grid() -> GridIndex:
+    return GridIndex(
+        precision=settings.GEO_GRID_PRECISION,
+        window_s=settings.GEO_WINDOW_HOURS * 3600,
+        decimals=settings.GEO_COORD_DECIMALS,
+    )
+
+
+async def _get_grid(db: AsyncIOMotorDatabase) -> GridIndex:
+    global _grid
+    if _grid is not None:
+        return _grid
+    if os.path.exists(GRID_PATH):
+        try:
+            _grid = await asyncio.to_thread(GridIndex.load, GRID_PATH)
+            return _grid
+        except Exception as e:
+            print(f"[geo] failed to load {GRID_PATH}: {e}")
+    grid = _new_grid()
+    cur = (
+        db.events.find({}, {"_id": 1, "timestamp": 1, "gps": 1, "device_id": 1})
+        .sort([("timestamp", -1)])
+        .limit(settings.GEO_WARM_LIMIT)
+    )
+    recent = [e async for e in cur]
+    for ev in reversed(recent):
+        grid.add_event(ev)
+    if recent:
+        grid.prune(recent[0]["timestamp"])
+    _grid = grid
+    return _grid
+
+
+def save_grid() -> None:
+    if _grid is not None:
+        _grid.save(GRID_PATH)
+
+
+async def observe_event(db: AsyncIOMotorDatabase, ev: Dict[str, Any]) -> None:
+    """Ingestion hook: add the event to the grid and flag coordinate sharing. Never raises."""
+    await observe_events(db, [ev])
+
+
+def _coord_key(gps: Dict[str, Any]) -> tuple:
+    return round(float(gps["lat"]), settings.GEO_COORD_DECIMALS), round(float(gps["lon"]), settings.GEO_COORD_DECIMALS)
+
+
+async def _colocated_stored(db: AsyncIOMotorDatabase, evs: List[Dict[str, Any]], window: float) -> List[Set[str]]:
+    """Per event, devices that reported its coordinates in [ts - window, ts], from stored events."""
+    cells: Dict[str, List[int]] = defaultdict(list)
+    for i, ev in enumerate(evs):
+        cells[geohash.encode(ev["gps"]["lat"], ev["gps"]["lon"], settings.GEO_GRID_PRECISION)].append(i)
+    out: List[Set[str]] = [set() for _ in evs]
+    for cell, idx in cells.items():
+        lo = min(evs[i]["timestamp"] for i in idx) - timedelta(seconds=window)
+        hi = max(evs[i]["timestamp"] for i in idx)
+        # anchored prefix regex: served by the (geohash, timestamp) index
+        q = {"geohash": {"$regex": "^" + re.escape(cell)}, "timestamp": {"$gte": lo, "$lte": hi}}
+        by_coord: Dict[tuple, List[tuple]] = defaultdict(list)
+        async for e in db.events.find(q, {"_id": 0, "gps": 1, "timestamp": 1, "device_id": 1}):
+            by_coord[_coord_key(e["gps"])].append((e["timestamp"], e.get("device_id")))
+        for i in idx:
+            ts = evs[i]["timestamp"]
+            out[i] = {
+                str(d) for t, d in by_coord.get(_coord_key(evs[i]["gps"]), ()) if ts - timedelta(seconds=window) <= t <= ts
+            }
+    return out
+
+
+async def observe_events(db: AsyncIOMotorDatabase, evs: List[Dict[str, Any]]) -> None:
+    """observe_event for a batch (already stored): one query per cell, keyed alerts. Never raises."""
+    if not evs:
+        return
+    try:
+        window = settings.GEO_SPOOF_WINDOW_MINUTES * 60
+        async with _lock:
+            grid = await _get_grid(db)
+            for ev in evs:
+                grid.add_event(ev)
+            grid.prune(max(ev["timestamp"] for ev in evs))
+        # a synced backlog is stored as a whole before this runs, so it is co-located with itself
+        hits = await _colocated_stored(db, evs, window)
+        now = datetime.utcnow()
+        alerts: Dict[str, Dict[str, Any]] = {}
+        for ev, devices in zip(evs, hits):
+            if len(devices) < settings.GEO_SPOOF_MIN_DEVICES:
+                continue
+            lat, lon = _coord_key(ev["gps"])
+            key = f"gps_spoofing:{lat},{lon}:{int(epoch_seconds(ev['timestamp']) // window)}"
+            if key in alerts and len(alerts[key]["devices"]) >= len(devices):
+                continue
+            alerts[key] = {
+                "alert_key": key,
+                "event_id": str(ev["_id"]),
+                "severity": 2,
+                "reasons": ["gps_spoofing"],
+                "score": float(len(devices)),
+                "devices": sorted(devices),
+                "gps": {"lat": lat, "lon": lon},
+                "created_at": now,
+                "status": "open",
+            }
+        await upsert_alerts(db, list(alerts.values()), compare=("score",))
+    except Exception as e:
+        print(f"[geo] non-fatal: {e}")
+
+
+def _time_range(start: Optional[datetime], end: Optional[datetime]) -> Dict[str, Any]:
+    rng: Dict[str, Any] = {}
+    if start is not None:
+        rng["$gte"] = start
+    if end is not None:
+        rng["$lt"] = end
+    return {"timestamp": rng} if rng else {}
+
+
+async def nearby(
+    db: AsyncIOMotorDatabase,
+    lat: float,
+    lon: float,
+    radius_km: float,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    limit: int = 200,
+) -> List[Dict[str, Any]]:
+    """Events within radius_km of (lat, lon) in [start, end), nearest first (2dsphere index)."""
+    query = {
+        "loc": {
+            "$nearSphere": {
+                "$geometry": {"type": "Point", "coordinates": [lon, lat]},
+                "$maxDistance": radius_km * 1000.0,
+            }
+        },
+        **_time_range(start, end),
+    }
+    projection = {"_id": 1, "timestamp": 1, "gps": 1, "device_id": 1, "ngo_id": 1, "donor_id": 1}
+    items = [e async for e in db.events.find(query, projection).limit(limit)]
+    out = []
+    for e in items:
+        out.append(
+            {
+                "event_id": str(e["_id"]),
+                "timestamp": e["timestamp"].isoformat() + "Z",
+                "gps": e["gps"],
+                "device_id": e.get("device_id"),
+                "ngo_id": e.get("ngo_id"),
+                "donor_id": e.get("donor_id"),
+                "distance_km": haversine_km(lat, lon, e["gps"]["lat"], e["gps"]["lon"]),
+            }
+        )
+    return out
+
+
+async def nearby_recent(
+    db: AsyncIOMotorDatabase,
+    lat: float,
+    lon: float,
+    radius_km: float,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    limit: int = 200,
+) -> List[Dict[str, Any]]:
+    """Same as nearby() but answered from the in-memory grid (last GEO_WINDOW_HOURS only)."""
+    async with _lock:
+        grid = await _get_grid(db)
+        # only the cheap bucket slicing holds the lock; ingestion hooks wait for nothing else
+        cand = grid.candidates(lat, lon, radius_km, start=start, end=end)
+    hits = await asyncio.to_thread(GridIndex.rank, cand, lat, lon, radius_km, limit)
+    for h in hits:
+        h["timestamp"] = datetime.utcfromtimestamp(h.pop("ts")).isoformat() + "Z"
+        h["gps"] = {"lat": h.pop("lat"), "lon": h.pop("lon")}
+    return hits
+
+
+async def colocated(
+    db: AsyncIOMotorDatabase,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    min_devices: Optional[int] = None,
+    limit: int = 100,
+) -> List[Dict[str, Any]]:
+    """Coordinates reported by at least `min_devices` distinct devices in [start, end)."""
+    min_devices = min_devices or settings.GEO_SPOOF_MIN_DEVICES
+    pipeline = [
+        {"$match": _time_range(start, end)},
+        {
+            "$group": {
+                "_id": {"lat": "$gps.lat", "lon": "$gps.lon"},
+                "devices": {"$addToSet": "$device_id"},
+                "events": {"$sum": 1},
+                "first": {"$min": "$timestamp"},
+                "last": {"$max": "$timestamp"},
+            }
+        },
+        {"$project": {"devices": 1, "events": 1, "first": 1, "last": 1, "n_devices": {"$size": "$devices"}}},
+        {"$match": {"n_devices": {"$gte": min_devices}}},
+        {"$sort": {"n_devices": -1}},
+        {"$limit": limit},
+    ]
+    out = []
+    async for g in db.events.aggregate(pipeline):
+        out.append(
+            {
+                "gps": g["_id"],
+                "devices": sorted(g["devices"]),
+                "n_devices": g["n_devices"],
+                "events": g["events"],
+                "first": g["first"].isoformat() + "Z",
+                "last": g["last"].isoformat() + "Z",
+            }
+        )
+    return out
+
+
+async def backfill(db: AsyncIOMotorDatabase, batch_size: int = 1000) -> int:
+    """Add loc/geohash to events stored before they were written at ingestion."""
+    updated = 0
+    cur = db.events.find({"loc": {"$exists": False}, "gps": {"$exists": True}}, {"gps": 1}).batch_size(batch_size)
+    ops: List[UpdateOne] = []
+    async for e in cur:
+        ops.append(UpdateOne({"_id": e["_id"]}, {"$set": geo_fields(e["gps"])}))
+        if len(ops) >= batch_size:
+            await db.events.bulk_write(ops, ordered=False)
+            updated += len(ops)
+            ops = []
+    if ops:
+        await db.events.bulk_write(ops, ordered=False)
+        updated += len(ops)
+    return updated
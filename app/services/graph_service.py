@@ -0,0 +1,196 @@
+# app/services/graph_service.py
+"""
+Incremental collusion-ring analysis.
+
+One EntityGraph per process, persisted to app/storage/graph/graph.npz with
+a (timestamp, _id) watermark in the `graph_state` collection. A refresh
+streams only events past the watermark, folds them in and re-checks the
+components those events touched.
+
+Re-checking a touched component finds its rings again, so alerts are keyed
+(app/services/alert_service.py): a ring on its sorted actor set, a shared
+device on the device. A ring or device that is already alerted is only
+updated and reopened when its density or NGO count changed. A new member
+makes a new actor set, so it raises a new alert.
+
+Refreshes hold the "graph" lease, so one worker at a time folds events and
+writes graph.npz. A process whose in-memory graph was built at another
+watermark than the stored one (another worker refreshed since) reloads
+graph.npz first. Folding runs in a worker thread.
+
+Alerts carry reasons ["collusion_ring"] or ["shared_device"], the actors
+involved and, as event_id, the newest event that touched them.
+"""
+
+import asyncio
+import hashlib
+import os
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from fastapi import HTTPException
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from app.config import settings
+from app.ml.graph import EntityGraph
+from app.services.alert_service import upsert_alerts
+from app.services.lease_service import Lease
+
+GRAPH_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "storage", "graph", "graph.npz"))
+STATE_ID = "entity_graph"
+GRAPH_FIELDS = {"_id": 1, "timestamp": 1, "donor_id": 1, "ngo_id": 1, "device_id": 1, "ip": 1, "beneficiary_ids": 1}
+
+_graph: Optional[EntityGraph] = None
+_built_at: Optional[tuple] = None  # watermark _graph corresponds to
+_lock = asyncio.Lock()
+
+
+def _new_graph() -> EntityGraph:
+    return EntityGraph(hub_degree=settings.GRAPH_HUB_DEGREE, max_edges=settings.GRAPH_MAX_EDGES)
+
+
+def _watermark(state: Optional[Dict[str, Any]]) -> Optional[tuple]:
+    return (state["last_timestamp"], state["last_id"]) if state else None
+
+
+async def _load(db: AsyncIOMotorDatabase) -> tuple:
+    """(graph, watermark doc or None); a missing graph file resets the watermark."""
+    global _graph, _built_at
+    state = await db.graph_state.find_one({"_id": STATE_ID})
+    if _graph is None or _built_at != _watermark(state):
+        _graph = None
+        if state and os.path.exists(GRAPH_PATH):
+            try:
+                _graph = await asyncio.to_thread(EntityGraph.load, GRAPH_PATH)
+            except Exception as e:
+                print(f"[graph] failed to load {GRAPH_PATH}: {e}")
+        if _graph is None:
+            _graph, state = _new_graph(), None
+        _built_at = _watermark(state)
+    return _graph, state
+
+
+def _after(state: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    if not state:
+        return {}
+    ts, last_id = state["last_timestamp"], state["last_id"]
+    return {"$or": [{"timestamp": {"$gt": ts}}, {"timestamp": ts, "_id": {"$gt": last_id}}]}
+
+
+def _newest_event(actor_ids: List[int], newest: Dict[int, tuple]) -> Optional[str]:
+    hits = [newest[i] for i in actor_ids if i in newest]
+    return str(max(hits, key=lambda x: x[0])[1]) if hits else None
+
+
+def _ring_key(actors: List[str]) -> str:
+    return "collusion_ring:" + hashlib.sha1("\n".join(sorted(actors)).encode("utf-8")).hexdigest()
+
+
+def _alert_docs(g: EntityGraph, touched: set, newest: Dict[int, Any]) -> List[Dict[str, Any]]:
+    now = datetime.utcnow()
+    docs = []
+    rings = g.rings(
+        touched,
+        min_ngos=settings.GRAPH_MIN_RING_NGOS,
+        min_actors=settings.GRAPH_MIN_RING_ACTORS,
+        min_density=settings.GRAPH_MIN_DENSITY,
+    )
+    for ring in rings:
+        ids = [g.actors.ids[m] for m in ring["actors"]]
+        docs.append(
+            {
+                "alert_key": _ring_key(ring["actors"]),
+                "event_id": _newest_event(ids, newest),
+                "severity": 3,
+                "reasons": ["collusion_ring"],
+                # rounded: float noise mustn't count as a density change
+                "score": round(float(ring["density"]), 3),
+                "actors": ring["actors"],
+                "resources": ring["resources"][:100],
+                "created_at": now,
+                "status": "open",
+                "model_version": "graph",
+            }
+        )
+    for dev in g.shared_devices(min_ngos=settings.GRAPH_MIN_RING_NGOS, touched=touched):
+        ids = [g.actors.ids[m] for m in dev["ngos"]]
+        docs.append(
+            {
+                "alert_key": f"shared_device:{dev['device']}",
+                "event_id": _newest_event(ids, newest),
+                "severity": 2,
+                "reasons": ["shared_device"],
+                "score": float(len(dev["ngos"])),
+                "actors": dev["ngos"],
+                "resources": [dev["device"]],
+                "created_at": now,
+                "status": "open",
+                "model_version": "graph",
+            }
+        )
+    return docs
+
+
+async def refresh(db: AsyncIOMotorDatabase, rebuild: bool = False, batch_size: Optional[int] = None) -> Dict[str, Any]:
+    """Fold events past the watermark into the graph and alert on touched rings."""
+    global _graph, _built_at
+    batch_size = batch_size or settings.ANALYZE_BATCH_SIZE
+    async with _lock, Lease(db, "graph") as lease:
+        if not lease.held:
+            raise HTTPException(status_code=409, detail="Graph refresh already running")
+        if rebuild:
+            _graph, _built_at = _new_graph(), None
+            await db.graph_state.delete_one({"_id": STATE_ID})
+        g, state = await _load(db)
+
+        cur = (
+            db.events.find(_after(state), GRAPH_FIELDS)
+            .sort([("timestamp", 1), ("_id", 1)])
+            .batch_size(batch_size)
+        )
+        touched: set = set()
+        newest: Dict[int, tuple] = {}  # actor id -> (timestamp, event id)
+        seen, last = 0, None
+        chunk: List[Dict[str, Any]] = []
+        async for ev in cur:
+            chunk.append(ev)
+            if len(chunk) >= batch_size:
+                touched |= await asyncio.to_thread(_fold, g, chunk, newest)
+                seen += len(chunk)
+                last = chunk[-1]
+                chunk = []
+        if chunk:
+            touched |= await asyncio.to_thread(_fold, g, chunk, newest)
+            seen += len(chunk)
+            last = chunk[-1]
+        if not seen:
+            return {"events": 0, "alerts_created": 0, "edges": g.n_edges}
+
+        await asyncio.to_thread(g.flush)
+        alerts = await asyncio.to_thread(_alert_docs, g, touched, newest)
+        created = await upsert_alerts(db, alerts, compare=("score",))
+
+        await asyncio.to_thread(g.save, GRAPH_PATH)
+        await db.graph_state.update_one(
+            {"_id": STATE_ID},
+            {"$set": {"last_timestamp": last["timestamp"], "last_id": last["_id"], "updated_at": datetime.utcnow()}},
+            upsert=True,
+        )
+        _built_at = (last["timestamp"], last["_id"])
+        return {
+            "events": seen,
+            "alerts_created": created,
+            "actors": len(g.actors),
+            "resources": len(g.resources),
+            "edges": g.n_edges,
+        }
+
+
+def _fold(g: EntityGraph, chunk: List[Dict[str, Any]], newest: Dict[int, tuple]) -> set:
+    touched = g.add_events(chunk)
+    for ev in chunk:
+        for key in (f"donor:{ev.get('donor_id')}", f"ngo:{ev.get('ngo_id')}"):
+            i = g.actors.ids.get(key)
+            if i is not None:
+                newest[i] = (ev["timestamp"], ev["_id"])
+    return touched
@@ -0,0 +1,98 @@
+# app/services/lease_service.py
+"""
+Cross-worker leases in the `leases` collection.
+
+An asyncio.Lock only serialises work inside one process; with several
+uvicorn workers every process would run its own background pass. A lease
+is a document {_id: name, holder, expires_at} taken with one conditional
+upsert, so exactly one holder wins:
+
+    async with Lease(db, "scrub") as lease:
+        if not lease.held:
+            return  # another worker is on it
+        ...
+        if lease.lost:
+            break  # expired and taken over; stop at a safe point
+
+While held, a keepalive task extends expires_at every ttl/3. A crashed
+holder stops renewing, so its lease lapses after `ttl_s` and the next
+caller takes it over.
+"""
+
+import asyncio
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import Optional
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+DEFAULT_TTL_S = 60.0
+
+
+class Lease:
+    def __init__(self, db: AsyncIOMotorDatabase, name: str, ttl_s: float = DEFAULT_TTL_S) -> None:
+        self.db = db
+        self.name = name
+        self.ttl_s = float(ttl_s)
+        self.token = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex}"
+        self.held = False
+        self.lost = False
+        self._keepalive: Optional[asyncio.Task] = None
+
+    def _expiry(self) -> datetime:
+        return datetime.utcnow() + timedelta(seconds=self.ttl_s)
+
+    async def acquire(self) -> bool:
+        """Take the lease if it is free or expired; False if another holder is active."""
+        now = datetime.utcnow()
+        try:
+            doc = await self.db.leases.find_one_and_update(
+                {"_id": self.name, "$or": [{"expires_at": {"$lt": now}}, {"holder": None}]},
+                {"$set": {"holder": self.token, "acquired_at": now, "expires_at": self._expiry()}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+        except DuplicateKeyError:
+            # the document exists and its holder is still active
+            return False
+        self.held = doc is not None and doc.get("holder") == self.token
+        if self.held:
+            self._keepalive = asyncio.create_task(self._renew_loop())
+        return self.held
+
+    async def renew(self) -> bool:
+        res = await self.db.leases.update_one(
+            {"_id": self.name, "holder": self.token}, {"$set": {"expires_at": self._expiry()}}
+        )
+        if res.matched_count == 0:
+            self.lost = True
+        return not self.lost
+
+    async def _renew_loop(self) -> None:
+        while not self.lost:
+            await asyncio.sleep(self.ttl_s / 3)
+            try:
+                await self.renew()
+            except Exception as e:
+                print(f"[lease] non-fatal: {self.name}: {e}")
+
+    async def release(self) -> None:
+        if self._keepalive is not None:
+            self._keepalive.cancel()
+            self._keepalive = None
+        if self.held:
+            self.held = False
+            await self.db.leases.update_one(
+                {"_id": self.name, "holder": self.token}, {"$set": {"holder": None, "expires_at": datetime.utcnow()}}
+            )
+
+    async def __aenter__(self) -> "Lease":
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.release()
@@ -61,7 +61,7 @@
 import os
 import json
 from datetime import datetime
-from typing import Tuple, Optional
+from typing import Iterator, List, Tuple, Optional
 
 from app.services import blockchain_service  # optional anchoring (non-fatal if fails)
 
@@ -165,6 +165,64 @@ def append_ledger(evidence_id: str, file_sha256: str) -> dict:
     return rec
 
 
+def append_ledger_many(items: List[Tuple[str, str]]) -> List[dict]:
+    """
+    Append one record per (evidence_id, file_sha256), chained exactly as
+    append_ledger would, with one read of the last record, one write + fsync
+    and a single anchor of the group's last record_hash (which commits to
+    every record before it).
+    """
+    if not items:
+        return []
+    _ensure_dirs()
+
+    last = _read_last_record()
+    prev = last["record_hash"] if last else "GENESIS"
+    index = int(last["index"]) + 1 if last else 0
+    ts = datetime.utcnow().isoformat() + "Z"
+
+    recs = []
+    for evidence_id, file_sha256 in items:
+        base = {
+            "index": index,
+            "timestamp": ts,
+            "evidence_id": evidence_id,
+            "sha256": file_sha256,
+            "prev_hash": prev,
+        }
+        prev = _compute_record_hash(base)
+        recs.append({**base, "record_hash": prev})
+        index += 1
+
+    with open(LEDGER_PATH, "a") as f:
+        f.write("".join(json.dumps(r, separators=(",", ":")) + "\n" for r in recs))
+        f.flush()
+        os.fsync(f.fileno())
+
+    try:
+        tip = recs[-1]
+        anchor_info = blockchain_service.maybe_anchor(tip["record_hash"])
+        if anchor_info:
+            with open(ANCHORS_PATH, "a") as sf:
+                sf.write(
+                    json.dumps(
+                        {
+                            "ledger_index": tip["index"],
+                            "record_hash": tip["record_hash"],
+                            "anchor": anchor_info,
+                            "group_start": recs[0]["index"],
+                        },
+                        separators=(",", ":"),
+                    )
+                    + "\n"
+                )
+    except Exception as e:
+        # Non-fatal by design
+        print(f"[ledger->anchor] non-fatal error: {e}")
+
+    return recs
+
+
 def verify_ledger() -> Tuple[bool, int]:
     """
     Verify the entire ledger chain.
@@ -199,3 +257,31 @@ def verify_ledger() -> Tuple[bool, int]:
             count += 1
 
     return True, count
+
+
+def iter_ledger() -> Iterator[Tuple[Optional[dict], bool]]:
+    """
+    Stream the ledger: (record, intact) per non-blank line, where intact is
+    False from the first line whose hash or prev_hash link doesn't verify.
+    record is None for a line that isn't valid JSON.
+    """
+    if not os.path.exists(LEDGER_PATH):
+        return
+    prev = "GENESIS"
+    intact = True
+    with open(LEDGER_PATH, "r") as f:
+        for line in f:
+            s = line.strip()
+            if not s:
+                continue
+            try:
+                rec = json.loads(s)
+            except Exception:
+                intact = False
+                yield None, False
+                continue
+            if intact:
+                base = {k: v for k, v in rec.items() if k != "record_hash"}
+                intact = base.get("prev_hash") == prev and _compute_record_hash(base) == rec.get("record_hash")
+                prev = rec.get("record_hash")
+            yield rec, intact
@@ -0,0 +1,158 @@
+# app/services/online_service.py
+"""
+Online anomaly detection (ANOMALY_DETECTOR=hst).
+
+Keeps one Half-Space Trees detector per process, primed from the latest
+events on first use and persisted to app/storage/models/hst.npz every
+HST_PERSIST_EVERY learned events. Each event is learned exactly once, at
+ingestion; /analyze/run only scores.
+
+The detector only sees the events its own process ingests, so hst needs a
+single worker (uvicorn --workers 1). claim() enforces that at startup: the
+process holds the "hst" lease for its lifetime and a second worker fails
+to start. A holder that loses the lease stops learning and saving.
+
+Severity thresholds come from the persisted score sketch for
+model version "hst" (see threshold_service).
+"""
+
+import asyncio
+import os
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from app.config import settings
+from app.ml.anomaly import analyze_events_online
+from app.ml.hstree import HalfSpaceTrees
+from app.ml.registry import MODEL_DIR
+from app.utils.features import ANALYSIS_FIELDS, FEATURE_FIELDS, build_features
+from app.services.lease_service import Lease
+from app.services.threshold_service import load_sketch, record_scores, thresholds
+from app.services.trajectory_service import previous_fixes
+from app.services import reuse_service
+
+HST_PATH = os.path.join(MODEL_DIR, "hst.npz")
+MODEL_VERSION = "hst"
+
+_detector: Optional[HalfSpaceTrees] = None
+_lock = asyncio.Lock()
+_since_save = 0
+_lease: Optional[Lease] = None
+
+
+def enabled() -> bool:
+    return settings.ANOMALY_DETECTOR.lower().strip() == "hst"
+
+
+async def claim(db: AsyncIOMotorDatabase) -> None:
+    """Take the "hst" lease for this process; raises if another worker keeps holding it."""
+    global _lease
+    lease = Lease(db, "hst")
+    # a crashed predecessor's lease lapses after ttl_s
+    deadline = time.monotonic() + lease.ttl_s * 1.5
+    while not await lease.acquire():
+        if time.monotonic() > deadline:
+            raise RuntimeError(
+                "ANOMALY_DETECTOR=hst keeps its detector in one process and another worker holds "
+                "the 'hst' lease; run a single worker"
+            )
+        await asyncio.sleep(lease.ttl_s / 6)
+    _lease = lease
+
+
+async def release() -> None:
+    if _lease is not None:
+        await _lease.release()
+
+
+def _lost() -> bool:
+    return _lease is not None and _lease.lost
+
+
+async def _get_detector(db: AsyncIOMotorDatabase) -> Optional[HalfSpaceTrees]:
+    global _detector
+    if _detector is not None:
+        return _detector
+    if os.path.exists(HST_PATH):
+        try:
+            _detector = HalfSpaceTrees.load(HST_PATH)
+            return _detector
+        except Exception as e:
+            print(f"[online] failed to load {HST_PATH}: {e}")
+    # cold start: prime from the most recent window of events
+    cur = db.events.find({}, FEATURE_FIELDS).sort([("timestamp", -1)]).limit(settings.HST_WINDOW_SIZE)
+    recent = [e async for e in cur]
+    if not recent:
+        return None
+    X, _ = build_features(recent)
+    _detector = HalfSpaceTrees(
+        n_trees=settings.HST_TREES,
+        depth=settings.HST_DEPTH,
+        window_size=settings.HST_WINDOW_SIZE,
+    ).prime(X)
+    return _detector
+
+
+def save_detector() -> None:
+    # after losing the lease the file belongs to the new holder
+    if _detector is not None and _detector.is_ready and not _lost():
+        _detector.save(HST_PATH)
+
+
+async def score_events(
+    db: AsyncIOMotorDatabase, events: List[Dict[str, Any]], learn: bool = False
+) -> List[Dict[str, Any]]:
+    """Score (and optionally learn) events; returns alert candidates."""
+    global _since_save
+    if not events:
+        return []
+    if learn and _lost():
+        print("[online] non-fatal: lost the 'hst' lease to another worker; not learning")
+        return []
+    async with _lock:
+        det = await _get_detector(db)
+        if det is None:
+            return []
+        dev_last = await previous_fixes(db, events)
+        thr = thresholds(await load_sketch(db, MODEL_VERSION))
+        extra = await reuse_service.reuse_reasons(db, events)
+        alerts, scores = analyze_events_online(
+            events, det, dev_last=dev_last, thresholds=thr, extra_reasons=extra, learn=learn
+        )
+        if learn:
+            await record_scores(db, MODEL_VERSION, "*", scores)
+            _since_save += len(scores)
+            if _since_save >= settings.HST_PERSIST_EVERY:
+                await asyncio.to_thread(save_detector)
+                _since_save = 0
+    return alerts
+
+
+async def _insert_alerts(db: AsyncIOMotorDatabase, alerts: List[Dict[str, Any]]) -> int:
+    if not alerts:
+        return 0
+    now = datetime.utcnow()
+    for a in alerts:
+        a.update({"created_at": now, "status": "open", "model_version": MODEL_VERSION})
+    await db.alerts.insert_many(alerts, ordered=False)
+    return len(alerts)
+
+
+async def observe_events(db: AsyncIOMotorDatabase, events: List[Dict[str, Any]]) -> None:
+    """Ingestion hook: learn the new events and store any alerts. Never raises."""
+    try:
+        alerts = await score_events(db, events, learn=True)
+        await _insert_alerts(db, alerts)
+    except Exception as e:
+        print(f"[online] non-fatal: {e}")
+
+
+async def run_latest(db: AsyncIOMotorDatabase, limit: int = 200) -> int:
+    """Score the latest `limit` events without learning them again."""
+    cur = db.events.find({}, ANALYSIS_FIELDS).sort([("timestamp", -1)]).limit(limit)
+    events = [e async for e in cur]
+    alerts = await score_events(db, events, learn=False)
+    return await _insert_alerts(db, alerts)
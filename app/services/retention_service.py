@@ -0,0 +1,255 @@
+# app/services/retention_service.py
+"""
+Tiered retention of evidence files by type and age ("raw files TTL
+configurable; ledger hashes retained").
+
+RETENTION_POLICIES maps an evidence `type` to
+{"cold_after_days": n, "delete_after_days": m} (0 = never); other types
+use the "default" entry. Age is created_at, or the ObjectId timestamp for
+documents stored before created_at was recorded.
+
+A pass walks the evidence in _id order, RETENTION_BATCH_SIZE documents at
+a time:
+
+  1. delete: evidence past delete_after_days loses its path and gets a
+     tombstone {deleted_at, policy, size}. sha256 and ledger_index stay,
+     so the ledger (and the scrubber) still prove what was stored. Its blob
+     loses a reference, and blob_service.gc() at the end of the pass
+     removes blobs nothing refers to any more.
+  2. cold: a blob is gzipped (blob_service.compress) once every live
+     evidence document referring to it is past its own cold_after_days
+     and it hasn't been read back since. Compression reads at most
+     RETENTION_MAX_MB_PER_S.
+
+Plain files of blobs that went cold in an earlier pass are removed once
+their grace period is over (blob_service.drop_stale_plain).
+
+A pass holds the "retention" lease, so with several workers one of them
+runs it; run_retention() skips a round while another worker holds it, and
+a pass that loses the lease stops before its next step.
+
+Only files in the blob store are handled; run
+scripts/migrate_evidence_cas.py for older ones. Each pass is logged to
+`retention_runs`, which a TTL index expires after RETENTION_LOG_TTL_DAYS.
+Evidence documents, tombstones and the ledger never expire.
+"""
+
+import asyncio
+import os
+import re
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from bson import ObjectId
+from fastapi import HTTPException
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+
+from app.config import settings
+from app.services import blob_service
+from app.services.lease_service import Lease
+from app.utils.throttle import Throttle
+
+_lock = asyncio.Lock()
+
+
+def _policies() -> Dict[str, Dict[str, float]]:
+    pols = {k: dict(v) for k, v in settings.RETENTION_POLICIES.items()}
+    pols.setdefault("default", {})
+    return pols
+
+
+def _policy(pols: Dict[str, Dict[str, float]], ev_type: Optional[str]) -> Dict[str, float]:
+    return pols.get(ev_type or "", pols["default"])
+
+
+def _age_of(doc: Dict[str, Any]) -> datetime:
+    if doc.get("created_at"):
+        return doc["created_at"]
+    if isinstance(doc["_id"], ObjectId):
+        return doc["_id"].generation_time.replace(tzinfo=None)
+    # string ids from before created_at: treat as new, never as expired
+    return datetime.utcnow()
+
+
+def _older_than(cutoff: datetime) -> Dict[str, Any]:
+    return {
+        "$or": [
+            {"created_at": {"$lt": cutoff}},
+            {"created_at": {"$exists": False}, "_id": {"$lt": ObjectId.from_datetime(cutoff)}},
+        ]
+    }
+
+
+def _of_type(pols: Dict[str, Dict[str, float]], ev_type: str) -> Dict[str, Any]:
+    if ev_type == "default":
+        return {"type": {"$nin": [t for t in pols if t != "default"]}}
+    return {"type": ev_type}
+
+
+def _live_blobs() -> Dict[str, Any]:
+    return {
+        "tombstone": {"$exists": False},
+        "sha256": {"$exists": True},
+        "path": {"$regex": "^" + re.escape(blob_service.BLOB_DIR + os.sep)},
+    }
+
+
+async def _delete_expired(db: AsyncIOMotorDatabase, pols: Dict[str, Dict[str, float]], now: datetime) -> Dict[str, int]:
+    stats = {"deleted": 0, "released_bytes": 0}
+    for ev_type, pol in pols.items():
+        days = pol.get("delete_after_days") or 0
+        if days <= 0:
+            continue
+        q = {"$and": [_of_type(pols, ev_type), _older_than(now - timedelta(days=days)), _live_blobs()]}
+        batch: List[Dict[str, Any]] = []
+        cursor = db.evidence.find(q, {"sha256": 1, "size": 1}).sort("_id", 1).batch_size(settings.RETENTION_BATCH_SIZE)
+        async for d in cursor:
+            batch.append(d)
+            if len(batch) >= settings.RETENTION_BATCH_SIZE:
+                await _tombstone(db, batch, ev_type, now, stats)
+                batch = []
+        if batch:
+            await _tombstone(db, batch, ev_type, now, stats)
+    return stats
+
+
+async def _tombstone(
+    db: AsyncIOMotorDatabase, docs: List[Dict[str, Any]], policy: str, now: datetime, stats: Dict[str, int]
+) -> None:
+    ops = [
+        UpdateOne(
+            {"_id": d["_id"], "tombstone": {"$exists": False}},
+            {
+                "$set": {"tombstone": {"deleted_at": now, "policy": policy, "size": d.get("size")}},
+                "$unset": {"path": "", "storage_tier": ""},
+            },
+        )
+        for d in docs
+    ]
+    res = await db.evidence.bulk_write(ops, ordered=False)
+    if res.modified_count < len(docs):
+        # some were tombstoned since the read (another pass): release only ours
+        ours = db.evidence.find(
+            {"_id": {"$in": [d["_id"] for d in docs]}, "tombstone.deleted_at": now, "tombstone.policy": policy},
+            {"_id": 1},
+        )
+        mine = {d["_id"] async for d in ours}
+        docs = [d for d in docs if d["_id"] in mine]
+    for d in docs:
+        await blob_service.release(db, d["sha256"])
+    stats["deleted"] += len(docs)
+    stats["released_bytes"] += sum(d.get("size") or 0 for d in docs)
+
+
+async def _cold_ready(
+    db: AsyncIOMotorDatabase, shas: List[str], pols: Dict[str, Dict[str, float]], now: datetime
+) -> List[str]:
+    """shas whose every live evidence doc is past its cold age and whose blob wasn't read since."""
+    ready = {sha: True for sha in shas}
+    newest: Dict[str, datetime] = {}
+    async for d in db.evidence.find(
+        {"sha256": {"$in": shas}, "tombstone": {"$exists": False}}, {"sha256": 1, "type": 1, "created_at": 1}
+    ):
+        days = _policy(pols, d.get("type")).get("cold_after_days") or 0
+        cutoff = now - timedelta(days=days)
+        if days <= 0 or _age_of(d) >= cutoff:
+            ready[d["sha256"]] = False
+        newest[d["sha256"]] = max(newest.get(d["sha256"], cutoff), cutoff)
+    async for b in db.blobs.find({"_id": {"$in": shas}, "last_access": {"$exists": True}}, {"last_access": 1}):
+        if b["last_access"] >= newest.get(b["_id"], now):
+            ready[b["_id"]] = False
+    return [sha for sha, ok in ready.items() if ok]
+
+
+async def _compress_cold(db: AsyncIOMotorDatabase, pols: Dict[str, Dict[str, float]], now: datetime) -> Dict[str, int]:
+    throttle = Throttle(settings.RETENTION_MAX_MB_PER_S * 2**20)
+    stats = {"compressed": 0, "cold_uncompressed": 0, "saved_bytes": 0}
+    seen = set()
+    for ev_type, pol in pols.items():
+        days = pol.get("cold_after_days") or 0
+        if days <= 0:
+            continue
+        q = {
+            "$and": [
+                _of_type(pols, ev_type),
+                _older_than(now - timedelta(days=days)),
+                _live_blobs(),
+                {"storage_tier": {"$ne": "cold"}},
+            ]
+        }
+        cursor = db.evidence.find(q, {"sha256": 1}).sort("_id", 1).batch_size(settings.RETENTION_BATCH_SIZE)
+        shas: List[str] = []
+        async for d in cursor:
+            if d["sha256"] not in seen:
+                seen.add(d["sha256"])
+                shas.append(d["sha256"])
+            if len(shas) >= settings.RETENTION_BATCH_SIZE:
+                await _compress_batch(db, shas, pols, now, throttle, stats)
+                shas = []
+        if shas:
+            await _compress_batch(db, shas, pols, now, throttle, stats)
+    return stats
+
+
+async def _compress_batch(
+    db: AsyncIOMotorDatabase,
+    shas: List[str],
+    pols: Dict[str, Dict[str, float]],
+    now: datetime,
+    throttle: Throttle,
+    stats: Dict[str, int],
+) -> None:
+    for sha in await _cold_ready(db, shas, pols, now):
+        try:
+            res = await blob_service.compress(db, sha, throttle)
+        except OSError as e:
+            print(f"[retention] non-fatal: {sha}: {e}")
+            continue
+        if res is None:
+            continue
+        if res > 0:
+            stats["compressed"] += 1
+            stats["saved_bytes"] += res
+        else:
+            stats["cold_uncompressed"] += 1
+
+
+async def retention_pass(db: AsyncIOMotorDatabase) -> Dict[str, Any]:
+    """Apply RETENTION_POLICIES once; returns the pass's retention_runs record."""
+    if _lock.locked():
+        raise HTTPException(status_code=409, detail="Retention pass already running")
+    async with _lock, Lease(db, "retention") as lease:
+        if not lease.held:
+            raise HTTPException(status_code=409, detail="Retention pass already running in another worker")
+        now = datetime.utcnow()
+        pols = _policies()
+        run: Dict[str, Any] = {"started_at": now, "policies": pols}
+        run.update(await _delete_expired(db, pols, now))
+        # a lost lease (another worker took over) ends the pass between steps
+        if not lease.lost:
+            run.update(await _compress_cold(db, pols, now))
+        if not lease.lost:
+            run["plain_removed"] = await blob_service.drop_stale_plain(db)
+            run["blobs_removed"] = await blob_service.gc(db)
+        if lease.lost:
+            run["lease_lost"] = True
+        run["finished_at"] = datetime.utcnow()
+        await db.retention_runs.insert_one(dict(run))
+        return run
+
+
+async def run_retention(db: AsyncIOMotorDatabase) -> None:
+    """Background loop: a pass every RETENTION_INTERVAL_HOURS. Never raises (except on cancel)."""
+    while True:
+        try:
+            await retention_pass(db)
+        except asyncio.CancelledError:
+            raise
+        except HTTPException as e:
+            # 409: a pass is already running here or in another worker
+            if e.status_code != 409:
+                print(f"[retention] non-fatal: {e.detail}")
+        except Exception as e:
+            print(f"[retention] non-fatal: {e}")
+        await asyncio.sleep(settings.RETENTION_INTERVAL_HOURS * 3600)
@@ -0,0 +1,79 @@
+# app/services/reuse_service.py
+"""
+Persistent side of beneficiary reuse detection.
+
+On ingestion every (beneficiary, event) pair is written to the
+`beneficiary_claims` collection, indexed on (beneficiary_id, timestamp).
+Checking a batch is one indexed `$in` lookup over its beneficiaries in the
+relevant time range, replayed through an in-memory BeneficiaryIndex; no
+scan of the events collection is involved.
+"""
+
+from datetime import timedelta
+from typing import Any, Dict, List
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from app.config import settings
+from app.ml.reuse import BeneficiaryIndex
+
+
+def _window() -> timedelta:
+    return timedelta(hours=settings.REUSE_WINDOW_HOURS)
+
+
+def claim_docs(events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    docs = []
+    for ev in events:
+        for bid in set(ev.get("beneficiary_ids") or []):
+            docs.append(
+                {
+                    "beneficiary_id": str(bid),
+                    "event_id": str(ev["_id"]),
+                    "ngo_id": ev.get("ngo_id"),
+                    "donor_id": ev.get("donor_id"),
+                    "timestamp": ev["timestamp"],
+                }
+            )
+    return docs
+
+
+async def record_claims(db: AsyncIOMotorDatabase, events: List[Dict[str, Any]]) -> int:
+    """Ingestion hook: index the beneficiaries of newly stored events."""
+    docs = claim_docs(events)
+    if docs:
+        await db.beneficiary_claims.insert_many(docs, ordered=False)
+    return len(docs)
+
+
+async def reuse_reasons(db: AsyncIOMotorDatabase, events: List[Dict[str, Any]]) -> Dict[Any, List[str]]:
+    """event_id -> ["beneficiary_reuse"] for stored events, looking back REUSE_WINDOW_HOURS."""
+    events = [ev for ev in events if ev.get("beneficiary_ids")]
+    if not events:
+        return {}
+    bids = sorted({str(b) for ev in events for b in ev["beneficiary_ids"]})
+    lo = min(ev["timestamp"] for ev in events) - _window()
+    hi = max(ev["timestamp"] for ev in events)
+    idx = new_index()
+    cur = db.beneficiary_claims.find(
+        {"beneficiary_id": {"$in": bids}, "timestamp": {"$gte": lo, "$lte": hi}},
+        {"_id": 0},
+    )
+    async for c in cur:
+        idx.add(c["event_id"], c["timestamp"], [c["beneficiary_id"]], c.get("ngo_id"), c.get("donor_id"))
+
+    out: Dict[Any, List[str]] = {}
+    for ev in events:
+        reasons = idx.reuse_reasons(ev)
+        if reasons:
+            out[ev["_id"]] = reasons
+    return out
+
+
+def new_index() -> BeneficiaryIndex:
+    """In-memory index configured from settings (for chunked batch runs)."""
+    return BeneficiaryIndex(
+        window_s=_window().total_seconds(),
+        min_ngos=settings.REUSE_MIN_NGOS,
+        min_donors=settings.REUSE_MIN_DONORS,
+    )
@@ -0,0 +1,366 @@
+# app/services/scrub_service.py
+"""
+Evidence integrity scrubber: stored files vs evidence documents vs the
+hash ledger.
+
+A pass walks evidence in _id order, SCRUB_BATCH_SIZE documents at a time:
+
+  - each distinct file in the batch (blobs are shared) is re-hashed on a
+    thread pool of SCRUB_WORKERS. Files are mmap'ed and hashed in
+    HASH_CHUNK slices (cold, gzipped blobs are hashed decompressed), and
+    the threads share a SCRUB_MAX_MB_PER_S byte budget so the scrub
+    doesn't starve uploads and downloads of I/O. Tombstoned evidence
+    (file deleted by retention) only has its ledger hash checked;
+  - the file hash is compared with evidence.sha256, and evidence.sha256
+    with the ledger record at its ledger_index. The ledger is read once
+    per pass (and verified as it is read) into 32-byte digests by index;
+  - results go to `scrub` on each document with one bulk_write, and
+    problems to alerts (model_version "scrub") with reasons
+    evidence_file_missing, evidence_hash_mismatch, ledger_record_missing
+    and ledger_hash_mismatch. Evidence that was already flagged with the
+    same reasons isn't alerted again;
+  - the checkpoint (last _id and running counts) is saved to `scrub_state`
+    after every batch, so an interrupted pass resumes where it stopped.
+
+At the end of a pass, ledger records no evidence document points to are
+alerted as evidence_doc_missing (deleted documents, or uploads whose
+insert failed after the ledger append), and a broken ledger chain as
+ledger_chain_broken.
+
+A pass holds the "scrub" lease (app/services/lease_service.py), so one
+worker scrubs at a time; a worker that loses the lease stops at its next
+checkpoint. run_scrubber() repeats passes every SCRUB_INTERVAL_HOURS in
+the background (started from app/main.py; 0 = only on request) and skips
+a round while another worker holds the lease. POST /evidence/scrub
+without max_docs starts a pass in the background (start_pass).
+"""
+
+import asyncio
+import gzip
+import hashlib
+import mmap
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set
+
+from fastapi import HTTPException
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+
+from app.config import settings
+from app.services import blob_service
+from app.services.lease_service import Lease
+from app.services.ledger_service import iter_ledger
+from app.utils.throttle import Throttle
+
+STATE_ID = "evidence"
+LEASE = "scrub"
+HASH_CHUNK = 8 << 20
+SCRUB_FIELDS = {"_id": 1, "event_id": 1, "path": 1, "sha256": 1, "ledger_index": 1, "scrub": 1, "tombstone": 1}
+COUNTERS = ("checked", "files_hashed", "bytes_hashed", "problems", "alerts")
+SEVERE = {"evidence_file_missing", "evidence_hash_mismatch", "ledger_hash_mismatch"}
+
+_lock = asyncio.Lock()
+_pool: Optional[ThreadPoolExecutor] = None
+_tasks: Set[asyncio.Task] = set()  # passes started by start_pass
+
+
+def get_pool() -> ThreadPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=max(1, settings.SCRUB_WORKERS))
+    return _pool
+
+
+def _hash_gzip(path: str, throttle: Throttle) -> tuple:
+    # cold blobs: hash the decompressed content, budgeting what is read from disk
+    h = hashlib.sha256()
+    size = 0
+    with open(path, "rb") as raw, gzip.GzipFile(fileobj=raw) as f:
+        pos = 0
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+            throttle.take(raw.tell() - pos)
+            pos = raw.tell()
+            h.update(chunk)
+            size += len(chunk)
+    return h.hexdigest(), size
+
+
+def _hash_file(path: str, throttle: Throttle) -> Optional[tuple]:
+    """(sha256, size) of a file's content, or None if it is missing."""
+    try:
+        if blob_service.is_cold(path):
+            return _hash_gzip(path, throttle)
+        f = open(path, "rb")
+    except FileNotFoundError:
+        return None
+    h = hashlib.sha256()
+    with f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return h.hexdigest(), 0
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            if hasattr(mmap, "MADV_SEQUENTIAL"):
+                m.madvise(mmap.MADV_SEQUENTIAL)
+            with memoryview(m) as view:
+                for off in range(0, size, HASH_CHUNK):
+                    with view[off : off + HASH_CHUNK] as piece:
+                        throttle.take(len(piece))
+                        h.update(piece)
+    return h.hexdigest(), size
+
+
+def _load_ledger() -> Dict[str, Any]:
+    """{"shas": 32 bytes per index (zeros = no record), "count", "broken_at"}."""
+    shas = bytearray()
+    broken_at = None
+    count = 0
+    for rec, intact in iter_ledger():
+        if not intact and broken_at is None:
+            broken_at = count
+        count += 1
+        if rec is None:
+            continue
+        try:
+            i, digest = int(rec["index"]), bytes.fromhex(rec["sha256"])
+        except (KeyError, TypeError, ValueError):
+            continue
+        if len(digest) != 32 or i < 0:
+            continue
+        end = (i + 1) * 32
+        if len(shas) < end:
+            shas.extend(bytes(end - len(shas)))
+        shas[i * 32 : end] = digest
+    return {"shas": shas, "count": count, "broken_at": broken_at}
+
+
+def _ledger_sha(ledger: Dict[str, Any], index: int) -> Optional[str]:
+    d = ledger["shas"][index * 32 : (index + 1) * 32]
+    return d.hex() if len(d) == 32 and any(d) else None
+
+
+def _alert(doc: Dict[str, Any], reasons: List[str], now: datetime, **extra: Any) -> Dict[str, Any]:
+    return {
+        "event_id": str(doc["event_id"]) if doc.get("event_id") is not None else None,
+        "evidence_id": str(doc["_id"]) if doc.get("_id") is not None else None,
+        "severity": 2 if SEVERE & set(reasons) else 1,
+        "reasons": reasons,
+        "score": float(len(reasons)),
+        **extra,
+        "created_at": now,
+        "status": "open",
+        "model_version": "scrub",
+    }
+
+
+async def _scrub_batch(
+    db: AsyncIOMotorDatabase, docs: List[Dict[str, Any]], ledger: Dict[str, Any], throttle: Throttle
+) -> Dict[str, int]:
+    loop = asyncio.get_running_loop()
+    paths = sorted({d["path"] for d in docs if d.get("path")})
+    results = await asyncio.gather(*(loop.run_in_executor(get_pool(), _hash_file, p, throttle) for p in paths))
+    hashed = dict(zip(paths, results))
+
+    now = datetime.utcnow()
+    ops: List[UpdateOne] = []
+    alerts: List[Dict[str, Any]] = []
+    problems = 0
+    for d in docs:
+        reasons: List[str] = []
+        # tombstoned evidence (file deleted by retention) only has its ledger hash checked
+        found = hashed.get(d.get("path"))
+        if found is None and not d.get("tombstone"):
+            reasons.append("evidence_file_missing")
+        elif found is not None and d.get("sha256") and found[0] != d["sha256"]:
+            reasons.append("evidence_hash_mismatch")
+        li = d.get("ledger_index")
+        if li is not None and d.get("sha256"):
+            recorded = _ledger_sha(ledger, int(li))
+            if recorded is None:
+                reasons.append("ledger_record_missing")
+            elif recorded != d["sha256"]:
+                reasons.append("ledger_hash_mismatch")
+        ops.append(
+            UpdateOne({"_id": d["_id"]}, {"$set": {"scrub": {"ok": not reasons, "reasons": reasons, "checked_at": now}}})
+        )
+        if not reasons:
+            continue
+        problems += 1
+        prev = d.get("scrub") or {}
+        if prev.get("ok") is False and prev.get("reasons") == reasons:
+            # already alerted in an earlier pass
+            continue
+        alerts.append(_alert(d, reasons, now, ledger_index=li, file_sha256=found[0] if found else None))
+    if ops:
+        await db.evidence.bulk_write(ops, ordered=False)
+    if alerts:
+        await db.alerts.insert_many(alerts, ordered=False)
+    return {
+        "checked": len(docs),
+        "files_hashed": sum(1 for r in results if r is not None),
+        "bytes_hashed": sum(r[1] for r in results if r is not None),
+        "problems": problems,
+        "alerts": len(alerts),
+    }
+
+
+async def _reconcile_ledger(db: AsyncIOMotorDatabase, ledger: Dict[str, Any]) -> int:
+    """
+    Alerts for ledger records without an evidence document and for a broken
+    chain. Documents from before ledger_index was recorded can't be matched
+    to their records, so only records from the smallest ledger_index present
+    in evidence on are checked.
+    """
+    n = len(ledger["shas"]) // 32
+    seen = bytearray(n)
+    first = n
+    async for d in db.evidence.find({"ledger_index": {"$ne": None}}, {"_id": 0, "ledger_index": 1}):
+        i = int(d["ledger_index"])
+        first = min(first, i)
+        if 0 <= i < n:
+            seen[i] = 1
+    now = datetime.utcnow()
+    alerts = [
+        _alert({}, ["evidence_doc_missing"], now, ledger_index=i, file_sha256=_ledger_sha(ledger, i))
+        for i in range(max(first, 0), n)
+        if not seen[i] and _ledger_sha(ledger, i)
+    ]
+    if ledger["broken_at"] is not None:
+        alerts.append(_alert({}, ["ledger_chain_broken"], now, ledger_index=ledger["broken_at"]))
+    if not alerts:
+        return 0
+    # one alert per ledger record and reason, however many passes find it
+    known = {
+        (a.get("ledger_index"), tuple(a["reasons"]))
+        async for a in db.alerts.find(
+            {"model_version": "scrub", "evidence_id": None}, {"_id": 0, "ledger_index": 1, "reasons": 1}
+        )
+    }
+    alerts = [a for a in alerts if (a["ledger_index"], tuple(a["reasons"])) not in known]
+    for i in range(0, len(alerts), 1000):
+        await db.alerts.insert_many(alerts[i : i + 1000], ordered=False)
+    return len(alerts)
+
+
+async def scrub_pass(db: AsyncIOMotorDatabase, max_docs: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Continue (or start) a pass from the checkpoint; stops early after
+    max_docs documents. Returns the scrub_state document.
+    """
+    if _lock.locked():
+        raise HTTPException(status_code=409, detail="Scrub already running")
+    async with _lock, Lease(db, LEASE) as lease:
+        if not lease.held:
+            raise HTTPException(status_code=409, detail="Scrub already running in another worker")
+        return await _pass(db, lease, max_docs)
+
+
+async def start_pass(db: AsyncIOMotorDatabase) -> Dict[str, Any]:
+    """Start a full pass in the background; returns the status as it starts."""
+    if _lock.locked():
+        raise HTTPException(status_code=409, detail="Scrub already running")
+    await _lock.acquire()
+    lease = Lease(db, LEASE)
+    try:
+        if not await lease.acquire():
+            raise HTTPException(status_code=409, detail="Scrub already running in another worker")
+    except BaseException:
+        await lease.release()
+        _lock.release()
+        raise
+    task = asyncio.create_task(_run_started(db, lease))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    return await status(db)
+
+
+async def _run_started(db: AsyncIOMotorDatabase, lease: Lease) -> None:
+    # owns the _lock and lease taken by start_pass
+    try:
+        await _pass(db, lease, None)
+    except Exception as e:
+        print(f"[scrub] non-fatal: {e}")
+    finally:
+        await lease.release()
+        _lock.release()
+
+
+async def _pass(db: AsyncIOMotorDatabase, lease: Lease, max_docs: Optional[int]) -> Dict[str, Any]:
+    state = await db.scrub_state.find_one({"_id": STATE_ID}) or {}
+    if state.get("last_id") is None:
+        state = {
+            "_id": STATE_ID,
+            "passes": state.get("passes", 0),
+            "last_completed_at": state.get("last_completed_at"),
+            "last_id": None,
+            "started_at": datetime.utcnow(),
+            **{k: 0 for k in COUNTERS},
+        }
+        await db.scrub_state.replace_one({"_id": STATE_ID}, state, upsert=True)
+
+    ledger = await asyncio.to_thread(_load_ledger)
+    throttle = Throttle(settings.SCRUB_MAX_MB_PER_S * 2**20)
+    q = {"_id": {"$gt": state["last_id"]}} if state["last_id"] is not None else {}
+    done = 0
+    batch: List[Dict[str, Any]] = []
+    cursor = db.evidence.find(q, SCRUB_FIELDS).sort("_id", 1).batch_size(settings.SCRUB_BATCH_SIZE)
+    async for d in cursor:
+        batch.append(d)
+        if len(batch) >= settings.SCRUB_BATCH_SIZE or (max_docs and done + len(batch) >= max_docs):
+            state = await _checkpoint(db, batch, await _scrub_batch(db, batch, ledger, throttle))
+            done += len(batch)
+            batch = []
+            # lease lost: another worker may have taken over from this checkpoint
+            if (max_docs and done >= max_docs) or lease.lost:
+                return _public(state)
+    if batch:
+        state = await _checkpoint(db, batch, await _scrub_batch(db, batch, ledger, throttle))
+    if lease.lost:
+        return _public(state)
+
+    orphans = await _reconcile_ledger(db, ledger)
+    await db.scrub_state.update_one(
+        {"_id": STATE_ID},
+        {
+            "$set": {"last_id": None, "last_completed_at": datetime.utcnow(), "ledger_records": ledger["count"]},
+            "$inc": {"passes": 1, "alerts": orphans},
+        },
+    )
+    return _public(await db.scrub_state.find_one({"_id": STATE_ID}))
+
+
+def _public(state: Dict[str, Any]) -> Dict[str, Any]:
+    out = {k: v for k, v in state.items() if k != "_id"}
+    if out.get("last_id") is not None:
+        out["last_id"] = str(out["last_id"])
+    return out
+
+
+async def _checkpoint(db: AsyncIOMotorDatabase, batch: List[Dict[str, Any]], counts: Dict[str, int]) -> dict:
+    await db.scrub_state.update_one(
+        {"_id": STATE_ID}, {"$set": {"last_id": batch[-1]["_id"], "updated_at": datetime.utcnow()}, "$inc": counts}
+    )
+    return await db.scrub_state.find_one({"_id": STATE_ID})
+
+
+async def status(db: AsyncIOMotorDatabase) -> Dict[str, Any]:
+    state = await db.scrub_state.find_one({"_id": STATE_ID}) or {"passes": 0}
+    lease = await db.leases.find_one({"_id": LEASE, "holder": {"$ne": None}, "expires_at": {"$gt": datetime.utcnow()}})
+    return {**_public(state), "running": _lock.locked() or lease is not None}
+
+
+async def run_scrubber(db: AsyncIOMotorDatabase) -> None:
+    """Background loop: a pass every SCRUB_INTERVAL_HOURS. Never raises (except on cancel)."""
+    while True:
+        try:
+            await scrub_pass(db)
+        except asyncio.CancelledError:
+            raise
+        except HTTPException as e:
+            # 409: a pass is already running here or in another worker
+            if e.status_code != 409:
+                print(f"[scrub] non-fatal: {e.detail}")
+        except Exception as e:
+            print(f"[scrub] non-fatal: {e}")
+        await asyncio.sleep(settings.SCRUB_INTERVAL_HOURS * 3600)
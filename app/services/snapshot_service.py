@@ -0,0 +1,90 @@
+# app/services/snapshot_service.py
+"""
+Keeps the columnar event snapshot (app/storage/snapshot) in step with Mongo.
+
+A refresh reads only events past the snapshot's (timestamp, _id) watermark,
+in index order, and appends them batch by batch. Events written later with
+an older timestamp than the watermark are only picked up by a rebuild.
+
+The .bin files and meta.json are shared by every worker, so a refresh
+holds the "snapshot" lease (409 while another worker has it) and re-reads
+meta.json, the watermark and count another worker may have advanced,
+before appending. Readers use current(), which only picks up what a
+writer has committed.
+"""
+
+import asyncio
+import os
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from bson import ObjectId
+from fastapi import HTTPException
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from app.config import settings
+from app.ml.columnar import ColumnStore
+from app.services.lease_service import Lease
+from app.utils.features import ANALYSIS_FIELDS
+
+SNAPSHOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "storage", "snapshot"))
+
+_store: Optional[ColumnStore] = None
+_lock = asyncio.Lock()
+
+
+def get_store() -> ColumnStore:
+    global _store
+    if _store is None:
+        # no recovery here: another worker may be mid-append; refresh() recovers under the lease
+        _store = ColumnStore(SNAPSHOT_DIR, recover=False)
+    return _store
+
+
+async def current() -> ColumnStore:
+    """The store as last committed by any worker."""
+    store = get_store()
+    if not _lock.locked():
+        # while this process refreshes, its own in-memory meta is the newest
+        await asyncio.to_thread(store.reload, False)
+    return store
+
+
+def _after(store: ColumnStore) -> Dict[str, Any]:
+    wm = store.meta.get("watermark")
+    if not wm:
+        return {}
+    ts = datetime.fromisoformat(wm["iso"])
+    last_id = ObjectId(wm["id"]) if ObjectId.is_valid(wm["id"]) else wm["id"]
+    return {"$or": [{"timestamp": {"$gt": ts}}, {"timestamp": ts, "_id": {"$gt": last_id}}]}
+
+
+async def refresh(db: AsyncIOMotorDatabase, rebuild: bool = False, batch_size: Optional[int] = None) -> Dict[str, Any]:
+    """Append events past the watermark; returns rows added and the snapshot size."""
+    batch_size = batch_size or settings.ANALYZE_BATCH_SIZE
+    async with _lock, Lease(db, "snapshot") as lease:
+        if not lease.held:
+            raise HTTPException(status_code=409, detail="Snapshot refresh already running")
+        store = get_store()
+        # another worker may have appended since this process last looked
+        await asyncio.to_thread(store.reload)
+        if rebuild:
+            await asyncio.to_thread(store.reset)
+        cur = (
+            db.events.find(_after(store), ANALYSIS_FIELDS)
+            .sort([("timestamp", 1), ("_id", 1)])
+            .batch_size(batch_size)
+        )
+        added = 0
+        chunk: List[Dict[str, Any]] = []
+        async for ev in cur:
+            chunk.append(ev)
+            if len(chunk) >= batch_size:
+                added += await asyncio.to_thread(store.append, chunk)
+                chunk = []
+                if lease.lost:
+                    # taken over: the new holder continues from the committed meta.json
+                    return {"added": added, "rows": store.count}
+        if chunk:
+            added += await asyncio.to_thread(store.append, chunk)
+        return {"added": added, "rows": store.count}
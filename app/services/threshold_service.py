@@ -0,0 +1,69 @@
+# app/services/threshold_service.py
+"""
+Persistent per-(model version, segment) score sketches.
+
+Each sketch lives in the `score_sketches` collection and is updated with a
+single atomic `$inc` of bucket counts, so concurrent workers merge exactly
+without read-modify-write races.
+"""
+
+from datetime import datetime
+from typing import Iterable, Optional, Tuple
+
+import numpy as np
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+
+from app.config import settings
+from app.ml.quantiles import QuantileSketch
+
+
+def _sketch_id(model_version: str, segment: str) -> str:
+    return f"{model_version}|{segment}"
+
+
+def _new_sketch() -> QuantileSketch:
+    return QuantileSketch(alpha=settings.SKETCH_ALPHA)
+
+
+async def load_sketch(db: AsyncIOMotorDatabase, model_version: str, segment: str = "*") -> QuantileSketch:
+    doc = await db.score_sketches.find_one({"_id": _sketch_id(model_version, segment)})
+    return QuantileSketch.from_dict(doc) if doc else _new_sketch()
+
+
+async def record_scores(
+    db: AsyncIOMotorDatabase,
+    model_version: str,
+    segment: str,
+    scores: Iterable[float],
+) -> QuantileSketch:
+    """Fold `scores` into the persisted sketch and return the merged sketch."""
+    delta = _new_sketch().update(np.asarray(scores, dtype=float))
+    if delta.count == 0:
+        return await load_sketch(db, model_version, segment)
+    inc = {f"bins.{k}": v for k, v in delta.to_dict()["bins"].items()}
+    inc.update({"count": delta.count, "zero_count": delta.zero_count})
+    doc = await db.score_sketches.find_one_and_update(
+        {"_id": _sketch_id(model_version, segment)},
+        {
+            "$inc": inc,
+            "$set": {"updated_at": datetime.utcnow()},
+            "$setOnInsert": {
+                "model_version": model_version,
+                "segment": segment,
+                "alpha": delta.alpha,
+                "max_buckets": delta.max_buckets,
+                "min_value": delta.min_value,
+            },
+        },
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    return QuantileSketch.from_dict(doc)
+
+
+def thresholds(sketch: QuantileSketch, p97: float = 97.0, p99: float = 99.0) -> Optional[Tuple[float, float]]:
+    """(thr97, thr99) from a sketch, or None until it has seen SKETCH_MIN_COUNT scores."""
+    if sketch.count < settings.SKETCH_MIN_COUNT:
+        return None
+    return sketch.percentile(p97), sketch.percentile(p99)
@@ -0,0 +1,54 @@
+# app/services/trajectory_service.py
+"""
+Seeds per-device trajectory carry-over from Mongo.
+
+Each lookup is a single seek on the (device_id, timestamp) compound index,
+so cost stays O(#devices * log n) however large the events collection grows.
+"""
+
+import asyncio
+from typing import Any, Dict, List, Optional
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from app.utils.trajectory import epoch_seconds
+
+_CONCURRENCY = 64
+
+
+async def _last_fix(db: AsyncIOMotorDatabase, device_id: str, before: Any) -> Optional[tuple]:
+    prev = await db.events.find_one(
+        {"device_id": device_id, "timestamp": {"$lt": before}},
+        {"gps": 1, "timestamp": 1},
+        sort=[("timestamp", -1)],
+    )
+    if not prev:
+        return None
+    return (epoch_seconds(prev["timestamp"]), prev["gps"]["lat"], prev["gps"]["lon"])
+
+
+async def previous_fixes(
+    db: AsyncIOMotorDatabase,
+    events: List[Dict[str, Any]],
+    carry: Optional[Dict[str, tuple]] = None,
+) -> Dict[str, tuple]:
+    """
+    Fill `carry` (device_id -> (epoch_s, lat, lon)) with each device's last fix
+    before its earliest event in `events`. Devices already in `carry` are skipped.
+    """
+    carry = {} if carry is None else carry
+    first: Dict[str, Any] = {}
+    for ev in events:
+        dev = ev["device_id"]
+        if dev in carry:
+            continue
+        if dev not in first or ev["timestamp"] < first[dev]:
+            first[dev] = ev["timestamp"]
+    items = list(first.items())
+    for i in range(0, len(items), _CONCURRENCY):
+        batch = items[i : i + _CONCURRENCY]
+        fixes = await asyncio.gather(*(_last_fix(db, dev, ts) for dev, ts in batch))
+        for (dev, _), fix in zip(batch, fixes):
+            if fix is not None:
+                carry[dev] = fix
+    return carry
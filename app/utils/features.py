@@ -1,30 +1,52 @@
 # app/utils/features.py
 from datetime import datetime
-from typing import List, Dict, Any, Tuple
-from app.utils.geo import haversine_km
+from typing import List, Dict, Any, Optional, Tuple
+import numpy as np
+from app.utils.trajectory import epoch_seconds, implied_speeds
 
-def build_features(events: List[Dict[str, Any]]) -> Tuple[list[list[float]], list[str]]:
+# Only the fields build_features() reads; use as a Mongo projection when streaming.
+FEATURE_FIELDS = {
+    "_id": 1,
+    "timestamp": 1,
+    "device_id": 1,
+    "gps": 1,
+    "quantity": 1,
+    "beneficiary_ids": 1,
+}
+
+# Feature fields plus the actor ids that cross-event reasons (beneficiary reuse) need.
+ANALYSIS_FIELDS = {**FEATURE_FIELDS, "ngo_id": 1, "donor_id": 1}
+
+def build_features(
+    events: List[Dict[str, Any]],
+    dev_last: Optional[Dict[str, tuple]] = None,
+) -> Tuple[np.ndarray, list[str]]:
     """
-    Minimal demo features:
-      [quantity, hour, gps_jump_km, unique_beneficiaries]
+    Minimal demo features, one row per event (time-ordered):
+      [quantity, hour, gps_jump_km, unique_beneficiaries, speed_kmh]
+
+    Returns (X, meta): X is a float ndarray of shape (n, 5), meta the event ids.
+    speed_kmh is the implied speed from the same device's previous fix.
+    Pass the same `dev_last` dict across calls when feeding time-ordered chunks;
+    it carries each device's last (epoch_s, lat, lon) so jumps and speeds stay
+    correct at chunk boundaries.
     """
     events_sorted = sorted(events, key=lambda x: x["timestamp"])
-    dev_last: Dict[str, tuple[float, float]] = {}
-    X: list[list[float]] = []
-    meta: list[str] = []
+    n = len(events_sorted)
+    if not n:
+        return np.empty((0, 5), dtype=float), []
+
+    ts = [ev["timestamp"] for ev in events_sorted]
+    ts = [datetime.fromisoformat(t.replace("Z", "")) if isinstance(t, str) else t for t in ts]
+    ts_s = np.fromiter((epoch_seconds(t) for t in ts), dtype=float, count=n)
+    hour = np.fromiter((t.hour for t in ts), dtype=float, count=n)
+    lat = np.fromiter((ev["gps"]["lat"] for ev in events_sorted), dtype=float, count=n)
+    lon = np.fromiter((ev["gps"]["lon"] for ev in events_sorted), dtype=float, count=n)
+    qty = np.fromiter((ev["quantity"] for ev in events_sorted), dtype=float, count=n)
+    uniq_b = np.fromiter((len(set(ev.get("beneficiary_ids", []))) for ev in events_sorted), dtype=float, count=n)
+    devices = [ev["device_id"] for ev in events_sorted]
 
-    for ev in events_sorted:
-        ts = ev["timestamp"]
-        if isinstance(ts, str):
-            ts = datetime.fromisoformat(ts.replace("Z", ""))
-        hour = ts.hour
-        jump = 0.0
-        if ev["device_id"] in dev_last:
-            lat0, lon0 = dev_last[ev["device_id"]]
-            jump = haversine_km(lat0, lon0, ev["gps"]["lat"], ev["gps"]["lon"])
-        dev_last[ev["device_id"]] = (ev["gps"]["lat"], ev["gps"]["lon"])
-        qty = float(ev["quantity"])
-        uniq_b = float(len(set(ev.get("beneficiary_ids", []))))
-        X.append([qty, float(hour), float(jump), uniq_b])
-        meta.append(ev["_id"])
+    jump, _, speed = implied_speeds(devices, ts_s, lat, lon, dev_last)
+    X = np.column_stack([qty, hour, jump, uniq_b, speed])
+    meta = [ev["_id"] for ev in events_sorted]
     return X, meta
@@ -0,0 +1,104 @@
+# app/utils/geohash.py
+"""
+Geohash encoding and radius covers.
+
+A geohash is a base32 string naming a lat/lon cell; every extra character
+splits the cell 32 ways, and cells sharing a prefix are nested. Cell size
+(approx., at the equator):
+    precision 5 ~ 4.9 x 4.9 km   6 ~ 1.2 x 0.61 km   7 ~ 153 x 153 m
+    precision 8 ~  38 x  19 m    9 ~  4.8 x 4.8 m
+"""
+
+import math
+from typing import List, Tuple
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+_DECODE = {c: i for i, c in enumerate(_BASE32)}
+_KM_PER_DEG_LAT = 111.32
+
+
+def encode(lat: float, lon: float, precision: int = 9) -> str:
+    lat_lo, lat_hi, lon_lo, lon_hi = -90.0, 90.0, -180.0, 180.0
+    out = []
+    bit, ch, even = 0, 0, True
+    while len(out) < precision:
+        if even:
+            mid = (lon_lo + lon_hi) / 2
+            if lon >= mid:
+                ch, lon_lo = (ch << 1) | 1, mid
+            else:
+                ch, lon_hi = ch << 1, mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if lat >= mid:
+                ch, lat_lo = (ch << 1) | 1, mid
+            else:
+                ch, lat_hi = ch << 1, mid
+        even = not even
+        bit += 1
+        if bit == 5:
+            out.append(_BASE32[ch])
+            bit, ch = 0, 0
+    return "".join(out)
+
+
+def bbox(cell: str) -> Tuple[float, float, float, float]:
+    """(lat_lo, lat_hi, lon_lo, lon_hi) of a geohash cell."""
+    lat_lo, lat_hi, lon_lo, lon_hi = -90.0, 90.0, -180.0, 180.0
+    even = True
+    for c in cell:
+        v = _DECODE[c]
+        for shift in range(4, -1, -1):
+            b = (v >> shift) & 1
+            if even:
+                mid = (lon_lo + lon_hi) / 2
+                lon_lo, lon_hi = (mid, lon_hi) if b else (lon_lo, mid)
+            else:
+                mid = (lat_lo + lat_hi) / 2
+                lat_lo, lat_hi = (mid, lat_hi) if b else (lat_lo, mid)
+            even = not even
+    return lat_lo, lat_hi, lon_lo, lon_hi
+
+
+def cell_size_deg(precision: int) -> Tuple[float, float]:
+    """(dlat, dlon) of cells at this precision."""
+    lon_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+
+def _steps(lo: float, hi: float, step: float):
+    # stepping by one cell size visits every cell between lo and hi
+    v = lo
+    while v < hi:
+        yield v
+        v += step
+    yield hi
+
+
+def cover(lat: float, lon: float, radius_km: float, precision: int) -> List[str]:
+    """
+    Cells at `precision` intersecting the bounding box of a circle, i.e. a
+    superset of the cells holding points within radius_km of (lat, lon).
+    """
+    dlat_r = radius_km / _KM_PER_DEG_LAT
+    coslat = max(math.cos(math.radians(min(89.0, abs(lat) + dlat_r))), 1e-6)
+    dlon_r = min(180.0, radius_km / (_KM_PER_DEG_LAT * coslat))
+    step_lat, step_lon = cell_size_deg(precision)
+    lat_lo, lat_hi = max(-90.0, lat - dlat_r), min(90.0, lat + dlat_r)
+
+    cells = set()
+    for y in _steps(lat_lo, lat_hi, step_lat):
+        for x in _steps(lon - dlon_r, lon + dlon_r, step_lon):
+            cells.add(encode(y, (x + 180.0) % 360.0 - 180.0, precision))
+    return sorted(cells)
+
+
+def precision_for_radius(radius_km: float, max_cells: int = 64) -> int:
+    """Finest precision whose cover of a radius_km circle stays under ~max_cells."""
+    for p in range(9, 0, -1):
+        dlat, dlon = cell_size_deg(p)
+        side_km = min(dlat, dlon) * _KM_PER_DEG_LAT
+        if (2 * radius_km / side_km + 2) ** 2 <= max_cells:
+            return p
+    return 1
@@ -0,0 +1,187 @@
+# app/utils/ranged_file.py
+"""
+File downloads with HTTP Range, strong ETags and If-None-Match.
+
+    return await file_response(request, path, etag=sha256, filename="x.jpg")
+
+- If-None-Match matching the ETag (or "*") returns 304 without opening the file.
+  Callers that must do work to produce the file (decompress it, compute it)
+  can call not_modified() first with an ETag they know without it.
+- A single "bytes=" range returns 206 with Content-Range. A range that starts
+  past the end returns 416. Multi-range requests and ranges whose If-Range
+  doesn't match the ETag get the whole file (RFC 9110 allows ignoring Range).
+- The body is sent zero-copy (sendfile) when the ASGI server offers the
+  "http.response.zerocopysend" extension. Otherwise it is read with
+  os.pread in CHUNK_SIZE pieces in a worker thread, so memory stays
+  O(chunk) whatever the file size.
+
+The file is opened before the response starts, so a concurrent delete
+(e.g. cache eviction) can't cut a download short.
+"""
+
+import asyncio
+import mimetypes
+import os
+from typing import IO, Optional, Tuple
+from urllib.parse import quote
+
+from fastapi import HTTPException, Request
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+CHUNK_SIZE = 256 * 1024
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Inclusive (start, end) of a single byte range; None to serve the whole file.
+
+    Raises ValueError if the range can't be satisfied.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, sep, last = spec.strip().partition("-")
+    if not sep:
+        return None
+    first, last = first.strip(), last.strip()
+    if not first:
+        # suffix range: the last N bytes
+        if not last.isdigit():
+            return None
+        n = int(last)
+        if n == 0 or size == 0:
+            raise ValueError("unsatisfiable range")
+        return max(0, size - n), size - 1
+    if not first.isdigit() or (last and not last.isdigit()):
+        return None
+    start = int(first)
+    end = int(last) if last else size - 1
+    if last and end < start:
+        return None
+    if start >= size:
+        raise ValueError("unsatisfiable range")
+    return start, min(end, size - 1)
+
+
+def etag_matches(header: str, etag: str) -> bool:
+    """If-None-Match comparison (weak, as RFC 9110 specifies for it)."""
+    for tag in header.split(","):
+        tag = tag.strip()
+        if tag == "*" or tag.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+def content_disposition(filename: str, disposition: str = "inline") -> str:
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"{disposition}; filename*=utf-8''{quoted}"
+    return f'{disposition}; filename="{filename}"'
+
+
+class RangedFileResponse(Response):
+    """Sends bytes [start, end] of an open file, then closes it."""
+
+    def __init__(self, f: IO[bytes], start: int, end: int, status_code: int, headers: dict, media_type: str) -> None:
+        super().__init__(status_code=status_code, headers=headers, media_type=media_type)
+        self.file = f
+        self.start = start
+        self.count = end - start + 1
+        self.headers["content-length"] = str(self.count)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+            if scope.get("method") == "HEAD" or self.count <= 0:
+                await send({"type": "http.response.body", "body": b""})
+            elif "http.response.zerocopysend" in scope.get("extensions", {}):
+                await send(
+                    {
+                        "type": "http.response.zerocopysend",
+                        "file": self.file,
+                        "offset": self.start,
+                        "count": self.count,
+                    }
+                )
+            else:
+                fd = self.file.fileno()
+                pos, remaining = self.start, self.count
+                while remaining > 0:
+                    chunk = await asyncio.to_thread(os.pread, fd, min(CHUNK_SIZE, remaining), pos)
+                    if not chunk:
+                        # file shrank underneath us; nothing sensible left to send
+                        break
+                    pos += len(chunk)
+                    remaining -= len(chunk)
+                    await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+                if remaining > 0:
+                    await send({"type": "http.response.body", "body": b""})
+        finally:
+            self.file.close()
+        if self.background is not None:
+            await self.background()
+
+
+def _validators(etag: str) -> dict:
+    return {
+        "etag": f'"{etag}"',
+        "accept-ranges": "bytes",
+        # always revalidate; unchanged content costs a 304
+        "cache-control": "private, no-cache",
+    }
+
+
+def not_modified(request: Request, etag: str) -> Optional[Response]:
+    """The 304 for a request whose If-None-Match matches `etag`, else None."""
+    headers = _validators(etag)
+    inm = request.headers.get("if-none-match")
+    if inm and etag_matches(inm, headers["etag"]):
+        return Response(status_code=304, headers=headers)
+    return None
+
+
+async def file_response(
+    request: Request,
+    path: str,
+    etag: str,
+    filename: Optional[str] = None,
+    media_type: Optional[str] = None,
+    disposition: str = "inline",
+) -> Response:
+    """Response for a GET / HEAD of `path`; `etag` must change whenever the bytes do."""
+    name = filename or os.path.basename(path)
+    headers = _validators(etag)
+    resp = not_modified(request, etag)
+    if resp is not None:
+        return resp
+
+    try:
+        f = await asyncio.to_thread(open, path, "rb")
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="File not found")
+    size = os.fstat(f.fileno()).st_size
+
+    rng = None
+    header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if header and (if_range is None or if_range.strip() == headers["etag"]):
+        try:
+            rng = parse_range(header, size)
+        except ValueError:
+            f.close()
+            return Response(status_code=416, headers={**headers, "content-range": f"bytes */{size}"})
+
+    headers.update(
+        {
+            "content-disposition": content_disposition(name, disposition),
+            "x-content-type-options": "nosniff",
+            # uploaded HTML / SVG must not run scripts in the dashboard's origin
+            "content-security-policy": "sandbox",
+        }
+    )
+    media_type = media_type or mimetypes.guess_type(name)[0] or "application/octet-stream"
+    if rng is None:
+        return RangedFileResponse(f, 0, size - 1, 200, headers, media_type)
+    start, end = rng
+    headers["content-range"] = f"bytes {start}-{end}/{size}"
+    return RangedFileResponse(f, start, end, 206, headers, media_type)
@@ -0,0 +1,252 @@
+# app/utils/synth.py
+"""
+Synthetic donation events with labelled, injected fraud.
+
+The world (NGOs, donors, devices, beneficiary pools) is drawn once from a
+seed. Events are produced in independent batches: batch b covers its own
+time slice and draws from np.random.default_rng((seed, b)), so any batch can
+be generated in any process and the output is identical for a given seed
+regardless of worker count.
+
+Realism knobs:
+  - NGO volume follows a Zipf-like profile; bigger NGOs hand out more
+    meals per event and have more devices and beneficiaries;
+  - each device random-walks around its NGO's city, so consecutive fixes
+    imply walking / driving speeds;
+  - activity peaks in the afternoon, nothing between 22:00 and 06:00.
+
+Injected fraud (labels map event_id -> kind, None for legit):
+    surge             quantity x5-12
+    impossible_route  device reports from another city minutes later
+    beneficiary_reuse beneficiaries another NGO claimed earlier in the batch
+    shared_device     a device that belongs to a different NGO
+    gps_spoofing      several devices at one exact coordinate within an hour
+
+Intended usage:
+    from app.utils.synth import make_world, generate
+
+    world = make_world(n_ngos=50, n_donors=2000, seed=7)
+    for events, labels in generate(world, n=1_000_000, batch_size=10_000):
+        ...
+"""
+
+from __future__ import annotations
+
+import struct
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from bson import ObjectId
+
+from app.utils.trajectory import epoch_seconds
+
+FRAUD_KINDS = ("surge", "impossible_route", "beneficiary_reuse", "shared_device", "gps_spoofing")
+
+CITIES = np.array(
+    [
+        (28.61, 77.21), (19.08, 72.88), (12.97, 77.59), (13.08, 80.27), (22.57, 88.36),
+        (17.39, 78.49), (18.52, 73.86), (23.02, 72.57), (26.91, 75.79), (26.85, 80.95),
+        (21.15, 79.09), (25.59, 85.14), (30.73, 76.78), (11.02, 76.96), (9.93, 76.27),
+    ]
+)
+_KM_PER_DEG = 111.0
+
+
+def make_world(
+    n_ngos: int = 50,
+    n_donors: int = 2000,
+    seed: int = 7,
+    devices_per_ngo: Tuple[int, int] = (2, 20),
+    beneficiaries_per_ngo: Tuple[int, int] = (200, 20000),
+) -> Dict[str, Any]:
+    """Static entities shared by every batch (small, picklable)."""
+    rng = np.random.default_rng(seed)
+    weight = 1.0 / np.arange(1, n_ngos + 1) ** 0.9
+    weight = rng.permutation(weight / weight.sum())
+    scale = weight / weight.max()
+
+    n_dev = np.maximum(devices_per_ngo[0], (scale * devices_per_ngo[1]).astype(int))
+    n_ben = np.maximum(beneficiaries_per_ngo[0], (scale * beneficiaries_per_ngo[1]).astype(int))
+    city = rng.integers(0, len(CITIES), n_ngos)
+    home = CITIES[city] + rng.normal(0, 0.05, (n_ngos, 2))
+    dev_owner = np.repeat(np.arange(n_ngos), n_dev)
+    dev_home = home[dev_owner] + rng.normal(0, 0.03, (len(dev_owner), 2))
+    # donors give through 1-3 preferred NGOs, big NGOs are preferred more often
+    donor_ngos = [rng.choice(n_ngos, size=int(rng.integers(1, 4)), replace=False, p=weight) for _ in range(n_donors)]
+    ngo_donors: List[List[int]] = [[] for _ in range(n_ngos)]
+    for d, ngos in enumerate(donor_ngos):
+        for g in ngos:
+            ngo_donors[int(g)].append(d)
+    for g in range(n_ngos):
+        if not ngo_donors[g]:
+            ngo_donors[g].append(int(rng.integers(0, n_donors)))
+
+    return {
+        "seed": seed,
+        "n_ngos": n_ngos,
+        "weight": weight,
+        "city": city,
+        "home": home,
+        "qty_mean": 40 + 160 * scale,
+        "n_ben": n_ben,
+        "dev_owner": dev_owner,
+        "dev_home": dev_home,
+        "dev_start": np.concatenate([[0], np.cumsum(n_dev)[:-1]]),
+        "n_dev": n_dev,
+        "ngo_donors": ngo_donors,
+    }
+
+
+def _object_id(ts: datetime, serial: int) -> ObjectId:
+    # deterministic: creation second + a global serial instead of random bytes
+    return ObjectId(struct.pack(">IQ", int(epoch_seconds(ts)), serial))
+
+
+def _day_seconds(days: np.ndarray) -> np.ndarray:
+    """
+    Fractional day counts -> seconds since start. The fraction of each day is
+    warped onto 06:00-22:00 with a sine-shaped density peaking at 14:00; the
+    map is monotonic, so consecutive batches never overlap in time.
+    """
+    whole = np.floor(days)
+    frac = days - whole
+    active = np.arccos(1.0 - 2.0 * frac) / np.pi
+    return whole * 86400.0 + (6.0 + 16.0 * active) * 3600.0
+
+
+def generate_batch(
+    world: Dict[str, Any],
+    batch_index: int,
+    batch_size: int,
+    start: datetime,
+    fraud_rate: float = 0.02,
+    events_per_day: int = 50_000,
+) -> Tuple[List[Dict[str, Any]], Dict[str, Optional[str]]]:
+    """Events (time-ordered) and labels for one batch."""
+    rng = np.random.default_rng((world["seed"], batch_index))
+    n = batch_size
+    first = batch_index * batch_size
+    day0 = first / events_per_day
+    days = day0 + np.sort(rng.random(n)) * (batch_size / events_per_day)
+    ts_s = _day_seconds(days)
+
+    ngo = rng.choice(world["n_ngos"], size=n, p=world["weight"])
+    dev = world["dev_start"][ngo] + (rng.random(n) * world["n_dev"][ngo]).astype(int)
+    # short random walk per device within the batch
+    lat = np.empty(n)
+    lon = np.empty(n)
+    pos: Dict[int, np.ndarray] = {}
+    steps = rng.normal(0, 0.5 / _KM_PER_DEG, (n, 2))
+    for i, d in enumerate(dev):
+        p = pos.get(d)
+        p = world["dev_home"][d] + rng.normal(0, 0.01, 2) if p is None else p + steps[i]
+        # stay within ~5 km of the device's base
+        p = world["dev_home"][d] + np.clip(p - world["dev_home"][d], -0.05, 0.05)
+        pos[d] = p
+        lat[i], lon[i] = p
+    qty = np.maximum(1, rng.lognormal(np.log(world["qty_mean"][ngo]), 0.35)).astype(int)
+    n_b = rng.integers(1, 6, n)
+
+    kind = np.full(n, -1)
+    is_fraud = rng.random(n) < fraud_rate
+    kind[is_fraud] = rng.integers(0, len(FRAUD_KINDS), int(is_fraud.sum()))
+
+    # gps spoofing: one exact coordinate, several devices, within one hour
+    spoof = np.flatnonzero(kind == FRAUD_KINDS.index("gps_spoofing"))
+    if len(spoof):
+        spoof_pt = np.round(world["home"][int(ngo[spoof[0]])] + rng.normal(0, 0.01, 2), 6)
+        ts_s[spoof] = np.clip(ts_s[spoof[0]] + rng.uniform(0, 3600, len(spoof)), ts_s[0], ts_s[-1])
+        lat[spoof], lon[spoof] = spoof_pt
+    order = np.argsort(ts_s, kind="stable")
+
+    t_start = datetime(start.year, start.month, start.day)
+    events: List[Dict[str, Any]] = []
+    labels: Dict[str, Optional[str]] = {}
+    last_fix: Dict[int, Tuple[float, float]] = {}
+    recent_bens: List[Tuple[int, List[str]]] = []
+    for j, i in enumerate(order):
+        g = int(ngo[i])
+        d = int(dev[i])
+        k = FRAUD_KINDS[kind[i]] if kind[i] >= 0 else None
+        la, lo_ = float(lat[i]), float(lon[i])
+        q = int(qty[i])
+        bens = [f"ben-{g}-{b}" for b in rng.integers(0, world["n_ben"][g], n_b[i])]
+
+        if k == "surge":
+            q = int(q * rng.uniform(5, 12))
+        elif k == "impossible_route":
+            if d in last_fix:
+                far = (world["city"][g] + int(rng.integers(1, len(CITIES)))) % len(CITIES)
+                la, lo_ = (float(v) for v in CITIES[far] + rng.normal(0, 0.02, 2))
+            else:
+                k = None
+        elif k == "beneficiary_reuse":
+            others = [b for (og, b) in recent_bens[-500:] if og != g]
+            if others:
+                bens = list(others[int(rng.integers(0, len(others)))])
+            else:
+                k = None
+        elif k == "shared_device":
+            other = (g + int(rng.integers(1, world["n_ngos"]))) % world["n_ngos"]
+            d = int(world["dev_start"][other] + rng.integers(0, world["n_dev"][other]))
+            la, lo_ = last_fix.get(d, tuple(float(v) for v in world["dev_home"][d]))
+
+        ts = t_start + timedelta(seconds=float(ts_s[i]))
+        eid = _object_id(ts, first + j)
+        donors = world["ngo_donors"][g]
+        events.append(
+            {
+                "_id": eid,
+                "donor_id": f"donor-{donors[int(rng.integers(0, len(donors)))]}",
+                "ngo_id": f"ngo-{g}",
+                "quantity": q,
+                "unit": "meals",
+                "gps": {"lat": la, "lon": lo_},
+                "timestamp": ts,
+                "device_id": f"dev-{d}",
+                "ip": f"10.{g % 256}.{d % 256}.{int(rng.integers(1, 255))}",
+                "beneficiary_ids": bens,
+                "status": "pending",
+            }
+        )
+        labels[str(eid)] = k
+        last_fix[d] = (la, lo_)
+        recent_bens.append((g, bens))
+    return events, labels
+
+
+def _batch_job(args: tuple) -> Tuple[List[Dict[str, Any]], Dict[str, Optional[str]]]:
+    return generate_batch(*args)
+
+
+def generate(
+    world: Dict[str, Any],
+    n: int,
+    batch_size: int = 10_000,
+    start: Optional[datetime] = None,
+    fraud_rate: float = 0.02,
+    events_per_day: int = 50_000,
+    workers: int = 1,
+) -> Iterator[Tuple[List[Dict[str, Any]], Dict[str, Optional[str]]]]:
+    """Yield (events, labels) batches, in time order, totalling n events."""
+    start = start or datetime(2025, 1, 1)
+    sizes = [min(batch_size, n - b * batch_size) for b in range((n + batch_size - 1) // batch_size)]
+    jobs = [(world, b, batch_size, start, fraud_rate, events_per_day) for b in range(len(sizes))]
+    if workers <= 1:
+        for (w, b, _, s, f, e), size in zip(jobs, sizes):
+            events, labels = generate_batch(w, b, batch_size, s, f, e)
+            yield _trim(events, labels, size)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        for (events, labels), size in zip(ex.map(_batch_job, jobs), sizes):
+            yield _trim(events, labels, size)
+
+
+def _trim(events: List[Dict[str, Any]], labels: Dict[str, Optional[str]], size: int) -> tuple:
+    # the last batch is generated full-size (same time slice) and cut to length
+    if len(events) <= size:
+        return events, labels
+    events = events[:size]
+    return events, {str(ev["_id"]): labels[str(ev["_id"])] for ev in events}
@@ -0,0 +1,22 @@
+# app/utils/throttle.py
+import threading
+import time
+
+
+class Throttle:
+    """Byte-rate limit shared by worker threads (0 = unlimited); take() sleeps as needed."""
+
+    def __init__(self, bytes_per_s: float) -> None:
+        self.rate = bytes_per_s
+        self._lock = threading.Lock()
+        self._next = time.monotonic()
+
+    def take(self, n: int) -> None:
+        if self.rate <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(self._next, now)
+            self._next = start + n / self.rate
+        if start > now:
+            time.sleep(start - now)
@@ -0,0 +1,109 @@
+# app/utils/trajectory.py
+"""
+Per-device trajectories: distance, elapsed time and implied speed between
+each event and the same device's previous fix, vectorised over a batch.
+
+The carry-over dict maps device_id -> (epoch_seconds, lat, lon) of the last
+fix seen, so time-ordered chunks give the same result as one pass. Seed it
+from Mongo with app.services.trajectory_service.previous_fixes().
+"""
+
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.utils.geo import haversine_km_np
+
+# Feature value for "moved with zero elapsed time"; keeps model inputs finite.
+SPEED_CAP_KMH = 20000.0
+
+
+_EPOCH = datetime(1970, 1, 1)
+_EPOCH_UTC = _EPOCH.replace(tzinfo=timezone.utc)
+
+
+def epoch_seconds(ts: Any) -> float:
+    """datetime / ISO string -> UTC epoch seconds (naive values are UTC, as Mongo returns them)."""
+    if isinstance(ts, str):
+        ts = datetime.fromisoformat(ts.replace("Z", "+00:00"))
+    if ts.tzinfo is None:
+        return (ts - _EPOCH).total_seconds()
+    return (ts - _EPOCH_UTC).total_seconds()
+
+
+def implied_speeds(
+    device_ids: Sequence[str],
+    ts_s: np.ndarray,
+    lat: np.ndarray,
+    lon: np.ndarray,
+    carry: Optional[Dict[str, Tuple[float, float, float]]] = None,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Jump (km), elapsed time (s) and implied speed (km/h) per row, in input order.
+
+    Rows are grouped by device and ordered by time internally; the first row of
+    a device uses `carry` (if present) as its previous fix, otherwise all three
+    values are 0. `carry` is updated in place with each device's last fix.
+    """
+    n = len(ts_s)
+    jump = np.zeros(n, dtype=float)
+    dt = np.zeros(n, dtype=float)
+    if n == 0:
+        return jump, dt, np.zeros(0, dtype=float)
+
+    dev_codes, dev_uniq = _codes(device_ids)
+    order = np.lexsort((ts_s, dev_codes))
+    d, t, la, lo = dev_codes[order], ts_s[order], lat[order], lon[order]
+
+    first = np.ones(n, dtype=bool)
+    first[1:] = d[1:] != d[:-1]
+
+    # previous fix per row: the row before it, or the carry-over for a device's first row
+    prev_t = np.empty(n)
+    prev_la = np.empty(n)
+    prev_lo = np.empty(n)
+    prev_t[1:], prev_la[1:], prev_lo[1:] = t[:-1], la[:-1], lo[:-1]
+    has_prev = ~first
+    if carry:
+        for i in np.flatnonzero(first):
+            fix = carry.get(dev_uniq[d[i]])
+            if fix is not None:
+                prev_t[i], prev_la[i], prev_lo[i] = fix
+                has_prev[i] = True
+
+    idx = np.flatnonzero(has_prev)
+    j = haversine_km_np(prev_la[idx], prev_lo[idx], la[idx], lo[idx])
+    e = np.maximum(t[idx] - prev_t[idx], 0.0)
+    jump_sorted = np.zeros(n)
+    dt_sorted = np.zeros(n)
+    jump_sorted[idx], dt_sorted[idx] = j, e
+    jump[order], dt[order] = jump_sorted, dt_sorted
+
+    if carry is not None:
+        last = np.ones(n, dtype=bool)
+        last[:-1] = d[:-1] != d[1:]
+        for i in np.flatnonzero(last):
+            carry[dev_uniq[d[i]]] = (float(t[i]), float(la[i]), float(lo[i]))
+
+    return jump, dt, speed_kmh(jump, dt)
+
+
+def speed_kmh(jump_km: np.ndarray, dt_s: np.ndarray) -> np.ndarray:
+    """km / h, with moves in zero time mapped to SPEED_CAP_KMH."""
+    jump_km = np.asarray(jump_km, dtype=float)
+    dt_s = np.asarray(dt_s, dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        v = np.where(dt_s > 0, jump_km / (dt_s / 3600.0), np.where(jump_km > 0, SPEED_CAP_KMH, 0.0))
+    return np.minimum(v, SPEED_CAP_KMH)
+
+
+def _codes(values: Sequence[Any]) -> Tuple[np.ndarray, list]:
+    if isinstance(values, np.ndarray) and values.dtype.kind in "iu":
+        # already integer-coded (columnar snapshot): codes are their own keys
+        codes = values.astype(np.int64)
+        return codes, list(range(int(codes.max()) + 1 if len(codes) else 0))
+    # dict factorisation: much cheaper than np.unique on Python strings
+    lookup: Dict[Any, int] = {}
+    codes = np.fromiter((lookup.setdefault(v, len(lookup)) for v in values), dtype=np.int64, count=len(values))
+    return codes, list(lookup)
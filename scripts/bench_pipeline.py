@@ -0,0 +1,204 @@
+# scripts/bench_pipeline.py
+"""
+Speed, memory and accuracy benchmark of the anomaly pipeline, offline.
+
+    python -m scripts.bench_pipeline --sizes 10000,100000,1000000 --out bench.json
+    python -m scripts.bench_pipeline --sizes 10000,100000 --compare bench.json
+
+For each size, on synthetic events with labelled fraud (app/utils/synth.py):
+  - stages: build_features, fit (IsolationForest), score, reasons
+    (beneficiary reuse + alerts_from_scores), each timed on its own;
+  - peak traced memory per stage (tracemalloc, separate pass so tracing
+    doesn't skew the timings; --no-memory skips it);
+  - precision / recall of the emitted alerts, per-kind recall and ROC-AUC
+    of the raw scores.
+
+Results are JSON, tagged with the git commit and library versions.
+--compare prints per-stage time ratios and accuracy deltas against an
+earlier run and exits 1 if any stage is slower than --max-slowdown.
+"""
+
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import sklearn
+from sklearn.metrics import roc_auc_score
+
+from app.ml.anomaly import alerts_from_scores, anomaly_scores, threshold_by_percentile, train_iforest
+from app.ml.reuse import reuse_reasons_for_events
+from app.utils.features import build_features
+from app.utils.synth import FRAUD_KINDS, generate, make_world
+
+STAGES = ("build_features", "fit", "score", "reasons")
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+def _run_stages(events: list, fit_sample: int) -> dict:
+    """Run the pipeline once; returns per-stage callables' outputs and a runner."""
+    state: dict = {}
+
+    def build():
+        state["X"], state["meta"] = build_features(events)
+
+    def fit():
+        X = state["X"]
+        # fit on a fixed-size sample, as window analysis does
+        idx = np.random.default_rng(0).choice(len(X), size=min(fit_sample, len(X)), replace=False)
+        state["model"] = train_iforest(X[idx])
+
+    def score():
+        state["scores"] = anomaly_scores(state["model"], state["X"])
+
+    def reasons():
+        s = state["scores"]
+        extra = reuse_reasons_for_events(events)
+        state["alerts"] = alerts_from_scores(
+            state["meta"], state["X"], s, threshold_by_percentile(s, 97.0), threshold_by_percentile(s, 99.0),
+            extra_reasons=extra,
+        )
+
+    return state, dict(zip(STAGES, (build, fit, score, reasons)))
+
+
+def _timed(events: list, fit_sample: int) -> tuple:
+    state, stages = _run_stages(events, fit_sample)
+    out = {}
+    for name, fn in stages.items():
+        t = time.perf_counter()
+        fn()
+        out[name] = time.perf_counter() - t
+    return state, out
+
+
+def _traced(events: list, fit_sample: int) -> dict:
+    _, stages = _run_stages(events, fit_sample)
+    out = {}
+    tracemalloc.start()
+    for name, fn in stages.items():
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        fn()
+        out[name] = (tracemalloc.get_traced_memory()[1] - base) / 2**20
+    tracemalloc.stop()
+    return out
+
+
+def _accuracy(state: dict, labels: dict) -> dict:
+    kinds = [labels[str(m)] for m in state["meta"]]
+    y = np.array([k is not None for k in kinds])
+    flagged = {str(a["event_id"]) for a in state["alerts"]}
+    hit = np.array([str(m) in flagged for m in state["meta"]])
+    tp = int((hit & y).sum())
+    out = {
+        "alerts": int(hit.sum()),
+        "fraud": int(y.sum()),
+        "precision": tp / max(1, int(hit.sum())),
+        "recall": tp / max(1, int(y.sum())),
+        "roc_auc": float(roc_auc_score(y, state["scores"])) if 0 < y.sum() < len(y) else None,
+        "recall_by_kind": {},
+    }
+    for kind in FRAUD_KINDS:
+        mask = np.array([k == kind for k in kinds])
+        if mask.any():
+            out["recall_by_kind"][kind] = float(hit[mask].mean())
+    return out
+
+
+def _compare(new: dict, old: dict, max_slowdown: float) -> bool:
+    ok = True
+    old_by_size = {r["events"]: r for r in old.get("results", [])}
+    for r in new["results"]:
+        prev = old_by_size.get(r["events"])
+        if prev is None:
+            continue
+        for stage in STAGES:
+            a, b = prev["seconds"].get(stage), r["seconds"].get(stage)
+            if not a or b is None:
+                continue
+            ratio = b / a
+            flag = "SLOWER" if ratio > max_slowdown else ""
+            ok &= ratio <= max_slowdown
+            print(f"{r['events']:>9} {stage:<15} {a:9.3f}s -> {b:9.3f}s  x{ratio:5.2f} {flag}", file=sys.stderr)
+        for metric in ("precision", "recall", "roc_auc"):
+            a, b = prev["accuracy"].get(metric), r["accuracy"].get(metric)
+            if a is not None and b is not None:
+                print(f"{r['events']:>9} {metric:<15} {a:9.4f}  -> {b:9.4f}   {b - a:+.4f}", file=sys.stderr)
+    return ok
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", default="10000,100000,1000000")
+    ap.add_argument("--fraud-rate", type=float, default=0.02)
+    ap.add_argument("--fit-sample", type=int, default=50000)
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--no-memory", action="store_true")
+    ap.add_argument("--out", default="", help="write JSON here instead of stdout")
+    ap.add_argument("--compare", default="", help="earlier JSON result to compare against")
+    ap.add_argument("--max-slowdown", type=float, default=1.25)
+    args = ap.parse_args()
+
+    sizes = sorted(int(s) for s in args.sizes.split(",") if s)
+    world = make_world(seed=args.seed)
+    # batches are deterministic, so each size is a prefix of the largest run
+    events, labels = [], {}
+    for batch, batch_labels in generate(world, sizes[-1], fraud_rate=args.fraud_rate):
+        events.extend(batch)
+        labels.update(batch_labels)
+
+    results = []
+    for n in sizes:
+        subset = events[:n]
+        state, seconds = _timed(subset, args.fit_sample)
+        row = {
+            "events": n,
+            "seconds": seconds,
+            "events_per_s": {k: n / v for k, v in seconds.items() if v > 0},
+            "accuracy": _accuracy(state, labels),
+        }
+        del state
+        if not args.no_memory:
+            row["peak_mib"] = _traced(subset, args.fit_sample)
+        results.append(row)
+        print(f"[bench] {n} events: {sum(seconds.values()):.2f}s", file=sys.stderr)
+
+    report = {
+        "commit": _git_commit(),
+        "created_at": datetime.utcnow().isoformat() + "Z",
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "sklearn": sklearn.__version__,
+        "params": {"fraud_rate": args.fraud_rate, "fit_sample": args.fit_sample, "seed": args.seed},
+        "results": results,
+    }
+    out = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(out + "\n")
+    else:
+        print(out)
+
+    if args.compare:
+        with open(args.compare) as f:
+            old = json.load(f)
+        if not _compare(report, old, args.max_slowdown):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+# scripts/generate_events.py
+"""
+Generate synthetic events with labelled fraud (see app/utils/synth.py) and
+bulk-load them into Mongo and/or a JSONL file.
+
+    python -m scripts.generate_events --events 1000000 --workers 4 --concurrency 8
+    python -m scripts.generate_events --events 200000 --jsonl events.jsonl --no-mongo
+
+Mongo: events get loc/geohash like API ingestion, beneficiary claims are
+written to `beneficiary_claims`, labels to `synth_labels` ({_id: event_id,
+kind}). Batches are inserted with unordered insert_many, up to
+--concurrency at a time.
+JSONL: one event per line, _id and timestamp as strings, plus "label".
+The same --seed always produces the same events.
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from app.config import settings
+from app.services.geo_service import geo_fields
+from app.services.reuse_service import claim_docs
+from app.utils.synth import generate, make_world
+
+
+def _jsonl_line(ev: dict, label) -> str:
+    doc = dict(ev, _id=str(ev["_id"]), timestamp=ev["timestamp"].isoformat() + "Z", label=label)
+    return json.dumps(doc, separators=(",", ":"))
+
+
+async def _insert(db, events, labels) -> None:
+    for ev in events:
+        ev.update(geo_fields(ev["gps"]))
+    await db.events.insert_many(events, ordered=False)
+    claims = claim_docs(events)
+    if claims:
+        await db.beneficiary_claims.insert_many(claims, ordered=False)
+    await db.synth_labels.insert_many(
+        [{"_id": eid, "kind": kind} for eid, kind in labels.items()], ordered=False
+    )
+
+
+async def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--events", type=int, default=100000)
+    ap.add_argument("--batch-size", type=int, default=10000)
+    ap.add_argument("--ngos", type=int, default=50)
+    ap.add_argument("--donors", type=int, default=2000)
+    ap.add_argument("--fraud-rate", type=float, default=0.02)
+    ap.add_argument("--events-per-day", type=int, default=50000)
+    ap.add_argument("--start", type=datetime.fromisoformat, default=datetime(2025, 1, 1))
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--workers", type=int, default=1, help="generator processes")
+    ap.add_argument("--concurrency", type=int, default=4, help="insert_many calls in flight")
+    ap.add_argument("--jsonl", default="", help="also write events to this JSONL file")
+    ap.add_argument("--no-mongo", action="store_true")
+    ap.add_argument("--drop", action="store_true", help="drop events/claims/labels first")
+    args = ap.parse_args()
+
+    db = None
+    if not args.no_mongo:
+        db = AsyncIOMotorClient(settings.MONGO_URI)[settings.MONGO_DB]
+        if args.drop:
+            for name in ("events", "beneficiary_claims", "synth_labels"):
+                await db[name].drop()
+    out = open(args.jsonl, "w", encoding="utf-8") if args.jsonl else None
+
+    world = make_world(n_ngos=args.ngos, n_donors=args.donors, seed=args.seed)
+    pending: set = set()
+    written, fraud = 0, 0
+    t0 = time.perf_counter()
+    batches = generate(
+        world,
+        args.events,
+        batch_size=args.batch_size,
+        start=args.start,
+        fraud_rate=args.fraud_rate,
+        events_per_day=args.events_per_day,
+        workers=args.workers,
+    )
+    try:
+        while True:
+            # generate off the event loop so in-flight inserts keep progressing
+            batch = await asyncio.to_thread(next, batches, None)
+            if batch is None:
+                break
+            events, labels = batch
+            if out is not None:
+                out.writelines(_jsonl_line(ev, labels[str(ev["_id"])]) + "\n" for ev in events)
+            if db is not None:
+                if len(pending) >= max(1, args.concurrency):
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for t in done:
+                        t.result()  # surface insert errors
+                pending.add(asyncio.create_task(_insert(db, events, labels)))
+            written += len(events)
+            fraud += sum(1 for k in labels.values() if k)
+            print(f"[generate] {written}/{args.events} events ({written / (time.perf_counter() - t0):.0f}/s)")
+        if pending:
+            await asyncio.gather(*pending)
+    finally:
+        if out is not None:
+            out.close()
+
+    dt = time.perf_counter() - t0
+    print(json.dumps({"events": written, "fraud": fraud, "seconds": dt, "events_per_s": written / dt}))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,92 @@
+# scripts/migrate_evidence_cas.py
+"""
+Move evidence stored in the old flat layout (storage/{event_id}_{filename})
+into the content-addressable blob store.
+
+    python -m scripts.migrate_evidence_cas            # migrate
+    python -m scripts.migrate_evidence_cas --dry-run  # only count
+
+For each evidence document whose path is outside storage/blobs: the file
+is hashed (and checked against the stored sha256), moved to its blob path
+(or deleted if that blob exists already), referenced in `blobs`, and the
+document's path updated. Safe to re-run; documents already migrated are
+skipped.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from app.config import settings
+from app.services import blob_service
+
+
+def _sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _filename(path: str, event_id) -> str:
+    # old names were "{event_id}_{filename}"; blob paths drop the name, so keep it on the document
+    name = os.path.basename(path)
+    prefix = f"{event_id}_"
+    return name[len(prefix):] if name.startswith(prefix) else name
+
+
+async def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--dry-run", action="store_true")
+    args = ap.parse_args()
+
+    db = AsyncIOMotorClient(settings.MONGO_URI)[settings.MONGO_DB]
+    prefix = blob_service.BLOB_DIR + os.sep
+    stats = {"migrated": 0, "deduplicated": 0, "missing": 0, "hash_mismatch": 0, "bytes_freed": 0}
+    async for d in db.evidence.find({}, {"path": 1, "sha256": 1, "event_id": 1, "filename": 1}):
+        path = os.path.abspath(d.get("path") or "")
+        if path.startswith(prefix):
+            continue
+        fields = {} if d.get("filename") else {"filename": _filename(path, d.get("event_id"))}
+
+        if not os.path.exists(path):
+            # a document sharing this old path may have been migrated already
+            sha = d.get("sha256")
+            if not sha or not os.path.exists(blob_service.blob_path(sha)):
+                stats["missing"] += 1
+                continue
+            if not args.dry_run:
+                await db.blobs.update_one({"_id": sha}, {"$inc": {"refcount": 1}, "$unset": {"released_at": ""}})
+                fields["path"] = blob_service.blob_path(sha)
+                await db.evidence.update_one({"_id": d["_id"]}, {"$set": fields})
+            stats["migrated"] += 1
+            stats["deduplicated"] += 1
+            continue
+
+        sha = await asyncio.to_thread(_sha256, path)
+        if d.get("sha256") and d["sha256"] != sha:
+            # keep tampered / corrupted files where they are for investigation
+            stats["hash_mismatch"] += 1
+            print(f"[migrate] sha256 mismatch, left in place: {path}")
+            continue
+        stats["migrated"] += 1
+        if args.dry_run:
+            continue
+        size = os.path.getsize(path)
+        # store() moves the file (or drops it when the blob exists)
+        stored = await blob_service.store(db, path, sha, size)
+        fields.update({"path": stored["path"], "sha256": sha, "size": size})
+        await db.evidence.update_one({"_id": d["_id"]}, {"$set": fields})
+        if stored["deduplicated"]:
+            stats["deduplicated"] += 1
+            stats["bytes_freed"] += size
+    print(json.dumps(stats))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())